@@ -0,0 +1,74 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from tp_tokens.ffn import BengioFFN
+
+
+@pytest.fixture
+def small_model():
+    "Fabrique de petits BengioFFN avec des statistiques BatchNorm non triviales."
+
+    def make(seed=0, nb_tokens=20, context_size=3):
+        g = torch.Generator().manual_seed(seed)
+        nn = BengioFFN(8, 16, context_size, nb_tokens, g)
+        nn.bnmean_running.normal_(generator=g)
+        nn.bnstd_running.uniform_(0.5, 2.0, generator=g)
+        return nn
+
+    return make
+
+
+@pytest.fixture
+def tiny_datasets():
+    """
+    Fabrique de petits jeux de données aléatoires. Avec learnable, la cible est
+    le premier token du contexte et les splits dev/test (les 64 dernières
+    lignes) sont disjoints du train ; sinon dev et test reprennent les 64
+    premières lignes du train.
+    """
+
+    def make(seed=5, n=256, nb_tokens=20, context_size=3, learnable=False):
+        g = torch.Generator().manual_seed(seed)
+        X = torch.randint(0, nb_tokens, (n, context_size), generator=g, dtype=torch.int64)
+        if learnable:
+            Y = X[:, 0].clone()
+            train, dev = slice(None, n - 64), slice(n - 64, None)
+        else:
+            Y = torch.randint(0, nb_tokens, (n,), generator=g, dtype=torch.int64)
+            train, dev = slice(None), slice(None, 64)
+        return SimpleNamespace(
+            Xtr=X[train], Ytr=Y[train], Xdev=X[dev], Ydev=Y[dev], Xte=X[dev], Yte=Y[dev]
+        )
+
+    return make
+
+
+@pytest.fixture
+def within():
+    """
+    Exécute fn() dans un thread et renvoie son résultat (ou relance son
+    exception) ; échoue si fn ne termine pas en timeout secondes, au lieu de
+    bloquer la suite de tests.
+    """
+
+    def run(fn, timeout=30.0):
+        outcome = {}
+
+        def target():
+            try:
+                outcome["result"] = fn()
+            except BaseException as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        assert not thread.is_alive(), "blocked"
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    return run
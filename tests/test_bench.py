@@ -0,0 +1,19 @@
+from tp_tokens.bench import compare
+
+
+def report(**values):
+    return {"results": {k: {"value": v, "unit": "x/s"} for k, v in values.items()}}
+
+
+def test_compare_flags_regressions_above_threshold():
+    baseline = report(train=100.0, generate=50.0, removed=1.0)
+    current = report(train=95.0, generate=40.0)
+    regressions = compare(current, baseline, threshold=0.1)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("generate")
+
+
+def test_compare_lower_is_better():
+    baseline = {"results": {"latency": {"value": 10.0, "unit": "ms", "higher_is_better": False}}}
+    current = {"results": {"latency": {"value": 12.0, "unit": "ms"}}}
+    assert compare(current, baseline, threshold=0.1)
@@ -1,3 +1,4 @@
+from tp_tokens import clean
 from tp_tokens.clean import clean_civil_code
 
 
@@ -80,3 +81,37 @@ def test_no_html_tags():
 
     expected = []
     assert result == expected
+
+
+def test_scrap_sentences_directory_and_zip(tmp_path):
+    import os
+    import zipfile
+
+    from tp_tokens.clean import scrap_sentences
+
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for i in range(5):
+        (corpus / f"code_{i}.md").write_text(
+            f"# Code {i}\n**Art. L{i}**\nLe code numéro {i} est applicable. Ok.\n"
+            f"— La seconde phrase du code {i} aussi.\n"
+        )
+    # archive dans l'ordre inverse : la sortie doit suivre l'ordre des noms
+    archive = tmp_path / "codes.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        for file in sorted(os.listdir(corpus), reverse=True):
+            z.write(corpus / file, f"codes/{file}")
+
+    outputs = []
+    runs = [(f"{corpus}/", 1), (f"{corpus}/", 2), (str(archive), 1), (str(archive), 2)]
+    for path, workers in runs:
+        save_to = tmp_path / f"out_{len(outputs)}.txt"
+        scrap_sentences(path, str(save_to), workers)
+        outputs.append(save_to.read_text())
+        assert clean._archive is None  # archive fermée en fin de lecture
+
+    expected = []
+    for file in sorted(os.listdir(corpus)):
+        expected += clean_civil_code((corpus / file).read_text())
+    assert outputs[0] == "".join(s + "\n" for s in expected)
+    assert outputs[0] == outputs[1] == outputs[2] == outputs[3]
@@ -0,0 +1,52 @@
+import torch
+import torch.nn.functional as F
+
+from tp_tokens.compact import CompactDatasets, CompactSplit
+from tp_tokens.ffn import BengioFFN
+
+
+class Rows:
+    "Splits répétitifs : peu de contextes distincts, cibles variées."
+
+    context_size, nb_tokens, pad_id, eos_id = 3, 20, 0, 2
+
+    def __init__(self, g):
+        for X_name, Y_name, n in (("Xtr", "Ytr", 300), ("Xdev", "Ydev", 80), ("Xte", "Yte", 40)):
+            contexts = torch.randint(0, 20, (6, 3), generator=g, dtype=torch.int16)
+            setattr(self, X_name, contexts[torch.randint(0, 6, (n,), generator=g)])
+            setattr(self, Y_name, torch.randint(0, 5, (n,), generator=g, dtype=torch.int16))
+
+
+def test_compact_split_round_trip():
+    data = Rows(torch.Generator().manual_seed(1))
+    split = CompactSplit(data.Xtr, data.Ytr, 20)
+    assert len(split) <= 6 and split.nb_samples == 300
+    assert int(split.counts.sum()) == 300
+    rows, positions = split.pairs(torch.arange(len(split)))
+    expanded = split.contexts[rows].repeat_interleave(split.counts[positions].long(), 0)
+    targets = split.targets[positions].repeat_interleave(split.counts[positions].long())
+    original = sorted(zip(map(tuple, data.Xtr.tolist()), data.Ytr.tolist()))
+    assert sorted(zip(map(tuple, expanded.tolist()), targets.tolist())) == original
+
+
+def test_compact_loss_is_exact_and_trains(small_model):
+    nn = small_model()
+    data = Rows(torch.Generator().manual_seed(1))
+    compact = CompactDatasets(data)
+    assert abs(nn.compute_loss(compact.dev) - nn.compute_loss(data.Xdev, data.Ydev)) < 1e-5
+    assert nn.evaluate(compact, ("test",))["test"]["accuracy"] == nn.evaluate(data, ("test",))["test"]["accuracy"]
+
+    # perte pondérée sur tous les contextes = moyenne des entropies croisées
+    split = compact.train
+    logits = torch.randn(len(split), 20, generator=torch.Generator().manual_seed(2))
+    soft = BengioFFN._soft_cross_entropy(logits, split.soft_targets(torch.arange(len(split))))
+    rows, positions = split.pairs(torch.arange(len(split)))
+    per_context = torch.zeros(len(split)).index_add_(
+        0, rows, -split.counts[positions] * F.log_softmax(logits, 1)[rows, split.targets[positions].long()]
+    ) / split.context_counts
+    assert torch.allclose(soft, per_context.mean())
+
+    nn.bnstd_running.zero_()  # statistiques courantes apprises pendant l'entraînement
+    lossi = nn.train(compact, 200, 16, log_every=None)
+    assert len(lossi) == 200
+    assert sum(lossi[-20:]) < sum(lossi[:20])
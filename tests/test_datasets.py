@@ -0,0 +1,37 @@
+import torch
+
+from tp_tokens.datasets import build_dataset, smallest_int_dtype
+
+
+def reference_build_dataset(sentences, context_size, pad_id, eos_id):
+    X, Y = [], []
+    for sentence_ids in sentences:
+        context = [pad_id] * context_size
+        for id in sentence_ids + [eos_id]:
+            X.append(context)
+            Y.append(id)
+            context = context[1:] + [id]
+    return torch.tensor(X), torch.tensor(Y)
+
+
+def test_build_dataset_matches_reference():
+    sentences = [[5, 6, 7], [], [8], [9, 10, 11, 12, 13, 14, 15]]
+    for context_size in (1, 3, 5):
+        X, Y = build_dataset(sentences, context_size, 0, 2, torch.int16)
+        Xref, Yref = reference_build_dataset(sentences, context_size, 0, 2)
+        assert X.dtype == torch.int16
+        assert torch.equal(X.long(), Xref)
+        assert torch.equal(Y.long(), Yref)
+
+
+def test_build_dataset_empty():
+    X, Y = build_dataset([], 3, 0, 2)
+    assert X.shape == (0, 3)
+    assert Y.shape == (0,)
+
+
+def test_smallest_int_dtype():
+    assert smallest_int_dtype(100) == torch.int8
+    assert smallest_int_dtype(30000) == torch.int16
+    assert smallest_int_dtype(32768) == torch.int16
+    assert smallest_int_dtype(32769) == torch.int32
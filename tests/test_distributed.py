@@ -0,0 +1,82 @@
+import os
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from tp_tokens.distributed import AllReduceOptimizer, SyncBatchNormFFN, _free_port
+from tp_tokens.ffn import BengioFFN
+from tp_tokens.optim import make_optimizer
+
+
+def batch():
+    g = torch.Generator().manual_seed(1)
+    return torch.randint(0, 20, (32, 3), generator=g), torch.randint(0, 20, (32,), generator=g)
+
+
+def _step(rank, world_size, port, result):
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+    torch.set_num_threads(1)
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    try:
+        nn = SyncBatchNormFFN(8, 16, 3, 20, torch.Generator().manual_seed(0))
+        # petits paquets pour exercer le découpage en plusieurs réductions
+        optimizer = AllReduceOptimizer(make_optimizer("sgd", nn.parameters), bucket_size=512)
+        X, Y = batch()
+        nn.forward(X[rank::world_size], Y[rank::world_size])
+        nn.backward()
+        optimizer.step(0.1)
+        if rank == 0:
+            torch.save(nn.state_dict(), result)
+    finally:
+        dist.destroy_process_group()
+
+
+def test_two_workers_match_single_process(tmp_path):
+    result = str(tmp_path / "result.pt")
+    mp.spawn(_step, args=(2, _free_port(), result), nprocs=2)
+    distributed = torch.load(result, weights_only=True)
+
+    nn = BengioFFN(8, 16, 3, 20, torch.Generator().manual_seed(0))
+    optimizer = make_optimizer("sgd", nn.parameters)
+    X, Y = batch()
+    nn.forward(X, Y)
+    nn.backward()
+    optimizer.step(0.1)
+
+    for name, value in nn.state_dict().items():
+        if isinstance(value, torch.Tensor):
+            assert torch.allclose(distributed[name], value, atol=1e-6), name
+
+
+class TinyDatasets:
+    "Jeu d'entraînement minimal, sérialisable pour les processus du pool."
+
+    context_size = 3
+
+    def __init__(self):
+        g = torch.Generator().manual_seed(5)
+        self.Xtr = torch.randint(0, 20, (256, 3), generator=g)
+        self.Ytr = torch.randint(0, 20, (256,), generator=g)
+
+    def target_counts(self):
+        return torch.bincount(self.Ytr, minlength=20)
+
+
+def test_distributed_resume_with_sampled_softmax(tmp_path):
+    from tp_tokens.distributed import train_distributed
+
+    def run(max_steps, checkpoint=None, resume=False):
+        return train_distributed(
+            2, TinyDatasets(), 20, 8, 16, 0, max_steps, 16, sampled=4,
+            checkpoint=checkpoint, resume=resume,
+        )
+
+    continuous = run(6)
+    path = str(tmp_path / "ck.pt")
+    run(3, path)
+    resumed = run(6, path, resume=True)
+    assert resumed.steps == 6
+    for name in BengioFFN.state_names:
+        assert torch.equal(getattr(resumed, name), getattr(continuous, name)), name
@@ -0,0 +1,201 @@
+import json
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from tp_tokens.checkpoint import load_checkpoint, save_checkpoint
+from tp_tokens.evaluation import evaluate_tensors
+from tp_tokens.ffn import BengioFFN, sample_next_token
+from tp_tokens.metrics import TrainingMetrics
+from tp_tokens.optim import Adam
+from tp_tokens.sampled import SampledSoftmax
+
+PAD, EOS = 0, 2
+
+
+def test_generate_batch_reproducible(small_model):
+    nn = small_model()
+    for compact in (True, False):
+        a = nn.generate_batch(16, PAD, EOS, torch.Generator().manual_seed(1), compact=compact)
+        b = nn.generate_batch(16, PAD, EOS, torch.Generator().manual_seed(1), compact=compact)
+        assert a == b
+        assert len(a) == 16
+        assert all(EOS not in s for s in a)
+
+
+def test_generate_batch_max_length(small_model):
+    nn = small_model()
+    out = nn.generate_batch(8, PAD, EOS, torch.Generator().manual_seed(1), max_length=3)
+    assert all(len(s) <= 3 for s in out)
+
+
+def test_sample_next_token_top_k_one_is_greedy():
+    logits = torch.randn(5, 20, generator=torch.Generator().manual_seed(0))
+    g = torch.Generator().manual_seed(0)
+    assert torch.equal(sample_next_token(logits, g, top_k=1), logits.argmax(1))
+    assert torch.equal(sample_next_token(logits, g, temperature=0), logits.argmax(1))
+    assert torch.equal(sample_next_token(logits, g, top_p=1e-6), logits.argmax(1))
+
+
+def test_projection_tables_match_plain_path(small_model):
+    nn = small_model()
+    X = torch.randint(0, 20, (64, 3), generator=torch.Generator().manual_seed(2))
+    Y = torch.randint(0, 20, (64,), generator=torch.Generator().manual_seed(3))
+    h = nn._eval_hidden(X)
+    loss = nn.compute_loss(X, Y)
+    assert nn.enable_tables()
+    assert torch.allclose(nn._eval_hidden(X), h, atol=1e-5)
+    assert abs(nn.compute_loss(X, Y) - loss) < 1e-5
+    assert not nn.enable_tables(memory_budget=10)
+    assert nn.tables is None
+
+
+def test_sampled_softmax_trains(small_model):
+    nn = small_model()
+    X = torch.randint(0, 20, (32, 3), generator=torch.Generator().manual_seed(2))
+    Y = torch.randint(0, 20, (32,), generator=torch.Generator().manual_seed(3))
+    ss = SampledSoftmax(torch.bincount(Y, minlength=20), 8, torch.Generator().manual_seed(4))
+    nn.forward(X, Y, ss)
+    nn.backward()
+    assert torch.isfinite(nn.loss)
+    assert nn.W2.grad is not None and nn.C.grad is not None
+
+
+def test_checkpoint_resume_matches_continuous_training(tmp_path, small_model, tiny_datasets):
+    datasets = tiny_datasets()
+    continuous = small_model()
+    continuous.train(datasets, 6, 16, optimizer=Adam(continuous.parameters))
+
+    nn = small_model()
+    optimizer = Adam(nn.parameters)
+    path = str(tmp_path / "ck.pt")
+    nn.train(
+        datasets,
+        3,
+        16,
+        optimizer=optimizer,
+        checkpoint=lambda nn, opt: save_checkpoint(path, nn, opt),
+    )
+    state = load_checkpoint(path, mmap=False)
+    resumed = BengioFFN.from_state_dict(state, torch.Generator())
+    optimizer = Adam(resumed.parameters)
+    optimizer.load_state_dict(state["optimizer"])
+    assert resumed.steps == 3
+    resumed.train(datasets, 3, 16, optimizer=optimizer)
+
+    for name in BengioFFN.state_names:
+        assert torch.allclose(getattr(resumed, name), getattr(continuous, name))
+
+    mapped = BengioFFN.from_state_dict(load_checkpoint(path, mmap=True))
+    assert mapped.compute_loss(datasets.Xdev, datasets.Ydev) == nn.compute_loss(
+        datasets.Xdev, datasets.Ydev
+    )
+
+
+def test_resume_from_mid_run_checkpoint(tmp_path, small_model, tiny_datasets):
+    datasets = tiny_datasets()
+    continuous = small_model()
+    # minibatchs préparés en avance : le checkpoint du pas 4 doit quand même
+    # contenir l'état du générateur au pas 4
+    continuous.train(
+        datasets,
+        8,
+        16,
+        prefetch=2,
+        checkpoint=lambda nn, opt: save_checkpoint(
+            str(tmp_path / f"ck{nn.steps}.pt"), nn, opt
+        ),
+        checkpoint_every=4,
+    )
+    state = load_checkpoint(str(tmp_path / "ck4.pt"), mmap=False)
+    resumed = BengioFFN.from_state_dict(state, torch.Generator())
+    resumed.train(datasets, 4, 16, prefetch=2)
+
+    assert resumed.steps == continuous.steps == 8
+    for name in BengioFFN.state_names:
+        assert torch.equal(getattr(resumed, name), getattr(continuous, name)), name
+
+
+def test_resume_restores_sampled_softmax_stream(tmp_path, small_model, tiny_datasets):
+    datasets = tiny_datasets()
+
+    def sampler():
+        counts = torch.bincount(datasets.Ytr, minlength=20)
+        return SampledSoftmax(counts, 4, torch.Generator().manual_seed(1))
+
+    continuous = small_model()
+    continuous.train(datasets, 6, 16, sampler())
+
+    nn, ss = small_model(), sampler()
+    path = str(tmp_path / "ck.pt")
+    nn.train(
+        datasets, 3, 16, ss, checkpoint=lambda nn, opt: save_checkpoint(path, nn, opt, None, ss)
+    )
+    state = load_checkpoint(path, mmap=False)
+    resumed, ss = BengioFFN.from_state_dict(state, torch.Generator()), sampler()
+    ss.g.set_state(state["sampled_generator"])
+    resumed.train(datasets, 3, 16, ss)
+    for name in BengioFFN.state_names:
+        assert torch.equal(getattr(resumed, name), getattr(continuous, name)), name
+
+
+def test_evaluate_matches_full_softmax(small_model):
+    nn = small_model(nb_tokens=37)
+    X = torch.randint(0, 37, (100, 3), generator=torch.Generator().manual_seed(2))
+    Y = torch.randint(0, 37, (100,), generator=torch.Generator().manual_seed(3))
+    logits = nn._eval_logits(X)
+    expected = F.cross_entropy(logits, Y).item()
+    accuracy = (logits.argmax(1) == Y).float().mean().item()
+
+    metrics = evaluate_tensors(nn, X.to(torch.int16), Y, batch_size=32, vocab_chunk=8)
+    assert abs(metrics["loss"] - expected) < 1e-5
+    assert abs(metrics["accuracy"] - accuracy) < 1e-9
+    assert metrics["nb_samples"] == 100
+    assert abs(nn.compute_loss(X, Y) - expected) < 1e-5
+
+
+def test_training_metrics_jsonl(tmp_path, small_model, tiny_datasets):
+    path = tmp_path / "metrics.jsonl"
+    nn = small_model()
+    nn.train(tiny_datasets(), 25, 16, log_every=None, metrics=TrainingMetrics(str(path), every=10))
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r["step"] for r in records] == [10, 20, 25]
+    assert set(records[0]["phase_ms"]) == {"batch", "forward", "backward", "update"}
+    assert records[0]["grad_norm"]["W2"] > 0
+
+
+def test_model_options_tables_and_checkpoint():
+    g = torch.Generator().manual_seed(0)
+    X = torch.randint(0, 20, (64, 3), generator=g)
+    Y = torch.randint(0, 20, (64,), generator=g)
+    for activation in ("relu", "gelu"):
+        nn = BengioFFN(8, 16, 3, 20, g, init="xavier", activation=activation, batchnorm=False)
+        nn.forward(X, Y)
+        assert torch.all(nn.bnstd_running == 1)
+        loss = nn.compute_loss(X, Y)
+        assert nn.enable_tables()
+        assert abs(nn.compute_loss(X, Y) - loss) < 1e-5
+        restored = BengioFFN.from_state_dict(nn.state_dict())
+        assert (restored.activation, restored.batchnorm) == (activation, False)
+
+
+def test_huge_loss_gives_infinite_perplexity():
+    g = torch.Generator().manual_seed(0)
+    nn = BengioFFN(8, 16, 3, 20, g, init="normal", activation="relu", batchnorm=False)
+    nn.W2.data.mul_(1e4)  # logits énormes : perte moyenne bien au-delà de 709
+    X = torch.randint(0, 20, (64, 3), generator=g)
+    Y = torch.randint(0, 20, (64,), generator=g)
+    metrics = evaluate_tensors(nn, X, Y)
+    assert metrics["loss"] > 710
+    assert metrics["perplexity"] == float("inf")
+    assert nn.compute_loss(X, Y) == metrics["loss"]
+
+
+def test_training_error_with_prefetch_is_raised(small_model, tiny_datasets, within):
+    def fail(nn, optimizer):
+        raise OSError("disk full")
+
+    nn = small_model()
+    with pytest.raises(OSError):
+        within(lambda: nn.train(tiny_datasets(), 10, 16, checkpoint=fail, checkpoint_every=8))
@@ -0,0 +1,72 @@
+import pytest
+import torch
+
+from tp_tokens.ffn import BengioFFN
+from tp_tokens.fused import FusedEngine
+
+PARAMS = ("C", "W1", "W2", "b2", "bngain", "bnbias")
+
+
+def pair(**kwargs):
+    "Deux réseaux identiques : l'un pour autograd, l'autre pour le moteur fusionné."
+    return [
+        BengioFFN(6, 12, 3, 25, torch.Generator().manual_seed(0), **kwargs)
+        for _ in range(2)
+    ]
+
+
+def batch(seed, n=16):
+    g = torch.Generator().manual_seed(seed)
+    # peu de tokens : lignes de C répétées dans le minibatch
+    return torch.randint(0, 8, (n, 3), generator=g), torch.randint(0, 25, (n,), generator=g)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{}, {"activation": "relu", "batchnorm": False}, {"activation": "linear"}],
+)
+def test_gradients_match_autograd(kwargs):
+    a, b = pair(**kwargs)
+    engine = FusedEngine(b)
+    for seed in (1, 2):  # deux pas : les lignes de C du pas précédent sont remises à zéro
+        X, Y = batch(seed)
+        a.forward(X, Y)
+        a.backward()
+        engine.forward(X, Y)
+        engine.backward()
+        assert torch.allclose(a.loss, b.loss, atol=1e-6)
+        for name in PARAMS:
+            assert torch.allclose(
+                getattr(a, name).grad, getattr(b, name).grad, atol=1e-5
+            ), name
+        assert torch.allclose(a.bnmean_running, b.bnmean_running)
+        assert torch.allclose(a.bnstd_running, b.bnstd_running)
+
+
+def test_sparse_embeddings_gradient():
+    a, b = pair()
+    b.sparse_embeddings = True
+    X, Y = batch(1)
+    a.forward(X, Y)
+    a.backward()
+    engine = FusedEngine(b)
+    engine.forward(X, Y)
+    engine.backward()
+    assert b.C.grad.is_sparse
+    assert torch.allclose(a.C.grad, b.C.grad.to_dense(), atol=1e-5)
+
+
+def test_fused_training_matches_autograd():
+    a, b = pair()
+    X = torch.randint(0, 25, (500, 3), generator=torch.Generator().manual_seed(3))
+
+    class Data:
+        Xtr, Ytr = X, X[:, 0]
+
+    lossi_a = a.train(Data, 30, 32, log_every=None)
+    lossi_b = b.train(Data, 30, 32, log_every=None, fused=True)
+    assert torch.allclose(torch.tensor(lossi_a), torch.tensor(lossi_b), atol=1e-4)
+    assert torch.allclose(a.W1, b.W1, atol=1e-4)
+
+    with pytest.raises(ValueError):
+        FusedEngine(BengioFFN(6, 12, 3, 25, torch.Generator(), activation="gelu"))
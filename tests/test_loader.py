@@ -0,0 +1,61 @@
+import time
+
+import torch
+
+from tp_tokens.loader import BatchLoader
+
+
+def batches(prefetch, replacement, nb_batches=7):
+    X = torch.arange(40, dtype=torch.int16).view(20, 2)
+    Y = torch.arange(20, dtype=torch.int16)
+    g = torch.Generator().manual_seed(0)
+    return list(BatchLoader(X, Y, 6, g, nb_batches, replacement, prefetch))
+
+
+def test_prefetch_does_not_change_batches():
+    for replacement in (True, False):
+        a, b = batches(0, replacement), batches(3, replacement)
+        assert len(a) == len(b) == 7
+        for (Xa, Ya), (Xb, Yb) in zip(a, b):
+            assert Xa.dtype == torch.int64
+            assert torch.equal(Xa, Xb) and torch.equal(Ya, Yb)
+
+
+def test_generator_follows_consumed_batches():
+    X = torch.zeros(20, 2, dtype=torch.int16)
+    g = torch.Generator().manual_seed(0)
+    reference = torch.Generator().manual_seed(0)
+    for i, _ in enumerate(BatchLoader(X, X[:, 0], 4, g, 100, prefetch=3)):
+        torch.randint(0, 20, (4,), generator=reference)
+        assert torch.equal(g.get_state(), reference.get_state())
+        if i == 5:
+            break
+
+
+def test_epochs_sample_without_replacement():
+    # 10 minibatchs de 6 = 3 époques complètes de 20 exemples
+    Y = torch.cat([Yb for _, Yb in batches(2, False, nb_batches=10)])
+    for epoch in Y.view(3, 20):
+        assert sorted(epoch.tolist()) == list(range(20))
+
+
+def test_early_exit_stops_producer():
+    X = torch.zeros(20, 2, dtype=torch.int16)
+    loader = BatchLoader(X, X[:, 0], 4, torch.Generator(), 1000, prefetch=2)
+    for i, _ in enumerate(loader):
+        if i == 3:
+            break
+
+
+def test_early_exit_with_full_queue(within):
+    X = torch.zeros(20, 2, dtype=torch.int16)
+    loader = BatchLoader(X, X[:, 0], 4, torch.Generator(), 10, prefetch=2)
+
+    def consume():
+        for i, _ in enumerate(loader):
+            if i == 10 - 2 - 1:
+                # le producteur a fini et attend de déposer la fin de flux
+                time.sleep(0.3)
+                break
+
+    within(consume)
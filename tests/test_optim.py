@@ -0,0 +1,75 @@
+import math
+
+import torch
+
+from tp_tokens.optim import SGD, Adam, make_schedule
+
+
+def make_params(seed=0):
+    g = torch.Generator().manual_seed(seed)
+    params = [torch.randn(6, 4, generator=g), torch.randn(4, generator=g)]
+    for p in params:
+        p.requires_grad = True
+    return params
+
+
+def loss_fn(params, rows):
+    W, b = params
+    return ((W[rows] @ torch.ones(4) + b.sum()) ** 2).sum()
+
+
+def run(optimizer_cls, torch_cls, kwargs, torch_kwargs, steps=5):
+    ours, ref = make_params(), make_params()
+    opt = optimizer_cls(ours, **kwargs)
+    ref_opt = torch_cls(ref, lr=0.01, **torch_kwargs)
+    for step in range(steps):
+        rows = torch.tensor([step % 6, (step + 2) % 6])
+        for params in (ours, ref):
+            for p in params:
+                p.grad = None
+            loss_fn(params, rows).backward()
+        opt.step(0.01)
+        ref_opt.step()
+    for p, q in zip(ours, ref):
+        assert torch.allclose(p, q, atol=1e-6)
+
+
+def test_sgd_momentum_matches_torch():
+    run(SGD, torch.optim.SGD, {"momentum": 0.9}, {"momentum": 0.9})
+
+
+def test_adam_matches_torch():
+    run(Adam, torch.optim.Adam, {}, {})
+    run(
+        Adam,
+        torch.optim.AdamW,
+        {"weight_decay": 0.1, "decoupled": True},
+        {"weight_decay": 0.1},
+    )
+
+
+def test_sparse_sgd_matches_dense():
+    dense, sparse = make_params(), make_params()
+    rows = torch.tensor([1, 3, 3])
+    for p in dense:
+        p.grad = None
+    loss_fn(dense, rows).backward()
+    W, b = sparse
+    emb = torch.nn.functional.embedding(rows, W, sparse=True)
+    ((emb @ torch.ones(4) + b.sum()) ** 2).sum().backward()
+    assert W.grad.is_sparse
+    SGD(dense).step(0.1)
+    SGD(sparse).step(0.1)
+    for p, q in zip(dense, sparse):
+        assert torch.allclose(p, q, atol=1e-6)
+
+
+def test_schedules():
+    step = make_schedule("step", 0.2, 1000, step_size=100)
+    assert step(0) == 0.2 and math.isclose(step(100), 0.02)
+    assert math.isclose(step(250), 0.002)
+    once = make_schedule("step", 0.2, 300000, step_size=100000, max_decays=1)
+    assert math.isclose(once(100000), 0.02) and math.isclose(once(250000), 0.02)
+    cosine = make_schedule("cosine", 1.0, 110, warmup=10)
+    assert cosine(0) == 0.1 and cosine(10) == 1.0
+    assert math.isclose(cosine(110), 0.0, abs_tol=1e-12)
@@ -0,0 +1,53 @@
+import pytest
+import torch
+
+from tp_tokens.checkpoint import load_checkpoint, save_checkpoint
+from tp_tokens.ffn import BengioFFN
+from tp_tokens.quant import QuantizedBengioFFN, quantize_columns, quantize_rows
+
+PAD, EOS = 0, 2
+
+
+def test_quantize_rows_error_bounded():
+    t = torch.randn(50, 30, generator=torch.Generator().manual_seed(0))
+    q, scale = quantize_rows(t)
+    assert q.dtype == torch.int8 and scale.shape == (50, 1)
+    assert torch.all((q.float() * scale - t).abs() <= scale / 2 + 1e-6)
+    q, scale = quantize_columns(t)
+    assert scale.shape == (1, 30)
+    assert torch.all((q.float() * scale - t).abs() <= scale / 2 + 1e-6)
+
+
+def test_quantized_model_close_to_float(tmp_path, small_model):
+    nn = small_model()
+    g = torch.Generator().manual_seed(2)
+    X = torch.randint(0, 20, (64, 3), generator=g)
+    Y = torch.randint(0, 20, (64,), generator=g)
+    quantized = QuantizedBengioFFN.quantize(nn)
+    assert abs(quantized.compute_loss(X, Y) - nn.compute_loss(X, Y)) < 0.05
+    assert not quantized.enable_tables()
+    with pytest.raises(TypeError):
+        quantized.train(None, 1, 16)
+
+    path = tmp_path / "int8.pt"
+    save_checkpoint(path, quantized)
+    state = load_checkpoint(path)
+    assert state["config"]["quantized"] and state["W2q"].dtype == torch.int8
+    restored = QuantizedBengioFFN.from_state_dict(state)
+    assert restored.compute_loss(X, Y) == quantized.compute_loss(X, Y)
+    out = restored.generate_batch(4, PAD, EOS, torch.Generator().manual_seed(1), max_length=5)
+    assert len(out) == 4
+
+
+def test_autocast_training_keeps_float32_weights():
+    g = torch.Generator().manual_seed(0)
+    nn = BengioFFN(8, 16, 3, 20, g)
+
+    class Data:
+        Xtr = torch.randint(0, 20, (256, 3), generator=g)
+        Ytr = torch.randint(0, 20, (256,), generator=g)
+
+    lossi = nn.train(Data, 20, 32, log_every=None, autocast=True)
+    assert len(lossi) == 20
+    assert all(p.dtype == torch.float32 for p in nn.parameters)
+    assert nn.bnmean_running.dtype == torch.float32
@@ -0,0 +1,60 @@
+import tokenizers
+import torch
+
+from tp_tokens.datasets import build_dataset
+from tp_tokens.ffn import BengioFFN
+from tp_tokens.scoring import SentenceScorer
+
+TOKENIZER = "models/civil_tokenizer.json"
+
+
+def test_scores_match_cross_entropy_and_use_cache():
+    tokenizer = tokenizers.Tokenizer.from_file(TOKENIZER)
+    g = torch.Generator().manual_seed(0)
+    nn = BengioFFN(8, 16, 3, tokenizer.get_vocab_size(), g)
+    nn.bnstd_running.fill_(1.0)
+    texts = [
+        "Le maire exerce ses fonctions.",
+        "Le maire exerce ses fonctions de police.",
+        "Le maire exerce",
+    ]
+    scorer = SentenceScorer(nn, tokenizer, cache_size=1000, batch_size=4)
+    scores = scorer.score(texts)
+
+    ids = [e.ids for e in tokenizer.encode_batch(texts)]
+    X, Y = build_dataset(ids, 3, tokenizer.token_to_id("[PAD]"), tokenizer.token_to_id("[EOS]"))
+    expected = torch.log_softmax(nn._eval_logits(X), dim=1)[torch.arange(len(Y)), Y]
+    token_log_probs = torch.tensor([lp for s in scores for lp in s["token_log_probs"]])
+    assert torch.allclose(token_log_probs, expected, atol=1e-4)
+    assert [s["ids"] for s in scores] == ids
+    assert abs(scores[0]["log_prob"] - expected[: len(ids[0]) + 1].sum().item()) < 1e-3
+
+    # préfixes communs : contextes dédupliqués, puis servis par le cache
+    assert scorer.misses < len(Y)
+    misses = scorer.misses
+    again = scorer.score(texts)
+    assert scorer.misses == misses
+    assert again[1]["log_prob"] == scores[1]["log_prob"]
+
+    small = SentenceScorer(nn, tokenizer, cache_size=2)
+    small.score(texts)
+    assert len(small.cache) == 2
+
+
+def test_scores_with_compact_vocabulary():
+    from tp_tokens.vocab import Vocabulary
+
+    tokenizer = tokenizers.Tokenizer.from_file(TOKENIZER)
+    texts = ["Le maire exerce ses fonctions.", "Le maire de la commune."]
+    ids = [e.ids for e in tokenizer.encode_batch(texts)]
+    id_map = torch.tensor(sorted({0, 1, 2, *ids[0]}))  # sans les tokens propres à ids[1]
+    vocabulary = Vocabulary(id_map, tokenizer.get_vocab_size(), 1)
+    nn = BengioFFN(8, 16, 3, len(vocabulary), torch.Generator().manual_seed(0))
+    scores = SentenceScorer(nn, tokenizer, vocabulary=vocabulary).score(texts)
+
+    X, Y = build_dataset(ids, 3, 0, 2)
+    X, Y = vocabulary.encode(X), vocabulary.encode(Y)
+    expected = torch.log_softmax(nn._eval_logits(X), dim=1)[torch.arange(len(Y)), Y]
+    token_log_probs = torch.tensor([lp for s in scores for lp in s["token_log_probs"]])
+    assert torch.allclose(token_log_probs, expected, atol=1e-4)
+    assert [s["ids"] for s in scores] == ids
@@ -0,0 +1,18 @@
+from tp_tokens.sentences import Sentences
+
+TOKENIZER = "models/civil_tokenizer.json"
+
+
+def test_streaming_matches_default(tmp_path):
+    data = tmp_path / "sentences.txt"
+    lines = [f"Article {i} : le maire exerce ses fonctions." for i in range(50)]
+    lines[3] = ""
+    lines[7] = "Première partie\u2028seconde partie du texte."
+    data.write_text("\n".join(lines) + "\n")
+
+    reference = Sentences(str(data), TOKENIZER, seed=1)
+    streamed = Sentences(str(data), TOKENIZER, seed=1, streaming=True, chunk_size=8)
+
+    assert streamed.nb_sentences == reference.nb_sentences
+    for i in range(reference.nb_sentences):
+        assert streamed.token_ids_sentences[i] == reference.token_ids_sentences[i]
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import tokenizers
+import torch
+
+from tp_tokens.server import GenerationRequest, GenerationServer
+
+TOKENIZER = "models/civil_tokenizer.json"
+PAD, EOS = 0, 2
+
+
+async def _post(port, params):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(params).encode()
+    writer.write(
+        b"POST /generate HTTP/1.1\r\nHost: localhost\r\n"
+        + f"Content-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+def test_concurrent_requests_match_generate_batch(small_model):
+    nn = small_model()
+    # EOS plus probable pour que les phrases se terminent
+    nn.b2.data[EOS] = 3.0
+    server = GenerationServer(nn, tokenizers.Tokenizer.from_file(TOKENIZER), window=0.01)
+    requests = [{"n": 3, "seed": seed, "temperature": 0.8, "max_length": 10} for seed in range(6)]
+
+    async def run():
+        scheduler = asyncio.create_task(server.schedule())
+        tcp = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = tcp.sockets[0].getsockname()[1]
+        results = await asyncio.gather(*(_post(port, params) for params in requests))
+        tcp.close()
+        scheduler.cancel()
+        return results
+
+    results = asyncio.run(run())
+    for params, result in zip(requests, results):
+        g = torch.Generator().manual_seed(params["seed"])
+        expected = nn.generate_batch(3, PAD, EOS, g, temperature=0.8, max_length=10)
+        assert result["ids"] == expected
+        assert len(result["sentences"]) == 3
+
+    stats = server.stats()
+    assert stats["requests"] == 6 and stats["queue_depth"] == 0
+    # les requêtes simultanées ont partagé des passes avant
+    assert stats["mean_batch_rows"] > 3
+    assert stats["p50_ms"] <= stats["p99_ms"]
+
+
+def test_invalid_request_does_not_fail_the_batch(small_model):
+    nn = small_model()
+    # EOS plus probable pour que les phrases se terminent
+    nn.b2.data[EOS] = 3.0
+    server = GenerationServer(nn, tokenizers.Tokenizer.from_file(TOKENIZER), window=0.01)
+    requests = [{"n": 2, "seed": 1, "max_length": 10}, {"top_k": 0}, {"top_p": 1.5}]
+
+    async def run():
+        scheduler = asyncio.create_task(server.schedule())
+        tcp = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = tcp.sockets[0].getsockname()[1]
+        results = await asyncio.gather(*(_post(port, params) for params in requests))
+        tcp.close()
+        scheduler.cancel()
+        return results
+
+    valid, top_k, top_p = asyncio.run(run())
+    g = torch.Generator().manual_seed(1)
+    assert valid["ids"] == nn.generate_batch(2, PAD, EOS, g, max_length=10)
+    assert "top_k" in top_k["error"] and "top_p" in top_p["error"]
+
+    # une erreur pendant le tirage n'échoue que sa requête
+    good, bad = (
+        GenerationRequest(2, 3, PAD, seed, 1.0, None, None, 10, None) for seed in (1, 2)
+    )
+
+    def fail(logits, eos_id):
+        raise RuntimeError("boom")
+
+    bad.advance = fail
+    server._step([good, bad])
+    assert isinstance(bad.error, RuntimeError) and bad.done
+    assert good.error is None and good.step == 1
@@ -0,0 +1,33 @@
+import torch
+
+from tp_tokens.store import TokenStore, open_windows, save_windows
+
+
+def test_token_store_roundtrip(tmp_path):
+    sentences = [[5, 6, 7], [], [8], [9, 10]]
+    store = TokenStore.from_lists(sentences, torch.int16)
+    store.save(str(tmp_path), "key")
+
+    opened = TokenStore.open(str(tmp_path), "key")
+    assert len(opened) == 4
+    assert [opened[i] for i in range(4)] == sentences
+    assert opened[-1] == [9, 10]
+
+    tail = opened[2:]
+    assert len(tail) == 2
+    assert tail.flat_ids().tolist() == [8, 9, 10]
+    assert len(opened[3:1]) == 0
+
+
+def test_token_store_missing(tmp_path):
+    assert TokenStore.open(str(tmp_path), "missing") is None
+    assert open_windows(str(tmp_path), "missing") is None
+
+
+def test_windows_roundtrip(tmp_path):
+    X = torch.arange(12, dtype=torch.int16).view(4, 3)
+    Y = torch.arange(4, dtype=torch.int16)
+    save_windows(str(tmp_path), "w", X, Y)
+    X2, Y2 = open_windows(str(tmp_path), "w")
+    assert torch.equal(X, X2)
+    assert torch.equal(Y, Y2)
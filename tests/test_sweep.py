@@ -0,0 +1,51 @@
+import csv
+
+import pytest
+
+from tp_tokens.sweep import DEFAULTS, expand, run_sweep, should_stop, write_results
+
+TOKENIZER = "models/civil_tokenizer.json"
+
+
+def test_expand_grid_and_random():
+    spec = {"space": {"hidden": [16, 32], "activation": ["tanh", "relu", "gelu"]}}
+    configs = expand(spec)
+    assert len(configs) == 6
+    assert all(c["e_dims"] == DEFAULTS["e_dims"] for c in configs)
+
+    spec = {
+        "method": "random",
+        "trials": 5,
+        "space": {"lr": {"min": 0.01, "max": 1.0, "log": True}, "batch": [32, 64]},
+    }
+    assert expand(spec, seed=1) == expand(spec, seed=1)
+    assert all(0.01 <= c["lr"] <= 1.0 for c in expand(spec))
+    with pytest.raises(ValueError):
+        expand({"space": {"dropout": [0.1]}})
+
+
+def test_should_stop_median_rule():
+    assert not should_stop(5.0, [1.0, 2.0])
+    assert should_stop(5.0, [1.0, 2.0, 3.0])
+    assert not should_stop(2.0, [1.0, 2.0, 3.0])
+    assert should_stop(float("nan"), [])
+
+
+def test_run_sweep(tmp_path):
+    data = tmp_path / "sentences.txt"
+    data.write_text(
+        "\n".join(f"Article {i} : le maire exerce ses fonctions." for i in range(60))
+    )
+    spec = {
+        "steps": 6,
+        "eval_every": 2,
+        "space": {"context": [2, 3], "e_dims": [4], "hidden": [8], "batchnorm": [True, False]},
+    }
+    results = run_sweep(spec, str(data), TOKENIZER, str(tmp_path / "cache"), workers=2)
+    assert sorted(r["trial"] for r in results) == [0, 1, 2, 3]
+    assert all(r["status"] in ("completed", "stopped") for r in results)
+    assert results[0]["dev_loss"] <= results[-1]["dev_loss"]
+
+    write_results(results, tmp_path / "results.csv")
+    with open(tmp_path / "results.csv") as f:
+        assert len(list(csv.DictReader(f))) == 4
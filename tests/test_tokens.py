@@ -0,0 +1,38 @@
+import random
+
+from tp_tokens.clean import scrap_sentences, synthetic_markdown
+from tp_tokens.tokens import main, split_path
+
+WORDS = "le maire exerce ses fonctions dans la commune selon les conditions prévues par la loi".split()
+
+
+def test_streaming_training_from_corpus(tmp_path):
+    rng = random.Random(0)
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for k in range(3):
+        lines = [" ".join(rng.choices(WORDS, k=12)).capitalize() + "." for _ in range(40)]
+        (corpus / f"code{k}.md").write_text(synthetic_markdown(lines))
+
+    datafile = str(tmp_path / "sentences.txt")
+    tokenizer = main(300, datafile, str(tmp_path / "tok.json"), str(corpus), seed=3, workers=1)
+    assert tokenizer.token_to_id("[EOS]") == 2
+
+    # même fichier de phrases que scrap_sentences
+    reference = tmp_path / "reference.txt"
+    scrap_sentences(str(corpus), str(reference), workers=1)
+    assert open(datafile).read() == reference.read_text()
+
+    # mêmes splits que Sentences (mélange avec la graine) puis Datasets (80/10/10)
+    lines = open(datafile).read().splitlines()
+    shuffled = list(lines)
+    random.seed(3)
+    random.shuffle(shuffled)
+    n1, n2 = int(0.8 * len(lines)), int(0.9 * len(lines))
+    for name, expected in (
+        ("train", shuffled[:n1]),
+        ("dev", shuffled[n1:n2]),
+        ("test", shuffled[n2:]),
+    ):
+        split = open(split_path(datafile, name)).read().splitlines()
+        assert sorted(split) == sorted(expected)
@@ -0,0 +1,72 @@
+import torch
+
+from tp_tokens.evaluation import evaluate
+from tp_tokens.ffn import BengioFFN
+from tp_tokens.validation import PeriodicValidation
+
+
+def test_validation_curve_and_best_weights(tiny_datasets):
+    datasets = tiny_datasets(learnable=True)
+    nn = BengioFFN(8, 16, 3, 20, torch.Generator().manual_seed(0))
+    validation = PeriodicValidation(datasets, every=10)
+    lossi = nn.train(datasets, 45, 16, log_every=None, validation=validation)
+    curve = validation.curve
+
+    assert len(lossi) == 45
+    assert [step for step, _ in curve] == [10, 20, 30, 40, 45]
+    best = min(loss for _, loss in curve)
+    assert validation.best_loss == best
+    dev = evaluate(nn, datasets, ("dev",))["dev"]["loss"]
+    assert abs(dev - best) < 1e-5
+    assert nn.steps == 45
+
+
+def test_patience_stops_training_and_restores_best(tiny_datasets):
+    datasets = tiny_datasets(learnable=True)
+    nn = BengioFFN(8, 16, 3, 20, torch.Generator().manual_seed(0))
+    # aucune évaluation n'améliore la première de 10 : arrêt après la deuxième
+    validation = PeriodicValidation(datasets, every=5, patience=1, min_delta=10.0)
+    saved = []
+    lossi = nn.train(
+        datasets,
+        5000,
+        16,
+        log_every=None,
+        checkpoint=lambda nn, opt: saved.append(
+            (validation.restored, validation.best_step, nn.W1.clone())
+        ),
+        checkpoint_every=10**6,
+        validation=validation,
+    )
+    curve = validation.curve
+
+    assert 10 <= len(lossi) < 5000
+    assert len(curve) >= 2 and nn.steps == len(lossi)
+    assert torch.equal(nn.W1, validation.best_state["W1"])
+    assert torch.equal(nn.bnmean_running, validation.best_state["bnmean_running"])
+    # checkpoint final après restauration, best_step connu de l'appelant
+    restored, best_step, W1 = saved[-1]
+    assert restored and best_step < nn.steps and torch.equal(W1, nn.W1)
+
+
+def test_late_early_stop_with_prefetch(tiny_datasets, within):
+    class LateStop(PeriodicValidation):
+        "Attend l'arrêt (décidé par l'évaluation du pas 4) jusqu'au pas 7."
+
+        def step(self, nn):
+            stop = super().step(nn)
+            if nn.steps == 7:
+                return self.stopped.wait(10)
+            return stop and nn.steps >= 7
+
+    datasets = tiny_datasets(learnable=True)
+    nn = BengioFFN(8, 16, 3, 20, torch.Generator().manual_seed(0))
+    validation = LateStop(datasets, every=2, patience=1, min_delta=10.0)
+    # arrêt à moins de prefetch pas de la fin : la file est pleine
+    lossi = within(
+        lambda: nn.train(datasets, 10, 16, prefetch=3, log_every=None, validation=validation)
+    )
+
+    assert len(lossi) == nn.steps == 7
+    assert validation.restored and validation.best_step < 7
+    assert torch.equal(nn.W1, validation.best_state["W1"])
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import torch
+
+from tp_tokens.datasets import Datasets
+from tp_tokens.store import TokenStore
+from tp_tokens.vocab import Vocabulary
+
+SPECIAL = {"[PAD]": 0, "[UNK]": 1, "[EOS]": 2}
+
+
+def fake_sentences(token_ids_sentences, nb_tokens=50):
+    return SimpleNamespace(
+        token_ids_sentences=token_ids_sentences,
+        nb_sentences=len(token_ids_sentences),
+        nb_tokens=nb_tokens,
+        token_to_id=SPECIAL.get,
+    )
+
+
+SENTENCES = [[10, 11, 12], [10, 40], [12, 12, 10], [], [11, 30], [45]] * 5
+
+
+def test_vocabulary_from_sentences():
+    vocabulary = Vocabulary.from_sentences(fake_sentences(SENTENCES))
+    assert vocabulary.id_map.tolist() == [0, 1, 2, 10, 11, 12, 30, 40, 45]
+    assert vocabulary.decode(vocabulary.encode(torch.tensor([2, 40, 10])).tolist()) == [
+        2, 40, 10
+    ]
+    assert vocabulary.encode(torch.tensor([7])).item() == vocabulary.compact_id(1)
+
+    # les 4 premières phrases seulement, tokens vus au moins 2 fois
+    rare = Vocabulary.from_sentences(
+        fake_sentences(TokenStore.from_lists(SENTENCES, torch.int8)), 2, 4
+    )
+    assert rare.id_map.tolist() == [0, 1, 2, 10, 12]
+    state = Vocabulary.from_state_dict(rare.state_dict())
+    assert torch.equal(state.to_compact, rare.to_compact)
+    assert state.key() == rare.key()
+
+
+def test_datasets_with_vocabulary():
+    # 45 n'apparaît que dans les splits dev et test
+    token_ids = [s for s in SENTENCES if s != [45]][:24] + [[45, 10]] * 6
+    sentences = fake_sentences(TokenStore.from_lists(token_ids, torch.int8))
+    vocabulary = Vocabulary.from_sentences(sentences, 1, 24)  # split train
+    full = Datasets(sentences, 3)
+    compact = Datasets(sentences, 3, vocabulary=vocabulary)
+    assert compact.nb_tokens == len(vocabulary) == 8
+    assert compact.pad_id == 0 and compact.eos_id == 2
+    for name in ("Xtr", "Ytr", "Xdev", "Ydev", "Xte", "Yte"):
+        assert torch.equal(
+            getattr(compact, name).long(), vocabulary.encode(getattr(full, name))
+        ), name
+    assert (compact.Yte == vocabulary.compact_id(1)).any()
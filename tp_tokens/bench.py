@@ -0,0 +1,239 @@
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+from typing import Callable
+
+import tokenizers
+import torch
+
+from .clean import clean_civil_code, synthetic_markdown
+from .datasets import Datasets
+from .ffn import BengioFFN
+from .quant import QuantizedBengioFFN
+from .scoring import SentenceScorer
+from .sentences import Sentences
+
+
+def measure(fn: Callable[[], object], repeats: int = 3, warmup: int = 1) -> float:
+    "Meilleur temps (secondes) de fn sur repeats exécutions, après warmup exécutions."
+    for _ in range(warmup):
+        fn()
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _result(value: float, unit: str) -> dict:
+    return {"value": value, "unit": unit, "higher_is_better": True}
+
+
+def bench_clean(lines: list[str], repeats: int) -> dict:
+    document = synthetic_markdown(lines)
+    seconds = measure(lambda: clean_civil_code(document), repeats)
+    return {"clean_civil_code": _result(len(document) / seconds, "chars/s")}
+
+
+def bench_sentences(
+    datafile: str, tokenizer: str, nb_sentences: int, repeats: int
+) -> dict:
+    results = {}
+    for name, streaming in (("sentences_encode", False), ("sentences_streaming", True)):
+        seconds = measure(
+            lambda: Sentences(datafile, tokenizer, streaming=streaming), repeats, warmup=0
+        )
+        results[name] = _result(nb_sentences / seconds, "sentences/s")
+    return results
+
+
+def bench_build_dataset(sentences: Sentences, context_size: int, repeats: int) -> dict:
+    datasets = Datasets(sentences, context_size)
+    ids = sentences.token_ids_sentences
+    seconds = measure(
+        lambda: datasets._build_dataset(ids, context_size, datasets.pad_id, datasets.eos_id),
+        repeats,
+    )
+    nb_rows = datasets.Xtr.shape[0] + datasets.Xdev.shape[0] + datasets.Xte.shape[0]
+    return {"build_dataset": _result(nb_rows / seconds, "rows/s")}
+
+
+def bench_train(
+    datasets: Datasets,
+    nb_tokens: int,
+    grid: dict[str, list[int]],
+    steps: int,
+    seed: int,
+) -> dict:
+    results = {}
+    for e_dims, n_hidden, batch in itertools.product(
+        grid["e_dims"], grid["n_hidden"], grid["batch"]
+    ):
+        g = torch.Generator().manual_seed(seed)
+        nn = BengioFFN(e_dims, n_hidden, datasets.context_size, nb_tokens, g)
+        nn.train(datasets, 2, batch, log_every=None)  # échauffement
+        t0 = time.perf_counter()
+        nn.train(datasets, steps, batch, log_every=None)
+        seconds = time.perf_counter() - t0
+        name = f"train_e{e_dims}_h{n_hidden}_b{batch}"
+        results[f"{name}_steps"] = _result(steps / seconds, "steps/s")
+        results[f"{name}_tokens"] = _result(steps * batch / seconds, "tokens/s")
+        t0 = time.perf_counter()
+        nn.train(datasets, steps, batch, log_every=None, fused=True)
+        seconds = time.perf_counter() - t0
+        results[f"{name}_fused_steps"] = _result(steps / seconds, "steps/s")
+    return results
+
+
+def bench_inference(
+    datasets: Datasets, nb_tokens: int, seed: int, nb_samples: int, repeats: int
+) -> tuple[BengioFFN, dict]:
+    g = torch.Generator().manual_seed(seed)
+    nn = BengioFFN(64, 128, datasets.context_size, nb_tokens, g)
+    nn.train(datasets, 20, 32, log_every=None)
+    X, Y = datasets.Xdev[:nb_samples], datasets.Ydev[:nb_samples]
+    results = {}
+    seconds = measure(lambda: nn.compute_loss(X, Y), repeats)
+    results["compute_loss"] = _result(X.shape[0] / seconds, "samples/s")
+
+    # tokens générés : longueur fixe pour des mesures comparables
+    max_length = 32
+    seconds = measure(
+        lambda: nn.generate_batch(1, datasets.pad_id, -1, g, max_length=max_length),
+        repeats,
+    )
+    results["generate_batch1"] = _result(max_length / seconds, "tokens/s")
+    seconds = measure(
+        lambda: nn.generate_batch(64, datasets.pad_id, -1, g, max_length=max_length),
+        repeats,
+    )
+    results["generate_batch64"] = _result(64 * max_length / seconds, "tokens/s")
+
+    quantized = QuantizedBengioFFN.quantize(nn)
+    seconds = measure(lambda: quantized.compute_loss(X, Y), repeats)
+    results["compute_loss_int8"] = _result(X.shape[0] / seconds, "samples/s")
+    seconds = measure(
+        lambda: quantized.generate_batch(1, datasets.pad_id, -1, g, max_length=max_length),
+        repeats,
+    )
+    results["generate_batch1_int8"] = _result(max_length / seconds, "tokens/s")
+    return nn, results
+
+
+def bench_scoring(
+    nn: BengioFFN, tokenizer: tokenizers.Tokenizer, lines: list[str], repeats: int
+) -> dict:
+    results = {}
+    # cache vide à chaque mesure, puis cache déjà rempli par les mêmes phrases
+    seconds = measure(lambda: SentenceScorer(nn, tokenizer).score(lines), repeats)
+    results["score_sentences"] = _result(len(lines) / seconds, "sentences/s")
+    scorer = SentenceScorer(nn, tokenizer)
+    seconds = measure(lambda: scorer.score(lines), repeats)
+    results["score_sentences_cached"] = _result(len(lines) / seconds, "sentences/s")
+    return results
+
+
+def run(args) -> dict:
+    torch.manual_seed(args.seed)
+    lines = open(args.datafile).read().splitlines()
+    results: dict[str, dict] = {}
+    results.update(bench_clean(lines[: args.clean_lines], args.repeats))
+    results.update(
+        bench_sentences(args.datafile, args.tokenizer, len(lines), args.repeats)
+    )
+    sentences = Sentences(args.datafile, args.tokenizer, streaming=True)
+    results.update(bench_build_dataset(sentences, args.context, args.repeats))
+    datasets = Datasets(sentences, args.context)
+    grid = {"e_dims": args.e_dims, "n_hidden": args.n_hidden, "batch": args.batch}
+    results.update(
+        bench_train(datasets, sentences.nb_tokens, grid, args.steps, args.seed)
+    )
+    nn, inference = bench_inference(
+        datasets, sentences.nb_tokens, args.seed, args.eval_samples, args.repeats
+    )
+    results.update(inference)
+    results.update(
+        bench_scoring(
+            nn, sentences.tokenizer, lines[: args.score_sentences], args.repeats
+        )
+    )
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "torch": torch.__version__,
+            "tokenizers": tokenizers.__version__,
+            "threads": torch.get_num_threads(),
+            "datafile": args.datafile,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Liste des régressions : mesures moins bonnes que la référence de plus de
+    threshold (fraction, ex: 0.1 pour 10 %).
+    """
+    regressions = []
+    for name, reference in baseline["results"].items():
+        if name not in current["results"]:
+            continue
+        value = current["results"][name]["value"]
+        ratio = value / reference["value"]
+        if not reference.get("higher_is_better", True):
+            ratio = 1 / ratio
+        if ratio < 1 - threshold:
+            regressions.append(
+                f"{name}: {value:.4g} vs {reference['value']:.4g} {reference['unit']}"
+                f" ({(ratio - 1) * 100:+.1f}%)"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mesures de performance hors-ligne (CPU) du pipeline et du modèle."
+    )
+    parser.add_argument("--datafile", default="data/light_civil_sentences.txt")
+    parser.add_argument("--tokenizer", default="models/civil_tokenizer.json")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", default=None, help="JSON de référence")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--context", type=int, default=5)
+    parser.add_argument("--e-dims", type=int, nargs="+", default=[32, 128])
+    parser.add_argument("--n-hidden", type=int, nargs="+", default=[64, 256])
+    parser.add_argument("--batch", type=int, nargs="+", default=[32, 128])
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--eval-samples", type=int, default=4096)
+    parser.add_argument("--clean-lines", type=int, default=2000)
+    parser.add_argument("--score-sentences", type=int, default=512)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    report = run(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for name, result in report["results"].items():
+        print(f"{name:40s} {result['value']:14.2f} {result['unit']}")
+    print(f"Results saved to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regression above {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
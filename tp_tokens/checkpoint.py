@@ -0,0 +1,65 @@
+import os
+
+import torch
+
+from .ffn import BengioFFN
+from .optim import Optimizer
+from .quant import QuantizedBengioFFN
+from .sampled import SampledSoftmax
+
+
+def save_checkpoint(
+    path: str,
+    nn: BengioFFN,
+    optimizer: Optimizer | None = None,
+    meta: dict | None = None,
+    sampled_softmax: SampledSoftmax | None = None,
+    extra: dict | None = None,
+) -> None:
+    """
+    Sauvegarde atomique du réseau (paramètres, statistiques BatchNorm, steps,
+    état du générateur), de l'état de l'optimiseur et de celui du générateur de
+    la sampled softmax (clé "sampled_generator"). extra ajoute d'autres entrées
+    au checkpoint.
+
+    Le fichier ne contient que des tenseurs et des types simples : il se relit
+    avec torch.load(weights_only=True), et peut être ouvert en memmap.
+    """
+    state = nn.state_dict()
+    if optimizer is not None:
+        state["optimizer"] = optimizer.state_dict()
+    if sampled_softmax is not None:
+        state["sampled_generator"] = sampled_softmax.g.get_state()
+    state.update(extra or {})
+    state["meta"] = dict(meta or {})
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        torch.save(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path: str, mmap: bool = True) -> dict:
+    """
+    Relit un checkpoint. Avec mmap=True les tenseurs sont projetés en mémoire
+    depuis le fichier au lieu d'être désérialisés : le chargement est immédiat
+    et plusieurs processus partagent les mêmes pages.
+    """
+    return torch.load(path, mmap=mmap, weights_only=True)
+
+
+def load_model(path: str, mmap: bool = True) -> tuple[BengioFFN, dict]:
+    """
+    Réseau (BengioFFN ou QuantizedBengioFFN selon le checkpoint) et
+    métadonnées d'un checkpoint, pour l'inférence.
+    """
+    state = load_checkpoint(path, mmap=mmap)
+    if state["config"].get("quantized", False):
+        nn = QuantizedBengioFFN.from_state_dict(state)
+    else:
+        nn = BengioFFN.from_state_dict(state)
+    return nn, state.get("meta", {})
@@ -1,5 +1,20 @@
 import os
 import re
+import zipfile
+from multiprocessing import Pool
+from typing import Iterator
+
+# Motifs compilés une seule fois (voir clean_civil_code pour leur rôle)
+YAML_BLOCK = re.compile(r"(?s)^---.*?---\n?")
+MARKDOWN_TITLE = re.compile(r"(?m)^\s*#+.*$")
+HTML_LINE = re.compile(r"^.*[<>].*$\n?", flags=re.MULTILINE)
+BOLD_ARTICLE = re.compile(r"\*\*Art\.\s+.*?\*\*")
+ARTICLE_REFERENCE = re.compile(r"\b[A-Z]\.\s*[\d\.\-]+")
+DATE_FIELD = re.compile(r"[\./]{2,}(?:[\./]+)*")
+LIST_NUMBER = re.compile(r"(?m)^\s*\d+\.\s*")
+SPACES = re.compile(r"\s+")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+LEADING_DASH = re.compile(r"^[—–―]\s*")
 
 
 def clean_civil_code(md_content: str) -> list[str]:
@@ -8,37 +23,37 @@ def clean_civil_code(md_content: str) -> list[str]:
     content = "\n".join(lines)
 
     # 1. Suppression du bloc YAML
-    content = re.sub(r"(?s)^---.*?---\n?", "", content)
+    content = YAML_BLOCK.sub("", content)
 
     # 2. Suppression des titres Markdown
-    content = re.sub(r"(?m)^\s*#+.*$", "", content)
+    content = MARKDOWN_TITLE.sub("", content)
 
     # Suppression des blocs HTML
-    content = re.sub(r"^.*[<>].*$\n?", "", content, flags=re.MULTILINE)
+    content = HTML_LINE.sub("", content)
 
     # 3. Suppression des numéros d'articles EN GRAS (**Art. L111-1**)
-    content = re.sub(r"\*\*Art\.\s+.*?\*\*", "", content)
+    content = BOLD_ARTICLE.sub("", content)
 
     # 4. Suppression des références d'articles dans le texte (ex: "R. 125-17")
     # Pattern : Une majuscule, un point, suivi de chiffres, points ou tirets
     # On utilise \b pour s'assurer qu'on ne coupe pas un mot au milieu
-    content = re.sub(r"\b[A-Z]\.\s*[\d\.\-]+", "", content)
+    content = ARTICLE_REFERENCE.sub("", content)
 
     # 5. Suppression des zones de saisie de date (ex: ..../..../....)
     # On cherche une suite de au moins 2 points ou slashs
-    content = re.sub(r"[\./]{2,}(?:[\./]+)*", "", content)
+    content = DATE_FIELD.sub("", content)
 
     # 6. Suppression des chiffres de listes (1. , 2. )
-    content = re.sub(r"(?m)^\s*\d+\.\s*", "", content)
+    content = LIST_NUMBER.sub("", content)
 
     # 7. Suppression de textes spécifiques
     content = content.replace("Charte de l'élu local", "")
 
     # 8. Normalisation des espaces (remplace doubles espaces et retours chariots)
-    content = re.sub(r"\s+", " ", content).strip()
+    content = SPACES.sub(" ", content).strip()
 
     # 9. Découpage en phrases
-    sentences = re.split(r"(?<=[.!?])\s+", content)
+    sentences = SENTENCE_END.split(content)
 
     long_sentences = []
     for s in sentences:
@@ -46,7 +61,7 @@ def clean_civil_code(md_content: str) -> list[str]:
 
         # Cette regex cherche au début de la chaîne (^)
         # un tiret cadratin (—), demi-cadratin (–) ou simple (-) suivi d'espaces.
-        s = re.sub(r"^[—–―]\s*", "", s)
+        s = LEADING_DASH.sub("", s)
 
         # Enlève les phrases de moins de 3 mots
         if len(s.split()) >= 3:
@@ -55,17 +70,84 @@ def clean_civil_code(md_content: str) -> list[str]:
     return long_sentences
 
 
+def synthetic_markdown(lines: list[str]) -> str:
+    "Document au format des codes (YAML, titres, articles) construit à partir de phrases."
+    parts = ["---", "title: Code de test", "---"]
+    for i, line in enumerate(lines):
+        if i % 20 == 0:
+            parts.append(f"## Section {i // 20}")
+        parts.append(f"**Art. L{i}-1**")
+        parts.append(line)
+    return "\n".join(parts)
+
+
+# Archive ouverte une fois par processus du pool
+_archive: zipfile.ZipFile | None = None
+
+
+def _open_archive(path: str) -> None:
+    global _archive
+    _archive = zipfile.ZipFile(path)
+
+
+def _close_archive() -> None:
+    global _archive
+    if _archive is not None:
+        _archive.close()
+        _archive = None
+
+
+def _clean_member(name: str) -> tuple[str, list[str]]:
+    assert _archive is not None
+    brut = _archive.read(name).decode("utf-8")
+    return name, clean_civil_code(brut)
+
+
+def _clean_file(filepath: str) -> tuple[str, list[str]]:
+    with open(filepath, "r") as f:
+        brut = f.read()
+    return os.path.basename(filepath), clean_civil_code(brut)
+
+
+def iter_corpus(
+    path: str = "corpus/", workers: int | None = None
+) -> Iterator[tuple[str, list[str]]]:
+    """
+    Nettoie les fichiers du corpus et renvoie (nom, phrases) fichier par fichier.
+
+    path est soit un dossier, soit directement l'archive codes.zip (les fichiers
+    sont alors lus dans l'archive sans extraction). Les fichiers sont répartis sur
+    un pool de workers processus ; les résultats suivent l'ordre alphabétique des
+noms de fichiers, dans un dossier comme dans l'archive.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            names = sorted(i.filename for i in archive.infolist() if not i.is_dir())
+        initializer, initargs, clean = _open_archive, (path,), _clean_member
+    else:
+        names = [os.path.join(path, file) for file in sorted(os.listdir(path))]
+        initializer, initargs, clean = None, (), _clean_file
+
+    if workers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        try:
+            yield from map(clean, names)
+        finally:
+            _close_archive()
+        return
+    with Pool(workers, initializer=initializer, initargs=initargs) as pool:
+        yield from pool.imap(clean, names)
+
+
 def scrap_sentences(
-    path: str = "corpus/", save_to: str = "data/civil_sentences.txt"
+    path: str = "corpus/",
+    save_to: str = "data/civil_sentences.txt",
+    workers: int | None = None,
 ) -> None:
-    sentences = []
-    for file in os.listdir(path):
-        print(f"Scrapping {file}...")
-        filepath = path + file
-        with open(filepath, "r") as f:
-            brut = f.read()
-            sentences += clean_civil_code(brut)
     with open(save_to, "w", encoding="utf-8") as file:
-        for line in sentences:
-            file.write(line + "\n")
+        for name, sentences in iter_corpus(path, workers):
+            print(f"Scrapped {name}")
+            for line in sentences:
+                file.write(line + "\n")
         print(f"Done ! Sentences have been saved to {save_to}")
@@ -0,0 +1,125 @@
+from typing import NamedTuple
+
+import torch
+
+from .loader import BatchLoader
+from .store import smallest_int_dtype
+
+
+class SoftTargets(NamedTuple):
+    """
+    Distributions cibles creuses d'un minibatch de contextes : la ligne rows[i]
+    du minibatch a pour cible targets[i] avec le poids weights[i] (les poids de
+    chaque ligne somment à 1).
+    """
+
+    rows: torch.Tensor
+    targets: torch.Tensor
+    weights: torch.Tensor
+
+
+class CompactSplit:
+    """
+    Couples (contexte, cible) d'un split, dédupliqués.
+
+    Chaque contexte distinct n'est stocké qu'une fois (contexts [U, context_size],
+    dans l'ordre lexicographique) avec la distribution de ses cibles au format
+    CSR : les cibles du contexte u sont targets[offsets[u]:offsets[u + 1]], vues
+    counts[...] fois dans le split d'origine. nb_samples est le nombre de couples
+    d'origine.
+    """
+
+    def __init__(self, X: torch.Tensor, Y: torch.Tensor, nb_tokens: int) -> None:
+        self.contexts, inverse = torch.unique(X, dim=0, return_inverse=True)
+        pairs, counts = torch.unique(
+            inverse * nb_tokens + Y.long(), return_counts=True
+        )
+        context_of_pair = pairs // nb_tokens
+        self.targets = (pairs % nb_tokens).to(Y.dtype)
+        self.counts = counts.to(torch.int32)
+        offsets = torch.zeros(self.contexts.shape[0] + 1, dtype=torch.long)
+        torch.cumsum(
+            torch.bincount(context_of_pair, minlength=self.contexts.shape[0]),
+            0,
+            out=offsets[1:],
+        )
+        self.offsets = offsets.to(smallest_int_dtype(pairs.numel() + 1))
+        # nombre de couples d'origine par contexte
+        self.context_counts = torch.zeros(self.contexts.shape[0], dtype=torch.long)
+        self.context_counts.index_add_(0, context_of_pair, counts)
+        self.nb_samples = X.shape[0]
+
+    def __len__(self) -> int:
+        return self.contexts.shape[0]
+
+    def pairs(self, ix: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        "Ligne de ix et position dans targets/counts de chaque couple des contextes ix."
+        starts = self.offsets[ix].long()
+        lengths = self.offsets[ix + 1].long() - starts
+        rows = torch.repeat_interleave(torch.arange(ix.numel()), lengths)
+        first = torch.cumsum(lengths, 0) - lengths
+        positions = torch.repeat_interleave(starts - first, lengths) + torch.arange(
+            rows.numel()
+        )
+        return rows, positions
+
+    def soft_targets(self, ix: torch.Tensor) -> SoftTargets:
+        rows, positions = self.pairs(ix)
+        weights = self.counts[positions] / self.context_counts[ix][rows]
+        return SoftTargets(rows, self.targets[positions].long(), weights)
+
+    def nbytes(self) -> int:
+        return sum(
+            t.nbytes
+            for t in (self.contexts, self.targets, self.counts, self.offsets)
+        )
+
+
+class CompactDatasets:
+    """
+    Version dédupliquée d'un Datasets (voir CompactSplit) : les splits sont
+    train, dev et test. BengioFFN.train l'accepte à la place d'un Datasets et
+    minimise alors l'entropie croisée pondérée par les comptes ; l'évaluation
+    donne exactement les mêmes pertes moyennes qu'à partir des couples d'origine.
+    """
+
+    def __init__(self, datasets) -> None:
+        self.context_size = datasets.context_size
+        self.nb_tokens = datasets.nb_tokens
+        self.pad_id = datasets.pad_id
+        self.eos_id = datasets.eos_id
+        self.train = CompactSplit(datasets.Xtr, datasets.Ytr, self.nb_tokens)
+        self.dev = CompactSplit(datasets.Xdev, datasets.Ydev, self.nb_tokens)
+        self.test = CompactSplit(datasets.Xte, datasets.Yte, self.nb_tokens)
+
+
+class CompactBatchLoader(BatchLoader):
+    """
+    Minibatchs (contextes, SoftTargets) tirés d'un CompactSplit.
+
+    Les tirages portent sur les couples d'origine, comme BatchLoader (avec remise
+    ou par époques), puis chaque couple est remplacé par son contexte : un
+    contexte est donc tiré proportionnellement à son nombre d'occurrences, et
+    l'entropie croisée pondérée reste un estimateur sans biais de la perte.
+    """
+
+    def __init__(
+        self,
+        split: CompactSplit,
+        batch_size: int,
+        g: torch.Generator,
+        nb_batches: int,
+        replacement: bool = True,
+        prefetch: int = 2,
+    ) -> None:
+        super().__init__(
+            split.contexts, None, batch_size, g, nb_batches, replacement, prefetch
+        )
+        self.split = split
+        self.nb_rows = split.nb_samples
+        self.cumulative_counts = torch.cumsum(split.context_counts, 0)
+
+    def _batches(self, g: torch.Generator):
+        for ix in self._indices(g):
+            ix = torch.searchsorted(self.cumulative_counts, ix, right=True)
+            yield self.split.contexts[ix].long(), self.split.soft_targets(ix)
@@ -1,8 +1,94 @@
 import pickle
+from itertools import chain
 
+import numpy as np
 import torch
 
 from .sentences import Sentences
+from .store import TokenStore, open_windows, save_windows, smallest_int_dtype
+from .vocab import Vocabulary
+
+
+def build_dataset(
+    sentences: list[list[int]] | TokenStore,
+    context_size: int,
+    pad_id: int,
+    eos_id: int,
+    dtype: torch.dtype = torch.int64,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Construit les couples (contexte, cible) de toutes les phrases sans boucle par token.
+
+    Les phrases sont concaténées dans un seul tableau plat, chacune précédée de
+    context_size [PAD] et suivie de [EOS]. X est obtenu en extrayant les fenêtres
+    glissantes (unfold) qui précèdent chaque token cible.
+    """
+    if isinstance(sentences, TokenStore):
+        tokens = torch.from_numpy(sentences.flat_ids())
+        lengths = torch.from_numpy(sentences.lengths())
+    else:
+        lengths = torch.from_numpy(
+            np.fromiter(map(len, sentences), dtype=np.int64, count=len(sentences))
+        )
+        tokens = torch.from_numpy(
+            np.fromiter(
+                chain.from_iterable(sentences), dtype=np.int64, count=int(lengths.sum())
+            )
+        )
+    return _build_windows(
+        tokens.to(dtype), lengths, context_size, pad_id, eos_id, dtype
+    )
+
+
+def _build_windows(
+    tokens: torch.Tensor,
+    lengths: torch.Tensor,
+    context_size: int,
+    pad_id: int,
+    eos_id: int,
+    dtype: torch.dtype,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    # nombre de cibles par phrase (tokens + [EOS])
+    nb_targets = lengths + 1
+    if nb_targets.numel() == 0:
+        return (
+            torch.empty((0, context_size), dtype=dtype),
+            torch.empty((0,), dtype=dtype),
+        )
+
+    # début de chaque phrase (avec son préfixe de [PAD]) dans le tableau plat
+    seq_lengths = nb_targets + context_size
+    starts = torch.cumsum(seq_lengths, 0) - seq_lengths
+
+    flat = torch.full((int(seq_lengths.sum()),), pad_id, dtype=dtype)
+    token_offsets = torch.cumsum(lengths, 0) - lengths
+    token_pos = torch.repeat_interleave(
+        starts + context_size - token_offsets, lengths
+    ) + torch.arange(tokens.numel())
+    flat[token_pos] = tokens
+    flat[starts + context_size + lengths] = eos_id
+
+    target_offsets = torch.cumsum(nb_targets, 0) - nb_targets
+    target_pos = torch.repeat_interleave(
+        starts + context_size - target_offsets, nb_targets
+    ) + torch.arange(int(nb_targets.sum()))
+
+    windows = flat.unfold(0, context_size, 1)  # vue [len - context_size + 1, context_size]
+    X = windows[target_pos - context_size]
+    Y = flat[target_pos]
+    return X, Y
+
+
+def _nb_targets(sentences: list[list[int]] | TokenStore) -> int:
+    "Nombre de couples (contexte, cible) produits par ces phrases."
+    if isinstance(sentences, TokenStore):
+        return int(sentences.offsets[-1] - sentences.offsets[0]) + len(sentences)
+    return sum(map(len, sentences)) + len(sentences)
+
+
+def split_bounds(nb_sentences: int) -> tuple[int, int]:
+    "Fins des splits train (80%) et validation (10%) ; le reste est le test."
+    return int(0.8 * nb_sentences), int(0.9 * nb_sentences)
 
 
 class Datasets:
@@ -10,31 +96,35 @@ class Datasets:
     Construit les jeux de données d'entraînement, de test et de validation.
 
     Prend en paramètres une liste de phrases et la taille du contexte pour la prédiction.
+    Les ids sont stockés dans le plus petit type entier capable de représenter le
+    vocabulaire (ex: int16 pour 30000 tokens) ; ils sont convertis en int64 au
+    moment de la construction des minibatchs.
+
+    Si cache_dir est fourni et que les phrases proviennent du cache de Sentences,
+    les fenêtres sont écrites sur disque puis ouvertes avec torch.from_file, ce qui
+    permet à plusieurs processus de partager les mêmes pages.
+
+    Avec un vocabulary (voir vocab.Vocabulary), les phrases sont d'abord
+    converties en ids compacts : nb_tokens, pad_id, eos_id et les fenêtres sont
+    alors dans l'espace compact.
     """
 
     def _build_dataset(
         self,
-        sentences: list[list[int]],
+        sentences: list[list[int]] | TokenStore,
         context_size: int,
         pad_id: int,
         eos_id: int,
     ) -> tuple[torch.Tensor, torch.Tensor]:
-        X, Y = [], []
-        for sentence_ids in sentences:
-            context = [pad_id] * context_size
-            for id in sentence_ids + [eos_id]:
-                X.append(context)
-                Y.append(id)
-                context = context[1:] + [id]  # crop and append
-        X = torch.tensor(X)
-        Y = torch.tensor(Y)
-        return X, Y
+        return build_dataset(sentences, context_size, pad_id, eos_id, self.dtype)
 
     def __init__(
         self,
         sentences: Sentences | None,
         context_size: int,
         sentences_pickle_file: str | None = None,
+        cache_dir: str | None = None,
+        vocabulary: Vocabulary | None = None,
     ) -> None:
         if sentences is None:
             if sentences_pickle_file is None:
@@ -44,47 +134,82 @@ class Datasets:
             with open(sentences_pickle_file, "rb") as f:
                 sentences = pickle.load(f)
 
-        # train : 80%, validation : 10%, test : 10%
+        self.context_size = context_size
+        self.vocabulary = vocabulary
+        self.nb_tokens = sentences.nb_tokens if vocabulary is None else len(vocabulary)
+        self.dtype = smallest_int_dtype(self.nb_tokens)
+
         # NOTE: random shuffle is done in Sentences class
-        self.n1 = int(0.8 * sentences.nb_sentences)
-        self.n2 = int(0.9 * sentences.nb_sentences)
+        self.n1, self.n2 = split_bounds(sentences.nb_sentences)
 
-        pad_id = sentences.token_to_id("[PAD]")
-        eos_id = sentences.token_to_id("[EOS]")
+        self.pad_id = sentences.token_to_id("[PAD]")
+        self.eos_id = sentences.token_to_id("[EOS]")
+        if vocabulary is not None:
+            self.pad_id = vocabulary.compact_id(self.pad_id)
+            self.eos_id = vocabulary.compact_id(self.eos_id)
 
-        self.Xtr, self.Ytr = self._build_dataset(
-            sentences.token_ids_sentences[: self.n1],
-            context_size,
-            pad_id,
-            eos_id,
-        )
-        self.Xdev, self.Ydev = self._build_dataset(
-            sentences.token_ids_sentences[self.n1 : self.n2],
-            context_size,
-            pad_id,
-            eos_id,
-        )
-        self.Xte, self.Yte = self._build_dataset(
-            sentences.token_ids_sentences[self.n2 :], context_size, pad_id, eos_id
+        # Les phrases de chaque split sont contiguës : on construit toutes les
+        # fenêtres en une fois puis on découpe des vues.
+        windows = None
+        self.windows_file = None
+        store_key = getattr(sentences, "store_key", None)
+        if cache_dir is not None and store_key is not None:
+            name = f"{store_key}.ctx{context_size}"
+            if vocabulary is not None:
+                name += f".v{vocabulary.key()}"
+            windows = open_windows(cache_dir, name)
+            if windows is None:
+                save_windows(cache_dir, name, *self._build_all(sentences))
+                windows = open_windows(cache_dir, name)
+            self.windows_file = (cache_dir, name)
+        if windows is None:
+            windows = self._build_all(sentences)
+
+        t1 = _nb_targets(sentences.token_ids_sentences[: self.n1])
+        t2 = t1 + _nb_targets(sentences.token_ids_sentences[self.n1 : self.n2])
+        self.split_targets = (t1, t2)
+        self._set_splits(*windows)
+
+    def _set_splits(self, X: torch.Tensor, Y: torch.Tensor) -> None:
+        t1, t2 = self.split_targets
+        self.Xtr, self.Ytr = X[:t1], Y[:t1]
+        self.Xdev, self.Ydev = X[t1:t2], Y[t1:t2]
+        self.Xte, self.Yte = X[t2:], Y[t2:]
+
+    def __getstate__(self) -> dict:
+        # fenêtres en cache : on ne transmet que le nom du fichier, rouvert en
+        # memmap par le processus qui désérialise (ex: workers d'un pool)
+        state = dict(self.__dict__)
+        if self.windows_file is not None:
+            for name in ("Xtr", "Ytr", "Xdev", "Ydev", "Xte", "Yte"):
+                del state[name]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        if self.windows_file is not None:
+            self._set_splits(*open_windows(*self.windows_file))
+
+    def target_counts(self) -> torch.Tensor:
+        "Nombre d'occurrences de chaque token comme cible dans le jeu d'entraînement."
+        return torch.bincount(self.Ytr.long(), minlength=self.nb_tokens)
+
+    def _build_all(self, sentences: Sentences) -> tuple[torch.Tensor, torch.Tensor]:
+        token_ids = sentences.token_ids_sentences
+        if self.vocabulary is not None:
+            token_ids = self.vocabulary.encode_sentences(token_ids)
+        return self._build_dataset(
+            token_ids, self.context_size, self.pad_id, self.eos_id
         )
 
 
 if __name__ == "__main__":
-    # sentences = Sentences()
     import time
 
     t0 = time.time()
-    datasets = Datasets(
-        sentences=None, context_size=3, sentences_pickle_file="models/sentences.pkl"
-    )
+    sentences = Sentences(cache_dir="models/cache")
+    datasets = Datasets(sentences, context_size=3, cache_dir="models/cache")
     t1 = time.time()
     print(f"Time to load datasets: {t1 - t0:.2f} seconds")
     print("X training shape :", datasets.Xtr.shape)
     print("Y training shape :", datasets.Ytr.shape)
-
-    print("Saving datasets...")
-    t0 = time.time()
-    with open("models/datasets.pkl", "wb") as f:
-        pickle.dump(datasets, f)
-    t1 = time.time()
-    print(f"Time to save datasets: {t1 - t0:.2f} seconds")
@@ -0,0 +1,250 @@
+import os
+import socket
+import tempfile
+from types import SimpleNamespace
+
+import torch
+import torch.distributed as dist
+import torch.distributed.nn.functional as dist_nn
+import torch.multiprocessing as mp
+
+from .checkpoint import load_checkpoint, save_checkpoint
+from .datasets import Datasets
+from .ffn import BengioFFN
+from .optim import Optimizer, make_optimizer, make_schedule
+from .sampled import SampledSoftmax
+
+DEFAULT_BUCKET_SIZE = 25 * 2**20  # octets
+
+
+class SyncBatchNormFFN(BengioFFN):
+    """
+    BengioFFN dont la BatchNorm utilise les statistiques du minibatch global,
+    réparti sur tous les processus. Les réductions sont différentiables
+    (torch.distributed.nn), et les statistiques courantes restent identiques
+    sur tous les processus.
+    """
+
+    def _batch_stats(self, hpreact):
+        world_size = dist.get_world_size()
+        n = hpreact.shape[0] * world_size
+        mean = dist_nn.all_reduce(hpreact.sum(0, keepdim=True)) / n
+        var = dist_nn.all_reduce(((hpreact - mean) ** 2).sum(0, keepdim=True)) / (n - 1)
+        return mean, var.sqrt()
+
+
+class AllReduceOptimizer:
+    """
+    Moyenne les gradients entre processus avant de déléguer la mise à jour à
+    l'optimiseur. Les gradients sont regroupés en paquets d'au plus bucket_size
+    octets, réduits de façon asynchrone.
+    """
+
+    def __init__(self, optimizer: Optimizer, bucket_size: int = DEFAULT_BUCKET_SIZE):
+        self.optimizer = optimizer
+        self.bucket_size = bucket_size
+
+    def _buckets(self, grads: list[torch.Tensor]) -> list[list[torch.Tensor]]:
+        buckets, current, size = [], [], 0
+        for grad in grads:
+            if current and size + grad.nbytes > self.bucket_size:
+                buckets.append(current)
+                current, size = [], 0
+            current.append(grad)
+            size += grad.nbytes
+        if current:
+            buckets.append(current)
+        return buckets
+
+    @torch.no_grad()
+    def step(self, lr: float) -> None:
+        grads = [p.grad for p in self.optimizer.parameters if p.grad is not None]
+        if any(grad.is_sparse for grad in grads):
+            raise ValueError("Sparse gradients are not supported in distributed mode.")
+        world_size = dist.get_world_size()
+        pending = []
+        for bucket in self._buckets(grads):
+            flat = torch.cat([grad.flatten() for grad in bucket])
+            pending.append((bucket, flat, dist.all_reduce(flat, async_op=True)))
+        for bucket, flat, work in pending:
+            work.wait()
+            flat /= world_size
+            offset = 0
+            for grad in bucket:
+                grad.copy_(flat[offset : offset + grad.numel()].view_as(grad))
+                offset += grad.numel()
+        self.optimizer.step(lr)
+
+    def state_dict(self) -> dict:
+        return self.optimizer.state_dict()
+
+    def load_state_dict(self, state: dict) -> None:
+        self.optimizer.load_state_dict(state)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _worker(rank: int, world_size: int, port: int, datasets, config: dict, result: str):
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+    torch.set_num_threads(config["threads"])
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    try:
+        # même graine sur tous les processus : initialisation identique
+        g = torch.Generator().manual_seed(config["seed"])
+        resume = config["checkpoint"] if config["resume"] else None
+        if resume is not None and os.path.exists(resume):
+            state = load_checkpoint(resume, mmap=False)
+            nn = SyncBatchNormFFN.from_state_dict(state, g)
+        else:
+            state = None
+            nn = SyncBatchNormFFN(
+                config["e_dims"],
+                config["n_hidden"],
+                datasets.context_size,
+                config["nb_tokens"],
+                g,
+                **config["model"],
+            )
+        # puis un flux aléatoire propre à chaque processus pour les minibatchs
+        generators = None
+        if state is not None and len(state.get("rank_generators", [])) == world_size:
+            generators = state["rank_generators"][rank]
+            nn.g.set_state(generators[0])
+        else:
+            nn.g.manual_seed(config["seed"] + 1000 * (rank + 1) + nn.steps)
+
+        optimizer = AllReduceOptimizer(
+            make_optimizer(parameters=nn.parameters, **config["optimizer"])
+        )
+        if state is not None and "optimizer" in state:
+            optimizer.load_state_dict(state["optimizer"])
+        schedule = make_schedule(total_steps=config["max_steps"], **config["schedule"])
+        sampled_softmax = None
+        if config["sampled"] > 0:
+            sampled_softmax = SampledSoftmax(
+                datasets.target_counts(),
+                config["sampled"],
+                torch.Generator().manual_seed(config["seed"] + 1 + rank),
+            )
+            if generators is not None and generators[1] is not None:
+                sampled_softmax.g.set_state(generators[1])
+        checkpoint = None
+        if config["checkpoint"] is not None:
+
+            def checkpoint(nn, optimizer):
+                # tous les processus arrivent ici au même pas : le processus 0
+                # enregistre les générateurs de chacun pour une reprise exacte
+                sampled_state = None
+                if sampled_softmax is not None:
+                    sampled_state = sampled_softmax.g.get_state()
+                states = [None] * world_size
+                dist.all_gather_object(states, (nn.g.get_state(), sampled_state))
+                if rank == 0:
+                    save_checkpoint(
+                        config["checkpoint"],
+                        nn,
+                        optimizer,
+                        config["meta"],
+                        sampled_softmax,
+                        extra={"rank_generators": states},
+                    )
+
+        # chaque processus tire ses minibatchs dans sa part du jeu d'entraînement
+        shard = SimpleNamespace(
+            Xtr=datasets.Xtr[rank::world_size], Ytr=datasets.Ytr[rank::world_size]
+        )
+        nn.train(
+            shard,
+            max(0, config["max_steps"] - nn.steps),
+            config["batch"] // world_size,
+            sampled_softmax,
+            optimizer,
+            schedule,
+            checkpoint,
+            config["checkpoint_every"],
+            replacement=config["replacement"],
+            prefetch=config["prefetch"],
+            log_every=100 if rank == 0 else None,
+            autocast=config["autocast"],
+        )
+        if rank == 0:
+            save_checkpoint(result, nn)
+    finally:
+        dist.destroy_process_group()
+
+
+def train_distributed(
+    workers: int,
+    datasets: Datasets,
+    nb_tokens: int,
+    e_dims: int,
+    n_hidden: int,
+    seed: int,
+    max_steps: int,
+    mini_batch_size: int,
+    optimizer: dict | None = None,
+    schedule: dict | None = None,
+    sampled: int = 0,
+    checkpoint: str | None = None,
+    checkpoint_every: int = 1000,
+    resume: bool = False,
+    replacement: bool = True,
+    prefetch: int = 2,
+    meta: dict | None = None,
+    model: dict | None = None,
+    autocast: bool = False,
+) -> BengioFFN:
+    """
+    Entraînement data-parallel sur workers processus (backend gloo, CPU).
+
+    mini_batch_size est la taille du minibatch global : chaque processus en
+    traite mini_batch_size // workers. Les gradients sont moyennés entre
+    processus et la BatchNorm est calculée sur le minibatch global, ce qui
+    équivaut à un seul processus avec un minibatch de mini_batch_size.
+
+    optimizer et schedule sont les arguments de optim.make_optimizer et
+    optim.make_schedule (sans les paramètres ni le nombre de pas), model les
+    options de BengioFFN (init, activation, batchnorm). Renvoie le
+    réseau entraîné (celui du processus 0).
+    """
+    if mini_batch_size % workers != 0:
+        raise ValueError("mini_batch_size must be divisible by workers.")
+    config = {
+        "nb_tokens": nb_tokens,
+        "e_dims": e_dims,
+        "n_hidden": n_hidden,
+        "seed": seed,
+        "max_steps": max_steps,
+        "batch": mini_batch_size,
+        "optimizer": optimizer or {"name": "sgd"},
+        "schedule": schedule or {
+            "kind": "step",
+            "lr": 0.2,
+            "step_size": 100000,
+            "max_decays": 1,
+        },
+        "sampled": sampled,
+        "checkpoint": checkpoint,
+        "checkpoint_every": checkpoint_every,
+        "resume": resume,
+        "replacement": replacement,
+        "prefetch": prefetch,
+        "meta": meta or {},
+        "model": model or {},
+        "autocast": autocast,
+        # les threads intra-op sont partagés entre les processus
+        "threads": max(1, torch.get_num_threads() // workers),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        result = os.path.join(tmp, "result.pt")
+        mp.spawn(
+            _worker,
+            args=(workers, _free_port(), datasets, config, result),
+            nprocs=workers,
+        )
+        return BengioFFN.from_state_dict(load_checkpoint(result, mmap=False))
@@ -0,0 +1,143 @@
+import math
+
+import torch
+
+from .compact import CompactDatasets, CompactSplit
+
+# attributs de Datasets correspondant à chaque split
+SPLITS = {"train": ("Xtr", "Ytr"), "dev": ("Xdev", "Ydev"), "test": ("Xte", "Yte")}
+
+DEFAULT_VOCAB_CHUNK = 4096
+
+
+def perplexity(loss: float) -> float:
+    "exp(loss), infinie si elle dépasse le plus grand flottant (perte > ~709.8)."
+    try:
+        return math.exp(loss)
+    except OverflowError:
+        return math.inf
+
+
+def streaming_cross_entropy(
+    nn, h: torch.Tensor, Y: torch.Tensor, vocab_chunk: int = DEFAULT_VOCAB_CHUNK
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Entropie croisée par exemple et token prédit (argmax), sans matérialiser les
+    logits [n, nb_tokens] : le log-sum-exp est accumulé bloc de vocabulaire par
+    bloc de vocabulaire, la mémoire ne dépend donc que de vocab_chunk.
+    """
+    log_normalizer, prediction = streaming_log_normalizer(nn, h, vocab_chunk)
+    return log_normalizer - nn._target_logits(h, Y), prediction
+
+
+def streaming_log_normalizer(
+    nn, h: torch.Tensor, vocab_chunk: int = DEFAULT_VOCAB_CHUNK
+) -> tuple[torch.Tensor, torch.Tensor]:
+    "log-sum-exp des logits de chaque ligne de h et token prédit, par blocs."
+    n = h.shape[0]
+    running_max = torch.full((n,), float("-inf"))
+    running_sum = torch.zeros(n)
+    best = torch.full((n,), float("-inf"))
+    prediction = torch.zeros(n, dtype=torch.long)
+    for start in range(0, nn.nb_tokens, vocab_chunk):
+        logits = nn._output_logits(h, start, start + vocab_chunk)
+        chunk_max, chunk_arg = logits.max(dim=1)
+        new_max = torch.maximum(running_max, chunk_max)
+        running_sum = running_sum * torch.exp(running_max - new_max) + torch.exp(
+            logits - new_max[:, None]
+        ).sum(dim=1)
+        running_max = new_max
+        better = chunk_max > best
+        best = torch.where(better, chunk_max, best)
+        prediction = torch.where(better, chunk_arg + start, prediction)
+    return running_max + torch.log(running_sum), prediction
+
+
+def evaluate_tensors(
+    nn,
+    X: torch.Tensor,
+    Y: torch.Tensor,
+    batch_size: int = 1024,
+    vocab_chunk: int = DEFAULT_VOCAB_CHUNK,
+) -> dict[str, float]:
+    "Perte moyenne, perplexité et précision (top-1) sur les couples (X, Y)."
+    total_loss = torch.zeros((), dtype=torch.float64)
+    correct = torch.zeros((), dtype=torch.long)
+    n_samples = X.shape[0]
+    with torch.inference_mode():
+        for i in range(0, n_samples, batch_size):
+            Xb = X[i : i + batch_size].long()
+            Yb = Y[i : i + batch_size].long()
+            nll, prediction = streaming_cross_entropy(
+                nn, nn._eval_hidden(Xb), Yb, vocab_chunk
+            )
+            total_loss += nll.sum(dtype=torch.float64)
+            correct += (prediction == Yb).sum()
+    # une seule lecture des totaux par split
+    loss = total_loss.item() / n_samples if n_samples else float("nan")
+    return {
+        "loss": loss,
+        "perplexity": perplexity(loss),
+        "accuracy": correct.item() / n_samples if n_samples else float("nan"),
+        "nb_samples": n_samples,
+    }
+
+
+def evaluate_compact(
+    nn,
+    split: CompactSplit,
+    batch_size: int = 1024,
+    vocab_chunk: int = DEFAULT_VOCAB_CHUNK,
+) -> dict[str, float]:
+    """
+    Comme evaluate_tensors, à partir d'un split dédupliqué : une passe par
+    contexte distinct, la perte de chaque cible étant pondérée par son compte.
+    Les moyennes sont celles des couples d'origine.
+    """
+    total_loss = torch.zeros((), dtype=torch.float64)
+    correct = torch.zeros((), dtype=torch.long)
+    n_samples = split.nb_samples
+    with torch.inference_mode():
+        for i in range(0, len(split), batch_size):
+            ix = torch.arange(i, min(i + batch_size, len(split)))
+            h = nn._eval_hidden(split.contexts[ix].long())
+            log_normalizer, prediction = streaming_log_normalizer(nn, h, vocab_chunk)
+            rows, positions = split.pairs(ix)
+            targets = split.targets[positions].long()
+            counts = split.counts[positions]
+            nll = log_normalizer[rows] - nn._target_logits(h[rows], targets)
+            total_loss += (nll.double() * counts).sum()
+            correct += counts[prediction[rows] == targets].sum()
+    loss = total_loss.item() / n_samples if n_samples else float("nan")
+    return {
+        "loss": loss,
+        "perplexity": perplexity(loss),
+        "accuracy": correct.item() / n_samples if n_samples else float("nan"),
+        "nb_samples": n_samples,
+    }
+
+
+def evaluate(
+    nn,
+    datasets,
+    splits: tuple[str, ...] = ("train", "dev", "test"),
+    batch_size: int = 1024,
+    vocab_chunk: int = DEFAULT_VOCAB_CHUNK,
+) -> dict[str, dict[str, float]]:
+    """
+    Évalue le réseau sur plusieurs splits de datasets ("train", "dev", "test") en
+    un seul appel. Renvoie, pour chaque split, la perte moyenne, la perplexité et
+    la précision.
+    """
+    results = {}
+    for split in splits:
+        if isinstance(datasets, CompactDatasets):
+            results[split] = evaluate_compact(
+                nn, getattr(datasets, split), batch_size, vocab_chunk
+            )
+            continue
+        X_name, Y_name = SPLITS[split]
+        results[split] = evaluate_tensors(
+            nn, getattr(datasets, X_name), getattr(datasets, Y_name), batch_size, vocab_chunk
+        )
+    return results
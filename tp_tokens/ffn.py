@@ -1,102 +1,382 @@
-from typing import Generator
+from typing import Callable, Generator
 
 import torch
 import torch.nn.functional as F
 
+from .compact import CompactBatchLoader, CompactDatasets, CompactSplit, SoftTargets
 from .datasets import Datasets
+from .evaluation import evaluate, evaluate_compact, evaluate_tensors
+from .fused import FusedEngine
+from .inference import DEFAULT_MEMORY_BUDGET, ProjectionTables
+from .loader import BatchLoader
+from .metrics import TrainingMetrics
+from .optim import SGD, Optimizer, Schedule, make_schedule
+from .sampled import SampledSoftmax
+from .validation import PeriodicValidation
+
+
+def sample_next_token(
+    logits: torch.Tensor,
+    g,
+    temperature: float | torch.Tensor = 1.0,
+    top_k: int | None = None,
+    top_p: float | None = None,
+) -> torch.Tensor:
+    """
+    Tire un token par ligne de logits [n, nb_tokens].
+
+    temperature peut être un flottant ou un tenseur [n] (une valeur par ligne) ;
+    une température nulle donne un décodage glouton. top_k garde les k tokens les
+    plus probables, top_p le plus petit ensemble de probabilité cumulée >= top_p.
+    """
+    if isinstance(temperature, torch.Tensor):
+        temperature = temperature[:, None]
+    elif temperature == 0:
+        return logits.argmax(dim=1)
+    logits = logits / temperature
+    if top_k is not None and top_k < logits.shape[1]:
+        kth = torch.topk(logits, top_k, dim=1).values[:, -1:]
+        logits = logits.masked_fill(logits < kth, float("-inf"))
+    probs = F.softmax(logits, dim=1)
+    if top_p is not None and top_p < 1.0:
+        sorted_probs, sorted_ix = probs.sort(dim=1, descending=True)
+        # on garde toujours le token le plus probable
+        removed = sorted_probs.cumsum(dim=1) - sorted_probs > top_p
+        sorted_probs = sorted_probs.masked_fill(removed, 0.0)
+        probs = torch.zeros_like(probs).scatter_(1, sorted_ix, sorted_probs)
+    return torch.multinomial(probs, num_samples=1, generator=g).squeeze(1)
+
+
+# non-linéarités de la couche cachée et gain associé pour l'initialisation
+ACTIVATIONS = {
+    "tanh": (torch.tanh, 5 / 3),
+    "relu": (torch.relu, 2**0.5),
+    "gelu": (F.gelu, 2**0.5),
+    "linear": (lambda x: x, 1.0),
+}
+INIT_SCHEMES = ("kaiming", "xavier", "normal")
 
 
 class BengioFFN:
-    def __init__(self, e_dims, n_hidden, context_size, nb_tokens, g):
+    """
+    Réseau de Bengio et al. (2003) avec BatchNorm.
+
+    init choisit l'échelle de W1 et W2 : "kaiming" (gain de l'activation /
+    sqrt(fan_in), W2 réduit à 0.01), "xavier" (sqrt(2 / (fan_in + fan_out))) ou
+    "normal" (gaussienne non réduite). activation est une clé de ACTIVATIONS.
+    Sans batchnorm, la couche cachée est gain * (embcat @ W1) + biais et les
+    statistiques courantes restent à 0 et 1.
+    """
+
+    def __init__(
+        self,
+        e_dims,
+        n_hidden,
+        context_size,
+        nb_tokens,
+        g,
+        init="kaiming",
+        activation="tanh",
+        batchnorm=True,
+    ):
+        if init not in INIT_SCHEMES:
+            raise ValueError(f"Unknown init scheme {init!r}.")
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"Unknown activation {activation!r}.")
         self.g = g
         self.nb_tokens = nb_tokens
         self.e_dims = e_dims
         self.n_hidden = n_hidden
         self.context_size = context_size
+        self.init = init
+        self.activation = activation
+        self.batchnorm = batchnorm
         self.create_network()
 
     def layers(self):
         self.C = torch.randn((self.nb_tokens, self.e_dims), generator=self.g)
         fan_in = self.context_size * self.e_dims
-        tanh_gain = 5 / 3
+        if self.init == "kaiming":
+            w1_scale = ACTIVATIONS[self.activation][1] / (fan_in**0.5)
+            w2_scale = 0.01  # Pour l'entropie
+        elif self.init == "xavier":
+            w1_scale = (2 / (fan_in + self.n_hidden)) ** 0.5
+            w2_scale = (2 / (self.n_hidden + self.nb_tokens)) ** 0.5
+        else:
+            w1_scale = w2_scale = 1.0
         self.W1 = torch.randn(
             (self.context_size * self.e_dims, self.n_hidden), generator=self.g
-        ) * (tanh_gain / (fan_in**0.5))
+        ) * w1_scale
         self.W2 = (
-            torch.randn((self.n_hidden, self.nb_tokens), generator=self.g) * 0.01
-        )  # Pour l'entropie
+            torch.randn((self.n_hidden, self.nb_tokens), generator=self.g) * w2_scale
+        )
         self.b2 = torch.randn(self.nb_tokens, generator=self.g) * 0
         self.bngain = torch.ones((1, self.n_hidden))
         self.bnbias = torch.zeros((1, self.n_hidden))
 
     def create_network(self):
         self.layers()
+        self.bnmean_running = torch.zeros((1, self.n_hidden))
+        if self.batchnorm:
+            self.bnstd_running = torch.zeros((1, self.n_hidden))
+        else:
+            self.bnstd_running = torch.ones((1, self.n_hidden))
+        self._init_state()
+
+    def _init_state(self):
         self.loss = None
         self.steps = 0
+        self.tables = None
+        # gradient creux pour C : seules les lignes du minibatch sont mises à jour
+        self.sparse_embeddings = False
         self.parameters = [self.C, self.W1, self.W2, self.b2, self.bngain, self.bnbias]
         self.nb_parameters = sum(
             p.nelement() for p in self.parameters
         )  # number of parameters in total
         for p in self.parameters:
             p.requires_grad = True
-        self.bnmean_running = torch.zeros((1, self.n_hidden))
-        self.bnstd_running = torch.zeros((1, self.n_hidden))
 
-    def forward(self, X, Y):
-        self.emb = self.C[X]  # Embed characters into vectors
+    # tenseurs sauvegardés dans les checkpoints
+    state_names = (
+        "C",
+        "W1",
+        "W2",
+        "b2",
+        "bngain",
+        "bnbias",
+        "bnmean_running",
+        "bnstd_running",
+    )
+
+    def state_dict(self) -> dict:
+        state = {name: getattr(self, name).detach() for name in self.state_names}
+        state["config"] = {
+            "e_dims": self.e_dims,
+            "n_hidden": self.n_hidden,
+            "context_size": self.context_size,
+            "nb_tokens": self.nb_tokens,
+            "steps": self.steps,
+            "init": self.init,
+            "activation": self.activation,
+            "batchnorm": self.batchnorm,
+        }
+        state["generator"] = self.g.get_state()
+        return state
+
+    def load_state_dict(self, state: dict) -> None:
+        """
+        Remplace les poids par ceux de state (sans copie : les tenseurs d'un
+        checkpoint ouvert en memmap restent projetés depuis le fichier).
+        """
+        for name in self.state_names:
+            setattr(self, name, state[name])
+        self._init_state()
+        self.steps = state["config"]["steps"]
+        self.g.set_state(state["generator"])
+
+    @classmethod
+    def from_state_dict(cls, state: dict, g=None) -> "BengioFFN":
+        "Construit un réseau à partir d'un checkpoint, sans initialisation aléatoire."
+        config = state["config"]
+        nn = cls.__new__(cls)
+        nn.g = torch.Generator() if g is None else g
+        nn.nb_tokens = config["nb_tokens"]
+        nn.e_dims = config["e_dims"]
+        nn.n_hidden = config["n_hidden"]
+        nn.context_size = config["context_size"]
+        nn.init = config.get("init", "kaiming")
+        nn.activation = config.get("activation", "tanh")
+        nn.batchnorm = config.get("batchnorm", True)
+        nn.load_state_dict(state)
+        return nn
+
+    def forward(self, X, Y, sampled_softmax: SampledSoftmax | None = None):
+        if self.sparse_embeddings:
+            self.emb = F.embedding(X, self.C, sparse=True)
+        else:
+            self.emb = self.C[X]  # Embed characters into vectors
         self.embcat = self.emb.view(self.emb.shape[0], -1)  # Concatenate the vectors
         # Linear layer
         self.hpreact = self.embcat @ self.W1  # hidden layer pre-activation
         # BatchNorm layer
-        self.bnmeani = self.hpreact.mean(0, keepdim=True)
-        self.bnstdi = self.hpreact.std(0, keepdim=True)
-        self.hpreact = (
-            self.bngain * (self.hpreact - self.bnmeani) / self.bnstdi + self.bnbias
-        )
+        if self.batchnorm:
+            self.bnmeani, self.bnstdi = self._batch_stats(self.hpreact)
+            self.hpreact = (
+                self.bngain * (self.hpreact - self.bnmeani) / self.bnstdi + self.bnbias
+            )
+        else:
+            self.hpreact = self.bngain * self.hpreact + self.bnbias
         # Non linearity
-        self.h = torch.tanh(self.hpreact)  # hidden layer
-        self.logits = self.h @ self.W2 + self.b2  # output layer
-        self.loss = F.cross_entropy(self.logits, Y)  # loss function
+        self.h = self._activate(self.hpreact)  # hidden layer
+        if isinstance(Y, SoftTargets):
+            if sampled_softmax is not None:
+                raise ValueError("Sampled softmax does not support soft targets.")
+            self.logits = self.h @ self.W2 + self.b2  # output layer
+            self.loss = self._soft_cross_entropy(self.logits, Y)
+        elif sampled_softmax is None:
+            self.logits = self.h @ self.W2 + self.b2  # output layer
+            self.loss = F.cross_entropy(self.logits, Y)  # loss function
+        else:
+            # sortie restreinte à la cible et aux tokens échantillonnés
+            self.logits = None
+            self.loss = sampled_softmax.loss(self.h, Y, self.W2, self.b2)
         # mean, std
+        if not self.batchnorm:
+            return
         with torch.no_grad():
             self.bnmean_running = 0.999 * self.bnmean_running + 0.001 * self.bnmeani
             self.bnstd_running = 0.999 * self.bnstd_running + 0.001 * self.bnstdi
 
+    @staticmethod
+    def _soft_cross_entropy(logits, Y: SoftTargets) -> torch.Tensor:
+        "Entropie croisée moyenne avec des distributions cibles creuses."
+        log_probs = F.log_softmax(logits, dim=1)
+        return -(Y.weights * log_probs[Y.rows, Y.targets]).sum() / logits.shape[0]
+
+    def _batch_stats(self, hpreact) -> tuple[torch.Tensor, torch.Tensor]:
+        "Moyenne et écart-type du minibatch pour la BatchNorm."
+        return hpreact.mean(0, keepdim=True), hpreact.std(0, keepdim=True)
+
+    def _activate(self, hpreact) -> torch.Tensor:
+        return ACTIVATIONS[self.activation][0](hpreact)
+
     def backward(self):
         for p in self.parameters:
             p.grad = None
         if self.loss is not None:
             self.loss.backward()
 
-    def train(self, datasets: Datasets, max_steps, mini_batch_size):
-        lossi = []
-        for i in range(max_steps):
-            # minibatch construct
-            ix = torch.randint(
-                0, datasets.Xtr.shape[0], (mini_batch_size,), generator=self.g
+    def train(
+        self,
+        datasets: Datasets | CompactDatasets,
+        max_steps,
+        mini_batch_size,
+        sampled_softmax: SampledSoftmax | None = None,
+        optimizer: Optimizer | None = None,
+        schedule: Schedule | None = None,
+        checkpoint: Callable[["BengioFFN", Optimizer], None] | None = None,
+        checkpoint_every: int = 1000,
+        replacement: bool = True,
+        prefetch: int = 2,
+        log_every: int | None = 100,
+        metrics: TrainingMetrics | None = None,
+        autocast: bool = False,
+        fused: bool = False,
+        validation: PeriodicValidation | None = None,
+    ):
+        """
+        Entraîne le réseau pendant max_steps pas.
+
+        Par défaut : SGD sans momentum, lr 0.2 divisé par 10 une seule fois, après
+        100000 pas. Le pas global (self.steps) est utilisé par le schedule, ce qui
+        permet de reprendre un entraînement. Si checkpoint est fourni, il est
+        appelé avec le réseau et l'optimiseur tous les checkpoint_every pas et en
+        fin d'entraînement.
+
+        Les minibatchs sont préparés en arrière-plan (voir loader.BatchLoader),
+        avec remise ou par époques selon replacement. Avec un CompactDatasets, la
+        perte est l'entropie croisée pondérée par les comptes des cibles de
+        chaque contexte (voir compact.CompactBatchLoader). La perte est affichée tous
+        les log_every pas ; renvoie le log10 de la perte à chaque pas. metrics
+        active l'instrumentation (voir metrics.TrainingMetrics).
+
+        Avec autocast, la passe avant est calculée en bfloat16 (torch.autocast) ;
+        les poids et leurs mises à jour restent en float32. Avec fused, les passes
+        avant et arrière sont celles, écrites à la main, de fused.FusedEngine
+        (softmax complète et cibles simples uniquement).
+
+        validation évalue périodiquement le split dev en arrière-plan, arrête
+        l'entraînement selon sa patience et restaure les meilleurs poids (voir
+        validation.PeriodicValidation) ; lossi est alors limité aux pas effectués
+        et la courbe de dev est dans validation.curve. Si les meilleurs poids ont
+        été restaurés, checkpoint est appelé une dernière fois avec eux (les
+        moments de l'optimiseur et steps restent ceux du dernier pas ;
+        validation.best_step donne le pas des poids).
+        """
+        if optimizer is None:
+            optimizer = SGD(self.parameters)
+        if schedule is None:
+            schedule = make_schedule(
+                "step", 0.2, max_steps, step_size=100000, max_decays=1
+            )
+        self.tables = None  # les poids vont changer
+        engine = None
+        if fused:
+            if sampled_softmax is not None or autocast:
+                raise ValueError("fused does not support sampled softmax or autocast.")
+            if isinstance(datasets, CompactDatasets):
+                raise ValueError("fused does not support compact datasets.")
+            engine = FusedEngine(self)
+        if isinstance(datasets, CompactDatasets):
+            batches = CompactBatchLoader(
+                datasets.train,
+                mini_batch_size,
+                self.g,
+                max_steps,
+                replacement=replacement,
+                prefetch=prefetch,
+            )
+        else:
+            batches = BatchLoader(
+                datasets.Xtr,
+                datasets.Ytr,
+                mini_batch_size,
+                self.g,
+                max_steps,
+                replacement=replacement,
+                prefetch=prefetch,
             )
-            Xb, Yb = datasets.Xtr[ix], datasets.Ytr[ix]
+        # les pertes restent sur tenseur : pas de synchronisation à chaque pas
+        losses = torch.empty(max_steps)
+        if metrics is not None:
+            metrics.start(self, mini_batch_size)
+        if validation is not None:
+            validation.start(self)
+        nb_steps = max_steps
+        for i, (Xb, Yb) in enumerate(batches):
+            if metrics is not None:
+                metrics.mark("batch")
 
             # forward pass
-            self.forward(Xb, Yb)
+            if engine is not None:
+                engine.forward(Xb, Yb)
+            else:
+                with torch.autocast("cpu", dtype=torch.bfloat16, enabled=autocast):
+                    self.forward(Xb, Yb, sampled_softmax)
+            if metrics is not None:
+                metrics.mark("forward")
 
             # backward pass
-            self.backward()
+            if engine is not None:
+                engine.backward()
+            else:
+                self.backward()
+            if metrics is not None:
+                metrics.mark("backward")
 
             # update
-            lr = 0.2 if i < 100000 else 0.02  # step learning rate decay
-            self.update_grad(lr)
+            lr = schedule(self.steps)
+            optimizer.step(lr)
+            self.steps += 1
+            if metrics is not None:
+                metrics.mark("update")
+                metrics.step(self)
 
             # track stats
-            if i % 100 == 0:
-                print(f"{i:7d}/{max_steps:7d}: {self.loss.item():.4f}")
-            lossi.append(self.loss.log10().item())
-        self.steps += max_steps
-        return lossi
-
-    def update_grad(self, lr):
-        for p in self.parameters:
-            p.data += -lr * p.grad
+            losses[i] = self.loss.detach()
+            if log_every and i % log_every == 0:
+                print(f"{i:7d}/{max_steps:7d}: {losses[i].item():.4f}")
+            if checkpoint is not None and self.steps % checkpoint_every == 0:
+                checkpoint(self, optimizer)
+            if validation is not None and validation.step(self):
+                nb_steps = i + 1
+                break
+        if metrics is not None:
+            metrics.close(self)
+        restored = validation is not None and validation.close(self)
+        if checkpoint is not None and (restored or self.steps % checkpoint_every != 0):
+            checkpoint(self, optimizer)
+        return losses[:nb_steps].log10().tolist()
 
     # @torch.no_grad()  # this decorator disables gradient tracking
     # def compute_loss(self, X, Y):
@@ -113,35 +393,21 @@ class BengioFFN:
     #     return loss
 
     @torch.no_grad()
-    def compute_loss(self, X, Y, batch_size=1024) -> float:
+    def compute_loss(self, X, Y=None, batch_size=1024) -> float:
         """
         Computes the loss in batches to avoid OOM (Out Of Memory) errors.
+        The softmax normalisation is streamed over vocabulary chunks.
+        X may also be a CompactSplit (Y is then unused): same mean loss.
         """
-        total_loss = 0.0
-        n_samples = X.shape[0]
-
-        # Iterate over the data in chunks
-        for i in range(0, n_samples, batch_size):
-            Xb = X[i : i + batch_size]
-            Yb = Y[i : i + batch_size]
-
-            # Forward pass (same logic as before, but on a subset)
-            emb = self.C[Xb]
-            embcat = emb.view(emb.shape[0], -1)
-            hpreact = embcat @ self.W1
-            hpreact = (
-                self.bngain * (hpreact - self.bnmean_running) / self.bnstd_running
-                + self.bnbias
-            )
-            h = torch.tanh(hpreact)
-            logits = h @ self.W2 + self.b2
-
-            # Use reduction='sum' to aggregate properly
-            loss = F.cross_entropy(logits, Yb, reduction="sum")
-            total_loss += loss.item()
+        if isinstance(X, CompactSplit):
+            return evaluate_compact(self, X, batch_size)["loss"]
+        return evaluate_tensors(self, X, Y, batch_size)["loss"]
 
-        # Return the mean loss over all samples
-        return total_loss / n_samples
+    def evaluate(
+        self, datasets: Datasets | CompactDatasets, splits=("train", "dev", "test"), batch_size=1024
+    ) -> dict[str, dict[str, float]]:
+        "Perte, perplexité et précision sur plusieurs splits (voir evaluation.evaluate)."
+        return evaluate(self, datasets, splits, batch_size)
 
     @torch.no_grad()
     def training_loss(self, datasets: Datasets):
@@ -158,20 +424,50 @@ class BengioFFN:
         loss = self.compute_loss(datasets.Xdev, datasets.Ydev)
         return loss
 
+    def enable_tables(self, memory_budget: int = DEFAULT_MEMORY_BUDGET) -> bool:
+        """
+        Précalcule les tables de projection utilisées en inférence (voir
+        inference.ProjectionTables). Si elles dépassent memory_budget octets, le
+        calcul direct est conservé. Renvoie True si les tables sont actives.
+        """
+        if ProjectionTables.nbytes(self) > memory_budget:
+            self.tables = None
+        else:
+            self.tables = ProjectionTables(self)
+        return self.tables is not None
+
+    @torch.no_grad()
+    def _eval_hidden(self, X) -> torch.Tensor:
+        "Couche cachée en mode évaluation (statistiques BatchNorm courantes)."
+        if self.tables is not None:
+            return self.tables.hidden(X)
+        emb = self.C[X]
+        embcat = emb.view(emb.shape[0], -1)
+        hpreact = embcat @ self.W1
+        hpreact = (
+            self.bngain * (hpreact - self.bnmean_running) / self.bnstd_running
+            + self.bnbias
+        )
+        return self._activate(hpreact)
+
+    def _output_logits(self, h, start=0, stop=None) -> torch.Tensor:
+        "Logits des tokens start..stop pour la couche cachée h."
+        return h @ self.W2[:, start:stop] + self.b2[start:stop]
+
+    def _target_logits(self, h, Y) -> torch.Tensor:
+        "Logit du token Y[i] pour chaque ligne h[i]."
+        return (h * self.W2[:, Y].T).sum(dim=1) + self.b2[Y]
+
+    @torch.no_grad()
+    def _eval_logits(self, X) -> torch.Tensor:
+        return self._output_logits(self._eval_hidden(X))
+
     @torch.no_grad()
     def generate_sentence(self, pad_id: int, eos_id: int, g) -> list[int]:
         out = []
         context = [pad_id] * self.context_size
         while True:
-            emb = self.C[torch.tensor([context])]
-            embcat = emb.view(1, -1)
-            hpreact = embcat @ self.W1
-            hpreact = (
-                self.bngain * (hpreact - self.bnmean_running) / self.bnstd_running
-                + self.bnbias
-            )
-            h = torch.tanh(hpreact)
-            logits = h @ self.W2 + self.b2
+            logits = self._eval_logits(torch.tensor([context]))
             probs = F.softmax(logits, dim=1)
             # Sample from the probability distribution
             ix = torch.multinomial(probs, num_samples=1, generator=g).item()
@@ -186,13 +482,65 @@ class BengioFFN:
 
         return out
 
+    @torch.no_grad()
+    def generate_batch(
+        self,
+        n: int,
+        pad_id: int,
+        eos_id: int,
+        g,
+        temperature: float = 1.0,
+        top_k: int | None = None,
+        top_p: float | None = None,
+        max_length: int | None = None,
+        compact: bool = True,
+    ) -> list[list[int]]:
+        """
+        Génère n phrases en faisant avancer les n contextes ensemble.
+
+        Une ligne est retirée dès qu'elle émet [EOS] ; avec compact=True les lignes
+        terminées sont supprimées du batch, sinon elles sont seulement masquées.
+        max_length limite le nombre de tokens générés par phrase.
+        """
+        contexts = torch.full((n, self.context_size), pad_id, dtype=torch.long)
+        rows = torch.arange(n)  # phrase associée à chaque ligne du batch
+        finished = torch.zeros(n, dtype=torch.bool)
+        emitted_rows, emitted_ids = [], []
+        step = 0
+        while rows.numel() > 0 and (max_length is None or step < max_length):
+            logits = self._eval_logits(contexts)
+            ix = sample_next_token(logits, g, temperature, top_k, top_p)
+            contexts = torch.cat([contexts[:, 1:], ix[:, None]], dim=1)
+            done = ix == eos_id
+            if compact:
+                emitted_rows.append(rows)
+                emitted_ids.append(ix)
+                if done.any():
+                    keep = ~done
+                    rows, contexts = rows[keep], contexts[keep]
+            else:
+                emitted_rows.append(rows[~finished])
+                emitted_ids.append(ix[~finished])
+                finished |= done
+                if finished.all():
+                    break
+            step += 1
+
+        if not emitted_ids:
+            return [[] for _ in range(n)]
+        rows, ids = torch.cat(emitted_rows), torch.cat(emitted_ids)
+        keep = ids != eos_id
+        rows, ids = rows[keep], ids[keep]
+        order = torch.argsort(rows, stable=True)
+        counts = torch.bincount(rows, minlength=n)
+        return [t.tolist() for t in torch.split(ids[order], counts.tolist())]
+
     @torch.no_grad()
     def generate_sentences(
-        self, n, pad_id: int, eos_id: int, g
+        self, n, pad_id: int, eos_id: int, g, **kwargs
     ) -> Generator[list[int], None, None]:
-        "Génère n mots."
-        for _ in range(n):
-            yield self.generate_sentence(pad_id, eos_id, g)
+        "Génère n phrases (en un seul batch, voir generate_batch)."
+        yield from self.generate_batch(n, pad_id, eos_id, g, **kwargs)
 
     def __repr__(self):
         repr = []
@@ -201,6 +549,8 @@ class BengioFFN:
         repr.append(f'  e_dims="{self.e_dims}"')
         repr.append(f'  n_hidden="{self.n_hidden}"')
         repr.append(f'  context_size="{self.context_size}"')
+        repr.append(f'  activation="{self.activation}"')
+        repr.append(f'  batchnorm="{self.batchnorm}"')
         repr.append(f'  loss="{self.loss}"')
         repr.append(f'  steps="{self.steps}"')
         repr.append(f'  nb_parameters="{self.nb_parameters}"/>')
@@ -0,0 +1,135 @@
+import torch
+
+# activations dont la dérivée s'exprime à partir de la sortie h
+FUSED_ACTIVATIONS = ("tanh", "relu", "linear")
+
+
+class FusedEngine:
+    """
+    Passes avant et arrière écrites à la main pour BengioFFN (embedding, linéaire,
+    BatchNorm, activation, linéaire, entropie croisée), sans graphe autograd.
+
+    - softmax et entropie croisée fusionnées : les logits sont transformés sur
+      place en probabilités, puis en gradient (probs - onehot) / B ;
+    - BatchNorm (écart-type non biaisé, comme forward) en forme close :
+      dx = (dx̂ - mean(dx̂) - x̂ · Σ(dx̂ · x̂) / (B - 1)) / σ, avec dx̂ = gain · dy ;
+    - gradient de C par index_add_ sur les seules lignes du minibatch (ou
+      gradient creux si nn.sparse_embeddings) ;
+    - tous les intermédiaires et gradients sont des tampons réutilisés d'un pas
+      à l'autre (réalloués si la taille du minibatch change).
+
+    Les gradients sont écrits dans p.grad : l'optimiseur s'utilise comme avec
+    backward.
+    """
+
+    def __init__(self, nn) -> None:
+        if nn.activation not in FUSED_ACTIVATIONS:
+            raise ValueError(f"Activation {nn.activation!r} is not supported.")
+        self.nn = nn
+        self.batch_size = None
+        self.touched = None  # lignes de C.grad écrites au pas précédent
+
+    def _allocate(self, batch_size: int) -> None:
+        nn = self.nn
+        n_in = nn.context_size * nn.e_dims
+        self.batch_size = batch_size
+        self.rows = torch.arange(batch_size)
+        self.emb = torch.empty(batch_size * nn.context_size, nn.e_dims)
+        self.hpreact = torch.empty(batch_size, nn.n_hidden)
+        self.xhat = torch.empty(batch_size, nn.n_hidden)
+        self.h = torch.empty(batch_size, nn.n_hidden)
+        self.dh = torch.empty(batch_size, nn.n_hidden)
+        self.tmp = torch.empty(batch_size, nn.n_hidden)
+        self.logits = torch.empty(batch_size, nn.nb_tokens)
+        self.demb = torch.empty(batch_size, n_in)
+        self.grads = {
+            "C": torch.zeros(nn.nb_tokens, nn.e_dims),
+            "W1": torch.empty(n_in, nn.n_hidden),
+            "W2": torch.empty(nn.n_hidden, nn.nb_tokens),
+            "b2": torch.empty(nn.nb_tokens),
+            "bngain": torch.empty(1, nn.n_hidden),
+            "bnbias": torch.empty(1, nn.n_hidden),
+        }
+        self.touched = None
+
+    @torch.no_grad()
+    def forward(self, X: torch.Tensor, Y: torch.Tensor) -> None:
+        "Passe avant : renseigne nn.loss et met à jour les statistiques courantes."
+        nn = self.nn
+        B = X.shape[0]
+        if B != self.batch_size:
+            self._allocate(B)
+        self.X, self.Y = X, Y
+        torch.index_select(nn.C, 0, X.view(-1), out=self.emb)
+        torch.mm(self.emb.view(B, -1), nn.W1, out=self.hpreact)
+        if nn.batchnorm:
+            mean = self.hpreact.mean(0, keepdim=True)
+            torch.sub(self.hpreact, mean, out=self.xhat)
+            torch.mul(self.xhat, self.xhat, out=self.tmp)
+            self.std = (self.tmp.sum(0, keepdim=True) / (B - 1)).sqrt_()
+            self.xhat.div_(self.std)
+            nn.bnmean_running = 0.999 * nn.bnmean_running + 0.001 * mean
+            nn.bnstd_running = 0.999 * nn.bnstd_running + 0.001 * self.std
+        else:
+            self.xhat.copy_(self.hpreact)
+        torch.addcmul(nn.bnbias, nn.bngain, self.xhat, out=self.h)
+        if nn.activation == "tanh":
+            self.h.tanh_()
+        elif nn.activation == "relu":
+            self.h.relu_()
+        torch.addmm(nn.b2, self.h, nn.W2, out=self.logits)
+
+        # softmax sur place, perte = log-sum-exp - logit de la cible
+        target = self.logits.gather(1, Y[:, None])
+        top = self.logits.amax(1, keepdim=True)
+        self.logits.sub_(top).exp_()
+        total = self.logits.sum(1, keepdim=True)
+        self.logits.div_(total)
+        nn.loss = (top + total.log_() - target).mean()
+
+    @torch.no_grad()
+    def backward(self) -> None:
+        "Passe arrière : écrit les gradients de nn.parameters dans p.grad."
+        nn = self.nn
+        B, grads = self.batch_size, self.grads
+        X = self.X.view(-1)
+
+        dlogits = self.logits  # probabilités -> gradient des logits
+        dlogits[self.rows, self.Y] -= 1
+        dlogits.div_(B)
+        torch.mm(self.h.T, dlogits, out=grads["W2"])
+        torch.sum(dlogits, 0, out=grads["b2"])
+        torch.mm(dlogits, nn.W2.T, out=self.dh)
+
+        if nn.activation == "tanh":
+            torch.mul(self.h, self.h, out=self.tmp)
+            self.dh.mul_(self.tmp.neg_().add_(1))
+        elif nn.activation == "relu":
+            self.dh.mul_(self.h > 0)
+        torch.mul(self.dh, self.xhat, out=self.tmp)
+        torch.sum(self.tmp, 0, keepdim=True, out=grads["bngain"])
+        torch.sum(self.dh, 0, keepdim=True, out=grads["bnbias"])
+
+        dxhat = self.dh.mul_(nn.bngain)
+        if nn.batchnorm:
+            # Σ(dx̂ · x̂) = gain · Σ(dy · x̂) : déjà calculé pour le gradient du gain
+            projection = nn.bngain * grads["bngain"] / (B - 1)
+            dxhat.sub_(dxhat.mean(0, keepdim=True))
+            dxhat.sub_(torch.mul(self.xhat, projection, out=self.tmp))
+            dxhat.div_(self.std)
+        torch.mm(self.emb.view(B, -1).T, dxhat, out=grads["W1"])
+        torch.mm(dxhat, nn.W1.T, out=self.demb)
+
+        demb = self.demb.view(-1, nn.e_dims)
+        if nn.sparse_embeddings:
+            nn.C.grad = torch.sparse_coo_tensor(
+                X[None, :], demb, nn.C.shape, check_invariants=False
+            )
+        else:
+            if self.touched is not None:
+                grads["C"].index_fill_(0, self.touched, 0.0)
+            grads["C"].index_add_(0, X, demb)
+            self.touched = X
+            nn.C.grad = grads["C"]
+        for name in ("W1", "W2", "b2", "bngain", "bnbias"):
+            getattr(nn, name).grad = grads[name]
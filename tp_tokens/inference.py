@@ -0,0 +1,46 @@
+import torch
+import torch.nn.functional as F
+
+DEFAULT_MEMORY_BUDGET = 256 * 2**20  # octets
+
+
+class ProjectionTables:
+    """
+    Tables de projection précalculées pour l'inférence.
+
+    En évaluation, embcat @ W1 est la somme sur les positions i de C[x_i] @ W1_i,
+    où W1_i est le bloc de W1 correspondant à la position i. En repliant la
+    BatchNorm (statistiques courantes, gain et biais) dans ces produits, la
+    pré-activation de la couche cachée se réduit à context_size lectures dans des
+    tables [nb_tokens, n_hidden] suivies d'une somme.
+
+    Les tables sont figées : elles doivent être reconstruites si le modèle change.
+    """
+
+    def __init__(self, model) -> None:
+        with torch.no_grad():
+            scale = model.bngain / model.bnstd_running  # [1, n_hidden]
+            W1 = model.W1.view(model.context_size, model.e_dims, model.n_hidden)
+            tables = torch.einsum("ve,peh->pvh", model.C, W1) * scale
+            # [context_size * nb_tokens, n_hidden] : ligne i * nb_tokens + id
+            self.tables = tables.reshape(-1, model.n_hidden).contiguous()
+            self.offset = model.bnbias - model.bnmean_running * scale
+        self.nb_tokens = model.nb_tokens
+        self.activate = model._activate
+        self.position_offsets = torch.arange(model.context_size) * model.nb_tokens
+
+    @staticmethod
+    def nbytes(model) -> int:
+        "Taille des tables pour ce modèle, en octets."
+        return (
+            model.context_size
+            * model.nb_tokens
+            * model.n_hidden
+            * model.C.element_size()
+        )
+
+    @torch.no_grad()
+    def hidden(self, X: torch.Tensor) -> torch.Tensor:
+        "Couche cachée pour des contextes X [n, context_size]."
+        hpreact = F.embedding_bag(X + self.position_offsets, self.tables, mode="sum")
+        return self.activate(hpreact + self.offset)
@@ -0,0 +1,110 @@
+import queue
+import threading
+from typing import Iterator
+
+import torch
+
+
+class BatchLoader:
+    """
+    Fournit nb_batches minibatchs (Xb, Yb), convertis en int64.
+
+    Avec replacement=True, les indices sont tirés avec remise à chaque pas
+    (torch.randint), comme dans la boucle d'entraînement d'origine. Sinon, les
+    exemples sont parcourus par époques : une permutation aléatoire par époque,
+    découpée en minibatchs (la fin d'une époque est complétée par le début de la
+    suivante).
+
+    Si prefetch > 0, les prefetch minibatchs suivants sont préparés par un thread
+    d'arrière-plan pendant que le pas courant s'exécute. Les tirages utilisent
+    une copie de g ; l'état de cette copie après chaque minibatch est recopié
+    dans g quand le minibatch est fourni. g est donc exactement dans l'état
+    qu'il aurait sans prefetch (un checkpoint pris entre deux pas permet une
+    reprise identique) et n'est lu ou modifié que par le thread consommateur.
+    """
+
+    def __init__(
+        self,
+        X: torch.Tensor,
+        Y: torch.Tensor,
+        batch_size: int,
+        g: torch.Generator,
+        nb_batches: int,
+        replacement: bool = True,
+        prefetch: int = 2,
+    ) -> None:
+        self.X = X
+        self.Y = Y
+        self.batch_size = batch_size
+        self.g = g
+        self.nb_batches = nb_batches
+        self.replacement = replacement
+        self.prefetch = prefetch
+        self.nb_rows = X.shape[0]  # exemples parmi lesquels tirer
+
+    def _indices(self, g: torch.Generator) -> Iterator[torch.Tensor]:
+        n = self.nb_rows
+        if self.replacement:
+            for _ in range(self.nb_batches):
+                yield torch.randint(0, n, (self.batch_size,), generator=g)
+            return
+        pending = torch.empty(0, dtype=torch.long)
+        for _ in range(self.nb_batches):
+            while pending.numel() < self.batch_size:
+                pending = torch.cat([pending, torch.randperm(n, generator=g)])
+            ix, pending = pending[: self.batch_size], pending[self.batch_size :]
+            yield ix
+
+    def _batches(self, g: torch.Generator) -> Iterator[tuple[torch.Tensor, torch.Tensor]]:
+        for ix in self._indices(g):
+            # les ids sont stockés en type compact : conversion en int64 au gather
+            yield self.X[ix].long(), self.Y[ix].long()
+
+    def _with_states(self, g: torch.Generator) -> Iterator[tuple[tuple, torch.Tensor]]:
+        "Minibatchs tirés de g, avec l'état de g après chacun."
+        for batch in self._batches(g):
+            yield batch, g.get_state()
+
+    def __iter__(self) -> Iterator[tuple[torch.Tensor, torch.Tensor]]:
+        g = torch.Generator()  # copie de self.g, seule utilisée pour les tirages
+        g.set_state(self.g.get_state())
+        if self.prefetch <= 0:
+            for batch, state in self._with_states(g):
+                self.g.set_state(state)
+                yield batch
+            return
+
+        batches: queue.Queue = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        def send(item) -> bool:
+            "Met item dans la file ; renvoie False si le consommateur a abandonné."
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for item in self._with_states(g):
+                    if not send(item):
+                        return
+                send(None)
+            except BaseException as e:  # transmis au thread principal
+                send(e)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while (item := batches.get()) is not None:
+                if isinstance(item, BaseException):
+                    raise item
+                batch, state = item
+                self.g.set_state(state)
+                yield batch
+        finally:
+            stop.set()
+            producer.join()
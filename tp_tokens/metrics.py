@@ -0,0 +1,119 @@
+import json
+import resource
+import time
+
+import torch
+
+PHASES = ("batch", "forward", "backward", "update")
+
+
+def _norm(t: torch.Tensor) -> float:
+    if t.is_sparse:
+        t = t.coalesce().values()
+    return t.norm().item()
+
+
+class TrainingMetrics:
+    """
+    Instrumentation de BengioFFN.train.
+
+    Le temps passé dans chaque phase du pas d'entraînement (attente du minibatch,
+    forward, backward, mise à jour) est cumulé à chaque pas ; tous les every pas,
+    une ligne JSON est écrite dans path avec le temps moyen par phase, les pas et
+    tokens par seconde, le pic de mémoire résidente, les normes des gradients et
+    des paramètres et la dérive des statistiques BatchNorm courantes depuis la
+    ligne précédente. Les normes ne sont calculées qu'à ces pas.
+
+    Si profile_dir est fourni, quelques pas sont aussi tracés avec torch.profiler
+    (format lisible par TensorBoard / Perfetto).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        every: int = 100,
+        profile_dir: str | None = None,
+        profile_steps: int = 5,
+    ) -> None:
+        self.path = path
+        self.every = every
+        self.profile_dir = profile_dir
+        self.profile_steps = profile_steps
+        self.file = None
+        self.profiler = None
+
+    def start(self, nn, batch_size: int) -> None:
+        self.file = open(self.path, "a")
+        self.batch_size = batch_size
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.nb_steps = 0
+        self.interval_start = self.last = time.perf_counter()
+        self.bnmean = nn.bnmean_running.clone()
+        self.bnstd = nn.bnstd_running.clone()
+        if self.profile_dir is not None:
+            self.profiler = torch.profiler.profile(
+                activities=[torch.profiler.ProfilerActivity.CPU],
+                schedule=torch.profiler.schedule(
+                    wait=1, warmup=1, active=self.profile_steps, repeat=1
+                ),
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(self.profile_dir),
+            )
+            self.profiler.start()
+
+    def mark(self, phase: str) -> None:
+        "Attribue à phase le temps écoulé depuis la marque précédente."
+        now = time.perf_counter()
+        self.phases[phase] += now - self.last
+        self.last = now
+
+    def step(self, nn) -> None:
+        "Fin d'un pas d'entraînement (après la mise à jour)."
+        self.nb_steps += 1
+        if self.profiler is not None:
+            self.profiler.step()
+        if nn.steps % self.every == 0:
+            self.record(nn)
+        self.last = time.perf_counter()
+
+    @torch.no_grad()
+    def record(self, nn) -> None:
+        if self.nb_steps == 0:
+            return
+        elapsed = time.perf_counter() - self.interval_start
+        names = ("C", "W1", "W2", "b2", "bngain", "bnbias")
+        record = {
+            "step": nn.steps,
+            "loss": nn.loss.item(),
+            "steps_per_sec": self.nb_steps / elapsed,
+            "tokens_per_sec": self.nb_steps * self.batch_size / elapsed,
+            "phase_ms": {
+                k: 1000 * v / self.nb_steps for k, v in self.phases.items()
+            },
+            # ru_maxrss est en kilo-octets sous Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "grad_norm": {
+                name: _norm(p.grad)
+                for name, p in zip(names, nn.parameters)
+                if p.grad is not None
+            },
+            "param_norm": {name: _norm(p) for name, p in zip(names, nn.parameters)},
+            "bnmean_drift": (nn.bnmean_running - self.bnmean).norm().item(),
+            "bnstd_drift": (nn.bnstd_running - self.bnstd).norm().item(),
+        }
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        self.bnmean = nn.bnmean_running.clone()
+        self.bnstd = nn.bnstd_running.clone()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.nb_steps = 0
+        self.interval_start = time.perf_counter()
+
+    def close(self, nn) -> None:
+        if nn.steps % self.every != 0:
+            self.record(nn)
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,227 @@
+import math
+from typing import Callable
+
+import torch
+
+Schedule = Callable[[int], float]
+
+# noyaux Adam fusionnés (multi-tenseurs) disponibles sur CPU selon la version de torch
+FUSED_ADAM = hasattr(torch, "_fused_adam_") and hasattr(torch, "_fused_adamw_")
+
+
+def make_schedule(
+    kind: str,
+    lr: float,
+    total_steps: int,
+    warmup: int = 0,
+    step_size: int = 100000,
+    gamma: float = 0.1,
+    min_lr: float = 0.0,
+    max_decays: int | None = None,
+) -> Schedule:
+    """
+    Renvoie une fonction step -> learning rate.
+
+    kind vaut "constant", "step" (lr multiplié par gamma tous les step_size pas, au
+    plus max_decays fois si max_decays est fourni) ou
+    "cosine" (décroissance en cosinus jusqu'à min_lr à total_steps). Un échauffement
+    linéaire sur warmup pas peut précéder chacune d'elles.
+    """
+    if kind not in ("constant", "step", "cosine"):
+        raise ValueError(f"Unknown schedule: {kind}")
+
+    def schedule(step: int) -> float:
+        if step < warmup:
+            return lr * (step + 1) / warmup
+        if kind == "step":
+            decays = step // step_size
+            if max_decays is not None:
+                decays = min(decays, max_decays)
+            return lr * gamma**decays
+        if kind == "cosine":
+            progress = min(1.0, (step - warmup) / max(1, total_steps - warmup))
+            return min_lr + 0.5 * (lr - min_lr) * (1 + math.cos(math.pi * progress))
+        return lr
+
+    return schedule
+
+
+class Optimizer:
+    """
+    Base des optimiseurs : les paramètres à gradient dense sont mis à jour tous
+    ensemble avec les opérations multi-tenseurs torch._foreach_*, ceux à gradient
+    creux (embeddings C avec sparse_embeddings) seulement sur les lignes touchées
+    par le minibatch.
+    """
+
+    def __init__(self, parameters: list[torch.Tensor], weight_decay: float = 0.0):
+        self.parameters = parameters
+        self.weight_decay = weight_decay
+        self.state: dict[str, list[torch.Tensor]] = {}
+        self.t = 0
+
+    def _split(self):
+        dense, dense_grads, sparse = [], [], []
+        for i, p in enumerate(self.parameters):
+            if p.grad is None:
+                continue
+            if p.grad.is_sparse:
+                sparse.append(i)
+            else:
+                dense.append(i)
+                dense_grads.append(p.grad)
+        return dense, dense_grads, sparse
+
+    @torch.no_grad()
+    def step(self, lr: float) -> None:
+        self.t += 1
+        dense, grads, sparse = self._split()
+        if dense:
+            self._dense_step(lr, dense, grads)
+        for i in sparse:
+            grad = self.parameters[i].grad.coalesce()
+            self._sparse_step(lr, i, grad.indices()[0], grad.values())
+
+    def _dense_step(self, lr, indices, grads) -> None:
+        raise NotImplementedError
+
+    def _sparse_step(self, lr, i, rows, values) -> None:
+        raise NotImplementedError
+
+    def _buffers(self, name: str) -> list[torch.Tensor]:
+        if name not in self.state:
+            self.state[name] = [torch.zeros_like(p) for p in self.parameters]
+        return self.state[name]
+
+    def state_dict(self) -> dict:
+        return {"t": self.t, **{k: list(v) for k, v in self.state.items()}}
+
+    def load_state_dict(self, state: dict) -> None:
+        self.t = int(state["t"])
+        self.state = {k: list(v) for k, v in state.items() if k != "t"}
+
+
+class SGD(Optimizer):
+    "Descente de gradient avec momentum (optionnel) et weight decay couplé."
+
+    def __init__(self, parameters, momentum: float = 0.0, weight_decay: float = 0.0):
+        super().__init__(parameters, weight_decay)
+        self.momentum = momentum
+
+    def _dense_step(self, lr, indices, grads):
+        params = [self.parameters[i] for i in indices]
+        if self.weight_decay:
+            grads = torch._foreach_add(grads, params, alpha=self.weight_decay)
+        if self.momentum:
+            buffers = [self._buffers("momentum")[i] for i in indices]
+            torch._foreach_mul_(buffers, self.momentum)
+            torch._foreach_add_(buffers, grads)
+            grads = buffers
+        torch._foreach_add_(params, grads, alpha=-lr)
+
+    def _sparse_step(self, lr, i, rows, values):
+        p = self.parameters[i]
+        if self.weight_decay:
+            values = values + self.weight_decay * p[rows]
+        if self.momentum:
+            # momentum "paresseux" : seules les lignes touchées sont amorties
+            buffer = self._buffers("momentum")[i]
+            values = self.momentum * buffer[rows] + values
+            buffer[rows] = values
+        p.index_add_(0, rows, values, alpha=-lr)
+
+
+class Adam(Optimizer):
+    """
+    Adam, ou AdamW si decoupled=True (weight decay appliqué directement aux poids).
+    Pour les gradients creux, les moments ne sont mis à jour que sur les lignes
+    touchées (comme torch.optim.SparseAdam).
+    """
+
+    def __init__(
+        self,
+        parameters,
+        betas: tuple[float, float] = (0.9, 0.999),
+        eps: float = 1e-8,
+        weight_decay: float = 0.0,
+        decoupled: bool = False,
+    ):
+        super().__init__(parameters, weight_decay)
+        self.betas = betas
+        self.eps = eps
+        self.decoupled = decoupled
+
+    def _corrections(self):
+        beta1, beta2 = self.betas
+        return 1 - beta1**self.t, math.sqrt(1 - beta2**self.t)
+
+    def _dense_step(self, lr, indices, grads):
+        beta1, beta2 = self.betas
+        params = [self.parameters[i] for i in indices]
+        m = [self._buffers("exp_avg")[i] for i in indices]
+        v = [self._buffers("exp_avg_sq")[i] for i in indices]
+        if FUSED_ADAM:
+            # noyau fusionné : une seule passe sur les poids, gradients et moments
+            fused = torch._fused_adamw_ if self.decoupled else torch._fused_adam_
+            step = torch.tensor(float(self.t))
+            fused(
+                params,
+                grads,
+                m,
+                v,
+                [],
+                [step] * len(params),
+                lr=lr,
+                beta1=beta1,
+                beta2=beta2,
+                weight_decay=self.weight_decay,
+                eps=self.eps,
+                amsgrad=False,
+                maximize=False,
+            )
+            return
+        if self.weight_decay:
+            if self.decoupled:
+                torch._foreach_mul_(params, 1 - lr * self.weight_decay)
+            else:
+                grads = torch._foreach_add(grads, params, alpha=self.weight_decay)
+        torch._foreach_lerp_(m, grads, 1 - beta1)
+        torch._foreach_mul_(v, beta2)
+        torch._foreach_addcmul_(v, grads, grads, value=1 - beta2)
+        correction1, correction2 = self._corrections()
+        denom = torch._foreach_sqrt(v)
+        torch._foreach_div_(denom, correction2)
+        torch._foreach_add_(denom, self.eps)
+        torch._foreach_addcdiv_(params, m, denom, value=-lr / correction1)
+
+    def _sparse_step(self, lr, i, rows, values):
+        beta1, beta2 = self.betas
+        p = self.parameters[i]
+        if self.weight_decay:
+            if self.decoupled:
+                p[rows] *= 1 - lr * self.weight_decay
+            else:
+                values = values + self.weight_decay * p[rows]
+        m = self._buffers("exp_avg")[i]
+        v = self._buffers("exp_avg_sq")[i]
+        m_rows = m[rows].lerp_(values, 1 - beta1)
+        v_rows = v[rows].mul_(beta2).addcmul_(values, values, value=1 - beta2)
+        m[rows], v[rows] = m_rows, v_rows
+        correction1, correction2 = self._corrections()
+        update = m_rows / (v_rows.sqrt() / correction2 + self.eps)
+        p.index_add_(0, rows, update, alpha=-lr / correction1)
+
+
+def make_optimizer(
+    name: str,
+    parameters: list[torch.Tensor],
+    momentum: float = 0.0,
+    weight_decay: float = 0.0,
+) -> Optimizer:
+    if name == "sgd":
+        return SGD(parameters, momentum=momentum, weight_decay=weight_decay)
+    if name == "adam":
+        return Adam(parameters, weight_decay=weight_decay)
+    if name == "adamw":
+        return Adam(parameters, weight_decay=weight_decay, decoupled=True)
+    raise ValueError(f"Unknown optimizer: {name}")
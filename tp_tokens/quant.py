@@ -0,0 +1,137 @@
+import torch
+
+from .datasets import Datasets
+from .evaluation import evaluate
+from .ffn import BengioFFN
+
+# multiplication int8 x int8 -> int32 native (sinon repli en float32)
+INT_MM = hasattr(torch, "_int_mm")
+
+
+def quantize_rows(t: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Quantification symétrique int8 ligne par ligne : t ~ q * scale, avec q dans
+    [-127, 127] et une échelle float32 [n, 1] par ligne.
+    """
+    scale = t.abs().amax(dim=1, keepdim=True).clamp(min=1e-12) / 127
+    q = torch.round(t / scale).clamp(-127, 127).to(torch.int8)
+    return q, scale.float()
+
+
+def quantize_columns(t: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    "Comme quantize_rows, avec une échelle [1, m] par colonne de t [n, m]."
+    q, scale = quantize_rows(t.T)
+    return q.T.contiguous(), scale.T.contiguous()
+
+
+def _int8_matmul(a: torch.Tensor, q: torch.Tensor, scale: torch.Tensor):
+    """
+    a @ (q * scale) pour une matrice q [n_in, n_out] quantifiée par colonne : a
+    est quantifiée dynamiquement par ligne, le produit est fait en entiers.
+    """
+    if not INT_MM:
+        return a @ (q.float() * scale)
+    aq, ascale = quantize_rows(a)
+    return torch._int_mm(aq, q).float().mul_(ascale).mul_(scale)
+
+
+class QuantizedBengioFFN(BengioFFN):
+    """
+    BengioFFN d'inférence dont C, W1 et W2 sont stockés en int8 : une échelle par
+    ligne de C (par token) et par colonne de W1 et W2 (par neurone de sortie, ce
+    qui permet d'appliquer l'échelle après le produit). Les autres tenseurs
+    restent en float32.
+
+    compute_loss, evaluate et la génération fonctionnent comme pour BengioFFN ;
+    l'entraînement n'est pas possible. Construit avec quantize ou
+    from_state_dict.
+    """
+
+    state_names = (
+        "Cq",
+        "C_scale",
+        "W1q",
+        "W1_scale",
+        "W2q",
+        "W2_scale",
+        "b2",
+        "bngain",
+        "bnbias",
+        "bnmean_running",
+        "bnstd_running",
+    )
+
+    @classmethod
+    def quantize(cls, nn: BengioFFN) -> "QuantizedBengioFFN":
+        "Copie quantifiée d'un réseau entraîné."
+        state = nn.state_dict()
+        with torch.no_grad():
+            state["Cq"], state["C_scale"] = quantize_rows(nn.C)
+            state["W1q"], state["W1_scale"] = quantize_columns(nn.W1)
+            state["W2q"], state["W2_scale"] = quantize_columns(nn.W2)
+        for name in ("C", "W1", "W2"):
+            del state[name]
+        state = {
+            name: value.detach().clone() if isinstance(value, torch.Tensor) else value
+            for name, value in state.items()
+        }
+        return cls.from_state_dict(state, torch.Generator())
+
+    def state_dict(self) -> dict:
+        state = super().state_dict()
+        state["config"]["quantized"] = True
+        return state
+
+    def _init_state(self):
+        self.loss = None
+        self.steps = 0
+        self.tables = None
+        self.sparse_embeddings = False
+        self.parameters = []
+        self.nb_parameters = (
+            self.Cq.nelement() + self.W1q.nelement() + self.W2q.nelement()
+        ) + sum(p.nelement() for p in (self.b2, self.bngain, self.bnbias))
+
+    def nbytes(self) -> int:
+        "Mémoire occupée par les poids, en octets."
+        return sum(getattr(self, name).nbytes for name in self.state_names)
+
+    def train(self, *args, **kwargs):
+        # les poids int8 ne sont pas des paramètres entraînables
+        raise TypeError("Quantized models are inference-only.")
+
+    def enable_tables(self, memory_budget: int = 0) -> bool:
+        # les tables float32 annuleraient le gain mémoire de la quantification
+        self.tables = None
+        return False
+
+    @torch.no_grad()
+    def _eval_hidden(self, X) -> torch.Tensor:
+        emb = self.Cq[X].float() * self.C_scale[X]
+        embcat = emb.view(emb.shape[0], -1)
+        hpreact = _int8_matmul(embcat, self.W1q, self.W1_scale)
+        hpreact = (
+            self.bngain * (hpreact - self.bnmean_running) / self.bnstd_running
+            + self.bnbias
+        )
+        return self._activate(hpreact)
+
+    def _output_logits(self, h, start=0, stop=None) -> torch.Tensor:
+        W2q, W2_scale = self.W2q[:, start:stop], self.W2_scale[:, start:stop]
+        return _int8_matmul(h, W2q, W2_scale) + self.b2[start:stop]
+
+    def _target_logits(self, h, Y) -> torch.Tensor:
+        W2 = self.W2q[:, Y].float() * self.W2_scale[:, Y]
+        return (h * W2.T).sum(dim=1) + self.b2[Y]
+
+    def __repr__(self):
+        return super().__repr__().replace("<BengioMLP", "<BengioMLP quantized", 1)
+
+
+def quantization_report(
+    nn: BengioFFN, quantized: QuantizedBengioFFN, datasets: Datasets
+) -> dict[str, float]:
+    "Perte de dev float32 et int8, et écart entre les deux."
+    reference = evaluate(nn, datasets, ("dev",))["dev"]["loss"]
+    loss = evaluate(quantized, datasets, ("dev",))["dev"]["loss"]
+    return {"float32": reference, "int8": loss, "delta": loss - reference}
@@ -0,0 +1,39 @@
+import torch
+import torch.nn.functional as F
+
+
+class SampledSoftmax:
+    """
+    Objectif d'entraînement approché pour la couche de sortie (sampled softmax).
+
+    Au lieu de calculer les logits des nb_tokens tokens, on ne calcule que celui de
+    la cible et ceux de nb_samples tokens tirés (avec remise, partagés par tout le
+    minibatch) selon une loi unigramme lissée counts**power. Les logits sont
+    corrigés par log(nb_samples * q) pour que le gradient soit un estimateur de
+    celui de la softmax complète ; les tirages égaux à la cible sont masqués.
+
+    La perte obtenue n'est pas comparable à l'entropie croisée complète : les
+    pertes de dev/test restent calculées par BengioFFN.compute_loss.
+    """
+
+    def __init__(
+        self, counts: torch.Tensor, nb_samples: int, g, power: float = 0.75
+    ) -> None:
+        # lissage +1 : les tokens absents du corpus restent des négatifs possibles
+        probs = (counts.double() + 1.0) ** power
+        self.probs = (probs / probs.sum()).float()
+        self.log_expected = torch.log(self.probs * nb_samples)
+        self.nb_samples = nb_samples
+        self.g = g
+
+    def loss(
+        self, h: torch.Tensor, Y: torch.Tensor, W2: torch.Tensor, b2: torch.Tensor
+    ) -> torch.Tensor:
+        S = torch.multinomial(
+            self.probs, self.nb_samples, replacement=True, generator=self.g
+        )
+        true_logits = (h * W2[:, Y].T).sum(1) + b2[Y] - self.log_expected[Y]
+        sampled_logits = h @ W2[:, S] + b2[S] - self.log_expected[S]
+        sampled_logits = sampled_logits.masked_fill(S[None, :] == Y[:, None], float("-inf"))
+        logits = torch.cat([true_logits[:, None], sampled_logits], dim=1)
+        return F.cross_entropy(logits, torch.zeros_like(Y))
@@ -0,0 +1,118 @@
+from collections import OrderedDict
+
+import tokenizers
+import torch
+
+from .datasets import build_dataset
+from .evaluation import DEFAULT_VOCAB_CHUNK, perplexity, streaming_log_normalizer
+from .ffn import BengioFFN
+from .vocab import Vocabulary
+
+DEFAULT_CACHE_SIZE = 65536  # contextes
+
+
+class SentenceScorer:
+    """
+    Log-probabilités de phrases brutes sous un BengioFFN.
+
+    Les phrases sont tokenisées par encode_batch puis découpées en couples
+    (contexte, cible) comme dans Datasets (préfixe de [PAD], cible [EOS] finale).
+    Pour chaque contexte distinct, la couche cachée et le log-sum-exp des logits
+    sont conservés dans un cache LRU de cache_size entrées : des phrases
+    candidates qui partagent un préfixe ne paient la sortie complète qu'une fois.
+
+    Le cache est figé : il doit être vidé (clear_cache) si le modèle change.
+
+    Pour un modèle entraîné sur un vocabulaire compact, vocabulary convertit les
+    ids du tokenizer (les tokens hors vocabulaire sont scorés comme [UNK]).
+    """
+
+    def __init__(
+        self,
+        nn: BengioFFN,
+        tokenizer: tokenizers.Tokenizer,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        batch_size: int = 1024,
+        vocab_chunk: int = DEFAULT_VOCAB_CHUNK,
+        vocabulary: Vocabulary | None = None,
+    ):
+        self.nn = nn
+        self.tokenizer = tokenizer
+        self.vocabulary = vocabulary
+        self.pad_id = tokenizer.token_to_id("[PAD]")
+        self.eos_id = tokenizer.token_to_id("[EOS]")
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.vocab_chunk = vocab_chunk
+        self.cache: OrderedDict[tuple[int, ...], tuple[torch.Tensor, float]] = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def clear_cache(self) -> None:
+        self.cache.clear()
+
+    def score(self, texts: list[str]) -> list[dict]:
+        """
+        Score de chaque phrase : log-probabilité totale (somme sur ses tokens et
+        [EOS]), perplexité, ids et log-probabilité de chaque token cible.
+        """
+        encodings = self.tokenizer.encode_batch(texts)
+        scores = self.score_ids([encoding.ids for encoding in encodings])
+        for text, score in zip(texts, scores):
+            score["text"] = text
+        return scores
+
+    @torch.inference_mode()
+    def score_ids(self, sentences: list[list[int]]) -> list[dict]:
+        "Comme score, pour des phrases déjà tokenisées."
+        X, Y = build_dataset(
+            sentences, self.nn.context_size, self.pad_id, self.eos_id
+        )
+        if self.vocabulary is not None:
+            X, Y = self.vocabulary.encode(X), self.vocabulary.encode(Y)
+        contexts, inverse = torch.unique(X, dim=0, return_inverse=True)
+        hidden, log_normalizer = self._lookup(contexts)
+        log_probs = torch.empty(Y.shape[0])
+        for i in range(0, Y.shape[0], self.batch_size):
+            rows = inverse[i : i + self.batch_size]
+            log_probs[i : i + self.batch_size] = (
+                self.nn._target_logits(hidden[rows], Y[i : i + self.batch_size])
+                - log_normalizer[rows]
+            )
+
+        scores = []
+        counts = [len(ids) + 1 for ids in sentences]
+        for ids, token_log_probs in zip(sentences, torch.split(log_probs, counts)):
+            log_prob = token_log_probs.sum().item()
+            scores.append(
+                {
+                    "log_prob": log_prob,
+                    "perplexity": perplexity(-log_prob / token_log_probs.numel()),
+                    "ids": list(ids),
+                    "token_log_probs": token_log_probs.tolist(),
+                }
+            )
+        return scores
+
+    def _lookup(self, contexts: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        "Couche cachée et log-sum-exp de contextes distincts, via le cache."
+        keys = [tuple(row) for row in contexts.tolist()]
+        entries = [self.cache.get(key) for key in keys]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start : start + self.batch_size]
+            h = self.nn._eval_hidden(contexts[batch])
+            log_normalizer, _ = streaming_log_normalizer(self.nn, h, self.vocab_chunk)
+            for i, h_row, value in zip(batch, h, log_normalizer.tolist()):
+                entries[i] = (h_row.clone(), value)
+        for key, entry in zip(keys, entries):
+            self.cache[key] = entry
+            self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        hidden = torch.stack([h for h, _ in entries]) if entries else torch.empty(0)
+        return hidden, torch.tensor([value for _, value in entries])
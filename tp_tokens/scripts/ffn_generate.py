@@ -0,0 +1,63 @@
+import argparse
+import time
+
+import tokenizers
+import torch
+
+from ..checkpoint import load_model
+from ..vocab import Vocabulary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Génère des phrases à partir d'un checkpoint, sans entraînement."
+    )
+    parser.add_argument("checkpoint")
+    parser.add_argument("--tokenizer", default=None, help="par défaut celui du checkpoint")
+    parser.add_argument("--generate", default=5)
+    parser.add_argument("--seed", default=42)
+    parser.add_argument(
+        "--tables-budget", default=0, help="Mo alloués aux tables d'inférence"
+    )
+    parser.add_argument("--temperature", default=1.0)
+    parser.add_argument("--top-k", default=None)
+    parser.add_argument("--top-p", default=None)
+    parser.add_argument("--max-length", default=None)
+    args = parser.parse_args()
+
+    t0 = time.time()
+    # les poids sont projetés en mémoire depuis le fichier
+    nn, meta = load_model(args.checkpoint, mmap=True)
+    tokenizer_path = args.tokenizer or meta.get(
+        "tokenizer_path", "models/civil_tokenizer.json"
+    )
+    tokenizer = tokenizers.Tokenizer.from_file(tokenizer_path)
+    nn.enable_tables(int(args.tables_budget) * 2**20)
+    print(f"Loaded {args.checkpoint} in {time.time() - t0:.3f} seconds")
+    print(nn)
+
+    pad_id = tokenizer.token_to_id("[PAD]")
+    eos_id = tokenizer.token_to_id("[EOS]")
+    vocabulary = None
+    if "vocabulary" in meta:
+        # modèle entraîné sur un vocabulaire compact
+        vocabulary = Vocabulary.from_state_dict(meta["vocabulary"])
+        pad_id, eos_id = vocabulary.compact_id(pad_id), vocabulary.compact_id(eos_id)
+
+    g = torch.Generator().manual_seed(int(args.seed))
+    generated = nn.generate_batch(
+        int(args.generate),
+        pad_id,
+        eos_id,
+        g,
+        temperature=float(args.temperature),
+        top_k=None if args.top_k is None else int(args.top_k),
+        top_p=None if args.top_p is None else float(args.top_p),
+        max_length=None if args.max_length is None else int(args.max_length),
+    )
+    for generated_ids in generated:
+        if vocabulary is not None:
+            generated_ids = vocabulary.decode(generated_ids)
+        text = tokenizer.decode(generated_ids, skip_special_tokens=True)
+        print(f"> {text}")
+    return 0
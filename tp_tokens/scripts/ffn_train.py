@@ -1,10 +1,21 @@
 import argparse
+import os
 
 import torch
 
-from ..datasets import Datasets
-from ..ffn import BengioFFN
+from ..checkpoint import load_checkpoint, save_checkpoint
+from ..compact import CompactDatasets
+from ..datasets import Datasets, split_bounds
+from ..distributed import train_distributed
+from ..ffn import ACTIVATIONS, INIT_SCHEMES, BengioFFN
+from ..fused import FUSED_ACTIVATIONS
+from ..metrics import TrainingMetrics
+from ..optim import make_optimizer, make_schedule
+from ..quant import QuantizedBengioFFN, quantization_report
+from ..sampled import SampledSoftmax
 from ..sentences import Sentences
+from ..validation import PeriodicValidation
+from ..vocab import Vocabulary
 
 
 def main():
@@ -14,10 +25,108 @@ def main():
     parser.add_argument("--context", default=5)
     parser.add_argument("--embeddings", default=128)
     parser.add_argument("--hidden", default=256)
+    parser.add_argument("--init", default="kaiming", choices=INIT_SCHEMES)
+    parser.add_argument("--activation", default="tanh", choices=list(ACTIVATIONS))
+    parser.add_argument(
+        "--no-batchnorm", action="store_true", help="couche cachée sans BatchNorm"
+    )
     parser.add_argument("--seed", default=42)
     parser.add_argument("--steps", default=10000)
     parser.add_argument("--batch", default=128)
+    parser.add_argument("--cache", default=None, help="dossier du cache de tokens")
+    parser.add_argument("--optimizer", default="sgd", choices=["sgd", "adam", "adamw"])
+    parser.add_argument("--lr", default=None, help="0.2 pour sgd, 0.001 pour adam")
+    parser.add_argument("--momentum", default=0.0)
+    parser.add_argument("--weight-decay", default=0.0)
+    parser.add_argument("--schedule", default="step", choices=["constant", "step", "cosine"])
+    parser.add_argument("--warmup", default=0)
+    parser.add_argument("--decay-steps", default=100000)
+    parser.add_argument(
+        "--max-decays", default=1, help="nombre maximal de décroissances (0: aucune limite)"
+    )
+    parser.add_argument(
+        "--sparse", action="store_true", help="mises à jour creuses des embeddings"
+    )
+    parser.add_argument(
+        "--epochs", action="store_true", help="tirage sans remise, par époques"
+    )
+    parser.add_argument(
+        "--autocast", action="store_true", help="passe avant en bfloat16"
+    )
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="passes avant et arrière écrites à la main, sans autograd",
+    )
+    parser.add_argument(
+        "--quantize", default=None, help="checkpoint int8 écrit après l'entraînement"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="couples (contexte, cible) dédupliqués, perte pondérée par les comptes",
+    )
+    parser.add_argument(
+        "--compact-vocab",
+        action="store_true",
+        help="C, W2 et b2 limités aux tokens vus dans le split train",
+    )
+    parser.add_argument(
+        "--min-count",
+        default=1,
+        help="avec --compact-vocab, tokens plus rares envoyés sur [UNK]",
+    )
+    parser.add_argument("--prefetch", default=2, help="minibatchs préparés d'avance")
+    parser.add_argument(
+        "--sampled", default=0, help="négatifs de la sampled softmax (0: complète)"
+    )
+    parser.add_argument(
+        "--tables-budget", default=256, help="Mo alloués aux tables d'inférence"
+    )
+    parser.add_argument("--temperature", default=1.0)
+    parser.add_argument("--top-k", default=None)
+    parser.add_argument("--top-p", default=None)
+    parser.add_argument("--max-length", default=None)
+    parser.add_argument(
+        "--workers", default=1, help="processus d'entraînement data-parallel"
+    )
+    parser.add_argument(
+        "--validate-every",
+        default=0,
+        help="pas entre deux évaluations du dev en arrière-plan (0: aucune)",
+    )
+    parser.add_argument(
+        "--patience", default=None, help="évaluations sans amélioration avant l'arrêt"
+    )
+    parser.add_argument("--metrics", default=None, help="fichier JSONL de métriques")
+    parser.add_argument("--metrics-every", default=100)
+    parser.add_argument("--profile", default=None, help="dossier de traces torch.profiler")
+    parser.add_argument("--checkpoint", default=None, help="fichier de checkpoint")
+    parser.add_argument("--checkpoint-every", default=1000)
+    parser.add_argument(
+        "--resume", action="store_true", help="reprend depuis --checkpoint s'il existe"
+    )
     args = parser.parse_args()
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume requires --checkpoint")
+    if args.compact and (int(args.workers) > 1 or int(args.sampled) > 0):
+        parser.error("--compact is not supported with --workers or --sampled")
+    if int(args.workers) > 1 and args.sparse:
+        parser.error("--sparse is not supported with --workers")
+    if int(args.workers) > 1 and (args.metrics is not None or args.profile is not None):
+        parser.error("--metrics and --profile are not supported with --workers")
+    if int(args.validate_every) > 0 and int(args.workers) > 1:
+        parser.error("--validate-every is not supported with --workers")
+    if args.patience is not None and int(args.validate_every) <= 0:
+        parser.error("--patience requires --validate-every")
+    if args.fused and (
+        int(args.workers) > 1 or int(args.sampled) > 0 or args.autocast or args.compact
+    ):
+        parser.error(
+            "--fused is not supported with --workers, --sampled, --autocast or --compact"
+        )
+    if args.fused and args.activation not in FUSED_ACTIVATIONS:
+        parser.error(f"--fused supports --activation {', '.join(FUSED_ACTIVATIONS)}")
     context_size = int(args.context)
     e_dims = int(args.embeddings)  # Dimensions des embeddings
     n_hidden = int(args.hidden)
@@ -25,25 +134,188 @@ def main():
     max_steps = int(args.steps)
     mini_batch_size = int(args.batch)
 
-    sentences = Sentences(args.datafile)
-    pad_id = sentences.token_to_id("[PAD]")
-    eos_id = sentences.token_to_id("[EOS]")
+    sentences = Sentences(args.datafile, cache_dir=args.cache, streaming=True)
 
     print(sentences)
-    datasets = Datasets(sentences, context_size)
     g = torch.Generator().manual_seed(seed)
-    nn = BengioFFN(e_dims, n_hidden, context_size, sentences.nb_tokens, g)
-    print(nn)
-    lossi = nn.train(datasets, max_steps, mini_batch_size)
+    resumed = None
+    if args.resume and os.path.exists(args.checkpoint):
+        resumed = load_checkpoint(args.checkpoint, mmap=False)
+        if resumed["config"].get("quantized"):
+            parser.error(f"{args.checkpoint} is quantized and cannot be trained")
+        if args.fused and resumed["config"].get("activation", "tanh") not in FUSED_ACTIVATIONS:
+            parser.error(f"--fused does not support the activation of {args.checkpoint}")
+        context_size = resumed["config"]["context_size"]
+        print(f"Resuming from {args.checkpoint} at step {resumed['config']['steps']}")
+    vocabulary = None
+    if resumed is not None and "vocabulary" in resumed.get("meta", {}):
+        vocabulary = Vocabulary.from_state_dict(resumed["meta"]["vocabulary"])
+    elif args.compact_vocab and resumed is None:
+        vocabulary = Vocabulary.from_sentences(
+            sentences, int(args.min_count), split_bounds(sentences.nb_sentences)[0]
+        )
+    if vocabulary is not None:
+        print(vocabulary)
+    datasets = Datasets(
+        sentences, context_size, cache_dir=args.cache, vocabulary=vocabulary
+    )
+    if args.compact:
+        datasets = CompactDatasets(datasets)
+        print(
+            f"Compact train set: {len(datasets.train)} contexts"
+            f" for {datasets.train.nb_samples} examples"
+        )
+
+    optimizer_kwargs = {
+        "name": args.optimizer,
+        "momentum": float(args.momentum),
+        "weight_decay": float(args.weight_decay),
+    }
+    if args.lr is None:
+        lr = 0.2 if args.optimizer == "sgd" else 1e-3
+    else:
+        lr = float(args.lr)
+    schedule_kwargs = {
+        "kind": args.schedule,
+        "lr": lr,
+        "warmup": int(args.warmup),
+        "step_size": int(args.decay_steps),
+        "max_decays": int(args.max_decays) or None,
+    }
+    model_kwargs = {
+        "init": args.init,
+        "activation": args.activation,
+        "batchnorm": not args.no_batchnorm,
+    }
+    meta = {"datafile": args.datafile, "tokenizer_path": sentences.tokenizer_path}
+    if vocabulary is not None:
+        meta["vocabulary"] = vocabulary.state_dict()
+
+    if int(args.workers) > 1:
+        nn = train_distributed(
+            int(args.workers),
+            datasets,
+            datasets.nb_tokens,
+            e_dims,
+            n_hidden,
+            seed,
+            max_steps,
+            mini_batch_size,
+            optimizer_kwargs,
+            schedule_kwargs,
+            sampled=int(args.sampled),
+            checkpoint=args.checkpoint,
+            checkpoint_every=int(args.checkpoint_every),
+            resume=args.resume,
+            replacement=not args.epochs,
+            prefetch=int(args.prefetch),
+            meta=meta,
+            model=model_kwargs,
+            autocast=args.autocast,
+        )
+        print(nn)
+    else:
+        if resumed is not None:
+            nn = BengioFFN.from_state_dict(resumed, g)
+        else:
+            nn = BengioFFN(
+                e_dims, n_hidden, context_size, datasets.nb_tokens, g, **model_kwargs
+            )
+        nn.sparse_embeddings = args.sparse
+        print(nn)
+        optimizer = make_optimizer(parameters=nn.parameters, **optimizer_kwargs)
+        if resumed is not None and "optimizer" in resumed:
+            optimizer.load_state_dict(resumed["optimizer"])
+        schedule = make_schedule(total_steps=max_steps, **schedule_kwargs)
+        sampled_softmax = None
+        if int(args.sampled) > 0:
+            sampled_softmax = SampledSoftmax(
+                datasets.target_counts(),
+                int(args.sampled),
+                torch.Generator().manual_seed(seed + 1),
+            )
+            if resumed is not None and "sampled_generator" in resumed:
+                sampled_softmax.g.set_state(resumed["sampled_generator"])
+        validation = None
+        if int(args.validate_every) > 0:
+            validation = PeriodicValidation(
+                datasets,
+                int(args.validate_every),
+                None if args.patience is None else int(args.patience),
+            )
+
+        checkpoint = None
+        if args.checkpoint is not None:
+
+            def checkpoint(nn, optimizer):
+                checkpoint_meta = meta
+                if validation is not None and validation.restored:
+                    # meilleurs poids restaurés : pas dont ils proviennent
+                    checkpoint_meta = dict(meta, best_step=validation.best_step)
+                save_checkpoint(
+                    args.checkpoint, nn, optimizer, checkpoint_meta, sampled_softmax
+                )
+
+        metrics = None
+        if args.metrics is not None:
+            metrics = TrainingMetrics(
+                args.metrics, int(args.metrics_every), profile_dir=args.profile
+            )
+
+        # --steps est le nombre total de pas, reprise comprise
+        lossi = nn.train(
+            datasets,
+            max(0, max_steps - nn.steps),
+            mini_batch_size,
+            sampled_softmax,
+            optimizer,
+            schedule,
+            checkpoint,
+            int(args.checkpoint_every),
+            replacement=not args.epochs,
+            prefetch=int(args.prefetch),
+            metrics=metrics,
+            autocast=args.autocast,
+            fused=args.fused,
+            validation=validation,
+        )
+        if validation is not None:
+            for step, loss in validation.curve:
+                print(f"step {step}: dev loss={loss:.4f}")
+            print(f"Best dev loss {validation.best_loss:.4f} at step {validation.best_step}")
+    nn.enable_tables(int(args.tables_budget) * 2**20)
     # print(f"{lossi=}")
-    train_loss = nn.training_loss(datasets)
-    val_loss = nn.test_loss(datasets)
-    print(f"{train_loss=}")
-    print(f"{val_loss=}")
+    for split, scores in nn.evaluate(datasets).items():
+        print(
+            f"{split}: loss={scores['loss']:.4f}"
+            f" perplexity={scores['perplexity']:.1f}"
+            f" accuracy={scores['accuracy']:.4f}"
+        )
 
-    for _ in range(int(args.generate)):
-        generated_ids = nn.generate_sentence(pad_id, eos_id, g)
+    if args.quantize is not None:
+        quantized = QuantizedBengioFFN.quantize(nn)
+        report = quantization_report(nn, quantized, datasets)
+        print(
+            f"int8: dev loss={report['int8']:.4f} (float32 {report['float32']:.4f},"
+            f" delta {report['delta']:+.4f}),"
+            f" {quantized.nbytes() / 2**20:.1f} MiB"
+        )
+        save_checkpoint(args.quantize, quantized, meta=meta)
+        nn = quantized
 
+    generated = nn.generate_batch(
+        int(args.generate),
+        datasets.pad_id,
+        datasets.eos_id,
+        g,
+        temperature=float(args.temperature),
+        top_k=None if args.top_k is None else int(args.top_k),
+        top_p=None if args.top_p is None else float(args.top_p),
+        max_length=None if args.max_length is None else int(args.max_length),
+    )
+    for generated_ids in generated:
+        if vocabulary is not None:
+            generated_ids = vocabulary.decode(generated_ids)
         text = sentences.tokenizer.decode(generated_ids, skip_special_tokens=True)
 
         print(f"> {text}")
@@ -1,26 +1,44 @@
-import pickle
 import random
+from itertools import chain, islice
 
+import numpy as np
 import tokenizers
 
+from .store import TokenStore, numpy_dtype, smallest_int_dtype, store_key
+
+
+def shuffled_order(nb_sentences: int, seed: int) -> list[int]:
+    "Même permutation que random.shuffle (graine seed) sur une liste de phrases."
+    order = list(range(nb_sentences))
+    random.seed(seed)
+    random.shuffle(order)
+    return order
+
 
 class Sentences:
-    """Représente une liste de phrases, ainsi que la liste ordonnée des tokens les composants."""
+    """Représente une liste de phrases, ainsi que la liste ordonnée des tokens les composants.
+
+    Si cache_dir est fourni, les phrases tokenisées sont conservées sur disque
+    (voir store.TokenStore) sous une clé dépendant du fichier de données, du
+    tokenizer et de la graine : les chargements suivants ouvrent directement le
+    cache en memmap, sans retokeniser.
+
+    En mode streaming, le fichier est lu par blocs de chunk_size lignes, encodés
+    en parallèle par encode_batch, et les ids sont écrits directement dans un
+    TokenStore (tableau plat + offsets) au lieu d'une liste de listes Python.
+    """
 
     def __init__(
         self,
         data_path: str = "data/civil_sentences.txt",
         tokenizer_path: str = "models/civil_tokenizer.json",
         seed: int = 42,
+        cache_dir: str | None = None,
+        streaming: bool = False,
+        chunk_size: int = 8192,
     ) -> None:
         self.data_path = data_path
         self.tokenizer_path = tokenizer_path
-        sentences = open(self.data_path, "r").read().splitlines()
-
-        random.seed(seed)
-        random.shuffle(sentences)
-
-        self.nb_sentences = len(sentences)
 
         self.tokenizer = tokenizers.Tokenizer.from_file(tokenizer_path)
         self.tokens = self.tokenizer.get_vocab()
@@ -28,10 +46,71 @@ class Sentences:
         self.token_to_id = self.tokenizer.token_to_id
         self.id_to_token = self.tokenizer.id_to_token
 
-        self.token_ids_sentences = []
+        self.store_key = None
+        if cache_dir is not None:
+            self.store_key = store_key(data_path, tokenizer_path, seed)
+            store = TokenStore.open(cache_dir, self.store_key)
+            if store is None:
+                self._encode_streaming(seed, chunk_size).save(
+                    cache_dir, self.store_key, data_path=data_path, seed=seed
+                )
+                store = TokenStore.open(cache_dir, self.store_key)
+            self.token_ids_sentences = store
+        elif streaming:
+            self.token_ids_sentences = self._encode_streaming(seed, chunk_size)
+        else:
+            self.token_ids_sentences = self._encode(seed)
+
+        self.nb_sentences = len(self.token_ids_sentences)
+
+    def _encode(self, seed: int) -> list[list[int]]:
+        sentences = open(self.data_path, "r").read().splitlines()
+
+        random.seed(seed)
+        random.shuffle(sentences)
+
+        token_ids_sentences = []
         for sentence in sentences:
-            self.token_ids_sentences.append(self.tokenizer.encode(sentence).ids)
-        del sentences
+            token_ids_sentences.append(self.tokenizer.encode(sentence).ids)
+        return token_ids_sentences
+
+    def _read_chunks(self, chunk_size: int):
+        "Lignes du fichier par blocs, découpées comme str.splitlines."
+        with open(self.data_path, "r") as f:
+            while lines := list(islice(f, chunk_size)):
+                # une ligne vide donne [] avec splitlines, [""] avec read().splitlines()
+                yield list(chain.from_iterable(line.splitlines() or [""] for line in lines))
+
+    def _encode_streaming(self, seed: int, chunk_size: int) -> TokenStore:
+        dtype = numpy_dtype(smallest_int_dtype(self.nb_tokens))
+        ids = np.empty(1 << 20, dtype=dtype)
+        nb_ids = 0
+        lengths = []
+        for lines in self._read_chunks(chunk_size):
+            encodings = self.tokenizer.encode_batch(lines)
+            chunk_lengths = np.fromiter(
+                (len(e.ids) for e in encodings), dtype=np.int64, count=len(encodings)
+            )
+            n = int(chunk_lengths.sum())
+            if nb_ids + n > len(ids):
+                grown = np.empty(max(2 * len(ids), nb_ids + n), dtype=dtype)
+                grown[:nb_ids] = ids[:nb_ids]
+                ids = grown
+            ids[nb_ids : nb_ids + n] = np.fromiter(
+                chain.from_iterable(e.ids for e in encodings), dtype=dtype, count=n
+            )
+            nb_ids += n
+            lengths.append(chunk_lengths)
+        lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int64)
+        starts = np.cumsum(lengths) - lengths
+
+        order = np.array(shuffled_order(len(lengths), seed), dtype=np.int64)
+
+        lengths = lengths[order]
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        gather = np.repeat(starts[order] - offsets[:-1], lengths) + np.arange(nb_ids)
+        return TokenStore(ids[gather], offsets)
 
     def __repr__(self) -> str:
         representation: list[str] = []
@@ -44,9 +123,6 @@ class Sentences:
 
 
 if __name__ == "__main__":
-    sentences = Sentences()
+    sentences = Sentences(cache_dir="models/cache")
     print(sentences)
-    import pickle
-
-    with open("models/sentences.pkl", "wb") as f:
-        pickle.dump(sentences, f)
+    print(f"Token store: models/cache/{sentences.store_key}.*")
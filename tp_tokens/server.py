@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import collections
+import json
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tokenizers
+import torch
+
+from .checkpoint import load_model
+from .ffn import BengioFFN, sample_next_token
+from .vocab import Vocabulary
+
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+class GenerationRequest:
+    """
+    Requête de génération en cours : n phrases tirées avec leur propre
+    générateur, comme le ferait nn.generate_batch(n, ..., g) seul.
+    """
+
+    def __init__(
+        self,
+        n: int,
+        context_size: int,
+        pad_id: int,
+        seed: int,
+        temperature: float,
+        top_k: int | None,
+        top_p: float | None,
+        max_length: int,
+        future: asyncio.Future,
+    ):
+        self.g = torch.Generator().manual_seed(seed)
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.max_length = max_length
+        self.future = future
+        self.contexts = torch.full((n, context_size), pad_id, dtype=torch.long)
+        self.rows = torch.arange(n)  # phrase associée à chaque ligne
+        self.sentences = [[] for _ in range(n)]
+        self.step = 0
+        self.error = None  # exception levée pendant le tirage de cette requête
+        self.start = time.perf_counter()
+
+    @property
+    def done(self) -> bool:
+        return (
+            self.error is not None
+            or self.rows.numel() == 0
+            or self.step >= self.max_length
+        )
+
+    def advance(self, logits: torch.Tensor, eos_id: int) -> None:
+        "Tire le token suivant de chaque ligne active et retire les lignes finies."
+        ix = sample_next_token(logits, self.g, self.temperature, self.top_k, self.top_p)
+        for row, token in zip(self.rows.tolist(), ix.tolist()):
+            if token != eos_id:
+                self.sentences[row].append(token)
+        self.contexts = torch.cat([self.contexts[:, 1:], ix[:, None]], dim=1)
+        keep = ix != eos_id
+        self.rows, self.contexts = self.rows[keep], self.contexts[keep]
+        self.step += 1
+
+
+class GenerationServer:
+    """
+    Serveur de génération local : les requêtes en cours sont regroupées et
+    avancent d'un token à chaque passe avant commune (batching dynamique).
+
+    Quand aucune requête n'est active, la première arrivée attend window
+    secondes que d'autres la rejoignent ; les suivantes rejoignent le batch au
+    pas suivant, tant qu'il compte moins de max_batch lignes. Le modèle est
+    appelé depuis un unique thread, hors de la boucle asyncio.
+
+    Pour un modèle entraîné sur un vocabulaire compact, vocabulary retraduit les
+    ids générés en ids du tokenizer.
+    """
+
+    def __init__(
+        self,
+        nn: BengioFFN,
+        tokenizer: tokenizers.Tokenizer,
+        window: float = 0.005,
+        max_batch: int = 256,
+        max_length: int = 100,
+        vocabulary: Vocabulary | None = None,
+    ):
+        self.nn = nn
+        self.tokenizer = tokenizer
+        self.vocabulary = vocabulary
+        self.pad_id = tokenizer.token_to_id("[PAD]")
+        self.eos_id = tokenizer.token_to_id("[EOS]")
+        if vocabulary is not None:
+            self.pad_id = vocabulary.compact_id(self.pad_id)
+            self.eos_id = vocabulary.compact_id(self.eos_id)
+        self.window = window
+        self.max_batch = max_batch
+        self.max_length = max_length
+        self.queue: asyncio.Queue[GenerationRequest] = asyncio.Queue()
+        self.active: list[GenerationRequest] = []
+        self.latencies = collections.deque(maxlen=10000)  # secondes
+        self.nb_requests = 0
+        self.nb_batches = 0
+        self.nb_rows = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def generate(self, params: dict) -> dict:
+        """
+        Génère les phrases demandées par params (voir GenerationRequest). Les
+        paramètres invalides lèvent ValueError avant que la requête ne rejoigne le
+        batch commun.
+        """
+        n = int(params.get("n", 1))
+        temperature = float(params.get("temperature", 1.0))
+        top_k, top_p = params.get("top_k"), params.get("top_p")
+        top_k = None if top_k is None else int(top_k)
+        top_p = None if top_p is None else float(top_p)
+        if n < 0:
+            raise ValueError("n must be >= 0")
+        if not (math.isfinite(temperature) and temperature >= 0):
+            raise ValueError("temperature must be finite and >= 0")
+        if top_k is not None and top_k < 1:
+            raise ValueError("top_k must be >= 1")
+        if top_p is not None and not 0 < top_p <= 1:
+            raise ValueError("top_p must be in (0, 1]")
+        request = GenerationRequest(
+            n,
+            self.nn.context_size,
+            self.pad_id,
+            int(params.get("seed", 0)),
+            temperature,
+            top_k,
+            top_p,
+            min(int(params.get("max_length", self.max_length)), self.max_length),
+            asyncio.get_running_loop().create_future(),
+        )
+        await self.queue.put(request)
+        sentences = await request.future
+        if self.vocabulary is not None:
+            sentences = [self.vocabulary.decode(ids) for ids in sentences]
+        latency = time.perf_counter() - request.start
+        self.latencies.append(latency)
+        self.nb_requests += 1
+        return {
+            "sentences": [
+                self.tokenizer.decode(ids, skip_special_tokens=True) for ids in sentences
+            ],
+            "ids": sentences,
+            "latency_ms": latency * 1000,
+        }
+
+    def _step(self, requests: list[GenerationRequest]) -> None:
+        contexts = torch.cat([request.contexts for request in requests])
+        logits = self.nn._eval_logits(contexts)
+        start = 0
+        for request in requests:
+            stop = start + request.rows.numel()
+            try:
+                request.advance(logits[start:stop], self.eos_id)
+            except Exception as e:  # n'échoue que cette requête
+                request.error = e
+            start = stop
+        self.nb_batches += 1
+        self.nb_rows += contexts.shape[0]
+
+    def _admit(self) -> None:
+        rows = sum(request.rows.numel() for request in self.active)
+        while not self.queue.empty() and rows < self.max_batch:
+            request = self.queue.get_nowait()
+            self.active.append(request)
+            rows += request.rows.numel()
+
+    async def schedule(self) -> None:
+        "Boucle de batching : une passe avant pour toutes les requêtes actives."
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.active:
+                self.active.append(await self.queue.get())
+                await asyncio.sleep(self.window)
+            self._admit()
+            requests = [r for r in self.active if not r.done]
+            try:
+                if requests:
+                    await loop.run_in_executor(self.executor, self._step, requests)
+            except Exception as e:
+                for request in requests:
+                    request.future.set_exception(e)
+                self.active = [r for r in self.active if r not in requests]
+                continue
+            for request in self.active:
+                if request.done and not request.future.done():
+                    if request.error is not None:
+                        request.future.set_exception(request.error)
+                    else:
+                        request.future.set_result(request.sentences)
+            self.active = [r for r in self.active if not r.done]
+
+    def stats(self) -> dict:
+        "Profondeur de file, latences p50/p99 (ms) et taille moyenne des batchs."
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        return {
+            "queue_depth": self.queue.qsize(),
+            "active": len(self.active),
+            "requests": self.nb_requests,
+            "batches": self.nb_batches,
+            "mean_batch_rows": self.nb_rows / self.nb_batches if self.nb_batches else 0,
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99),
+        }
+
+    async def handle(self, reader, writer) -> None:
+        "Une requête HTTP/1.1 par connexion : POST /generate et GET /stats."
+        try:
+            status, body = await self._route(reader)
+        except (ValueError, KeyError, TypeError) as e:
+            status, body = 400, {"error": str(e)}
+        except Exception as e:
+            status, body = 500, {"error": str(e)}
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n".encode()
+            + payload
+        )
+        await writer.drain()
+        writer.close()
+
+    async def _route(self, reader) -> tuple[int, dict]:
+        method, path, _ = (await reader.readline()).decode().split(" ", 2)
+        length = 0
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode().partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        if path == "/stats":
+            return 200, self.stats()
+        if path != "/generate":
+            return 404, {"error": f"unknown path {path}"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+        params = json.loads(await reader.readexactly(length)) if length else {}
+        return 200, await self.generate(params)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8000, unix=None):
+        "Sert sur host:port, ou sur la socket Unix unix si elle est donnée."
+        scheduler = asyncio.create_task(self.schedule())
+        if unix is not None:
+            server = await asyncio.start_unix_server(self.handle, unix)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            scheduler.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serveur local de génération à partir d'un checkpoint."
+    )
+    parser.add_argument("checkpoint")
+    parser.add_argument("--tokenizer", default=None, help="par défaut celui du checkpoint")
+    parser.add_argument("--host", default="127.0.0.1", choices=LOCAL_HOSTS)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix", default=None, help="socket Unix au lieu de TCP")
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-length", type=int, default=100)
+    parser.add_argument(
+        "--tables-budget", default=256, help="Mo alloués aux tables d'inférence"
+    )
+    args = parser.parse_args()
+
+    nn, meta = load_model(args.checkpoint, mmap=True)
+    tokenizer_path = args.tokenizer or meta.get(
+        "tokenizer_path", "models/civil_tokenizer.json"
+    )
+    tokenizer = tokenizers.Tokenizer.from_file(tokenizer_path)
+    nn.enable_tables(int(args.tables_budget) * 2**20)
+    vocabulary = None
+    if "vocabulary" in meta:
+        vocabulary = Vocabulary.from_state_dict(meta["vocabulary"])
+    server = GenerationServer(
+        nn,
+        tokenizer,
+        args.window_ms / 1000,
+        args.max_batch,
+        args.max_length,
+        vocabulary,
+    )
+    where = args.unix or f"http://{args.host}:{args.port}"
+    print(f"Serving {args.checkpoint} on {where}")
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
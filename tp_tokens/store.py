@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import torch
+
+STORE_VERSION = 1
+
+
+def smallest_int_dtype(nb_tokens: int) -> torch.dtype:
+    """Plus petit type entier signé capable de représenter les ids 0..nb_tokens-1."""
+    for dtype in (torch.int8, torch.int16, torch.int32):
+        if nb_tokens - 1 <= torch.iinfo(dtype).max:
+            return dtype
+    return torch.int64
+
+
+def numpy_dtype(dtype: torch.dtype) -> np.dtype:
+    return torch.empty(0, dtype=dtype).numpy().dtype
+
+
+def store_key(data_path: str, tokenizer_path: str, seed: int) -> str:
+    """Empreinte du fichier de données, du tokenizer et de la graine de mélange."""
+    h = hashlib.sha256()
+    h.update(f"v{STORE_VERSION}:seed={seed}:".encode())
+    for path in (data_path, tokenizer_path):
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                h.update(chunk)
+        h.update(b"\0")
+    return h.hexdigest()[:32]
+
+
+def _atomic_tofile(array: np.ndarray, path: str) -> None:
+    tmp = f"{path}.tmp{os.getpid()}"
+    np.ascontiguousarray(array).tofile(tmp)
+    os.replace(tmp, path)
+
+
+def _atomic_json(obj: dict, path: str) -> None:
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+class TokenStore:
+    """
+    Phrases tokenisées stockées à plat : ids de toutes les phrases concaténés et
+    offsets de début de chaque phrase (nb_sentences + 1 valeurs).
+
+    Se comporte comme une liste de listes d'ids (len, indexation, tranches), ce qui
+    permet de l'utiliser à la place de Sentences.token_ids_sentences. Les tranches
+    sont des vues, sans copie des ids.
+    """
+
+    def __init__(self, ids: np.ndarray, offsets: np.ndarray) -> None:
+        self.ids = ids
+        self.offsets = offsets
+
+    @classmethod
+    def from_lists(cls, sentences: list[list[int]], dtype: torch.dtype) -> "TokenStore":
+        lengths = np.fromiter(map(len, sentences), dtype=np.int64, count=len(sentences))
+        offsets = np.zeros(len(sentences) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        ids = np.empty(int(offsets[-1]), dtype=numpy_dtype(dtype))
+        for sentence, start, stop in zip(sentences, offsets[:-1], offsets[1:]):
+            ids[start:stop] = sentence
+        return cls(ids, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("TokenStore only supports contiguous slices.")
+            return TokenStore(self.ids, self.offsets[start : max(start, stop) + 1])
+        if index < 0:
+            index += len(self)
+        return self.ids[self.offsets[index] : self.offsets[index + 1]].tolist()
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def flat_ids(self) -> np.ndarray:
+        """Ids des phrases de la vue, concaténés (vue sur le tableau sous-jacent)."""
+        return self.ids[self.offsets[0] : self.offsets[-1]]
+
+    def save(self, cache_dir: str, key: str, **meta) -> None:
+        """Écrit les ids et les offsets, puis les métadonnées qui valident l'entrée."""
+        os.makedirs(cache_dir, exist_ok=True)
+        prefix = os.path.join(cache_dir, key)
+        _atomic_tofile(self.flat_ids(), prefix + ".ids.bin")
+        _atomic_tofile(self.offsets - self.offsets[0], prefix + ".offsets.bin")
+        meta = dict(
+            meta,
+            version=STORE_VERSION,
+            dtype=str(self.ids.dtype),
+            nb_sentences=len(self),
+            nb_ids=int(self.offsets[-1] - self.offsets[0]),
+        )
+        _atomic_json(meta, prefix + ".json")
+
+    @classmethod
+    def open(cls, cache_dir: str, key: str) -> "TokenStore | None":
+        """Ouvre une entrée du cache en mémoire partagée (memmap), None si absente."""
+        prefix = os.path.join(cache_dir, key)
+        try:
+            with open(prefix + ".json") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        if meta.get("version") != STORE_VERSION:
+            return None
+        # mode "c" : copie à l'écriture, les pages restent partagées entre processus
+        ids = np.memmap(
+            prefix + ".ids.bin", dtype=meta["dtype"], mode="c", shape=(meta["nb_ids"],)
+        ) if meta["nb_ids"] else np.empty(0, dtype=meta["dtype"])
+        offsets = np.memmap(
+            prefix + ".offsets.bin",
+            dtype=np.int64,
+            mode="c",
+            shape=(meta["nb_sentences"] + 1,),
+        )
+        return cls(ids, offsets)
+
+
+def save_windows(cache_dir: str, name: str, X: torch.Tensor, Y: torch.Tensor) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    prefix = os.path.join(cache_dir, name)
+    _atomic_tofile(Y.numpy(), prefix + ".Y.bin")
+    _atomic_tofile(X.numpy(), prefix + ".X.bin")
+    _atomic_json(
+        {"version": STORE_VERSION, "dtype": str(X.dtype), "shape": list(X.shape)},
+        prefix + ".json",
+    )
+
+
+def open_windows(cache_dir: str, name: str) -> tuple[torch.Tensor, torch.Tensor] | None:
+    """Ouvre les fenêtres (X, Y) d'un Datasets avec torch.from_file, None si absentes."""
+    prefix = os.path.join(cache_dir, name)
+    try:
+        with open(prefix + ".json") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta.get("version") != STORE_VERSION:
+        return None
+    dtype = getattr(torch, meta["dtype"].removeprefix("torch."))
+    n, context_size = meta["shape"]
+    if n == 0:
+        return torch.empty((0, context_size), dtype=dtype), torch.empty(0, dtype=dtype)
+    X = torch.from_file(
+        prefix + ".X.bin", shared=False, size=n * context_size, dtype=dtype
+    ).view(n, context_size)
+    Y = torch.from_file(prefix + ".Y.bin", shared=False, size=n, dtype=dtype)
+    return X, Y
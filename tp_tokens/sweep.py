@@ -0,0 +1,252 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import random
+import statistics
+import sys
+import time
+
+import torch
+
+from .datasets import Datasets
+from .ffn import BengioFFN
+from .optim import make_optimizer, make_schedule
+from .sentences import Sentences
+
+# valeurs utilisées pour les clés absentes de l'espace de recherche
+DEFAULTS = {
+    "context": 5,
+    "e_dims": 128,
+    "hidden": 256,
+    "init": "kaiming",
+    "activation": "tanh",
+    "batchnorm": True,
+    "optimizer": "sgd",
+    "schedule": "step",
+    "lr": 0.2,
+    "batch": 128,
+}
+COLUMNS = ["trial", "status", "dev_loss", "steps", "seconds", "steps_per_sec"]
+
+
+def _sample(values, rng: random.Random):
+    "Tire une valeur : liste de choix ou intervalle {min, max, log}."
+    if isinstance(values, list):
+        return rng.choice(values)
+    low, high = values["min"], values["max"]
+    if values.get("log", False):
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        value = rng.uniform(low, high)
+    return round(value) if isinstance(low, int) and isinstance(high, int) else value
+
+
+def expand(spec: dict, seed: int = 42) -> list[dict]:
+    """
+    Configurations d'un balayage.
+
+    spec["space"] associe à chaque hyperparamètre (clés de DEFAULTS) une liste de
+    valeurs ou, en recherche aléatoire, un intervalle {"min", "max", "log"}.
+    spec["method"] vaut "grid" (produit cartésien) ou "random" (spec["trials"]
+    tirages avec la graine seed).
+    """
+    space = spec.get("space", {})
+    unknown = set(space) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown hyperparameters: {sorted(unknown)}.")
+    method = spec.get("method", "grid")
+    if method == "grid":
+        if not all(isinstance(values, list) for values in space.values()):
+            raise ValueError("Grid search requires a list of values per parameter.")
+        names = list(space)
+        combinations = itertools.product(*(space[name] for name in names))
+        return [{**DEFAULTS, **dict(zip(names, values))} for values in combinations]
+    if method == "random":
+        rng = random.Random(seed)
+        return [
+            {**DEFAULTS, **{name: _sample(values, rng) for name, values in space.items()}}
+            for _ in range(spec["trials"])
+        ]
+    raise ValueError(f"Unknown search method {method!r}.")
+
+
+def should_stop(loss: float, others: list[float], min_trials: int = 3) -> bool:
+    """
+    Règle de la médiane : un essai est arrêté si sa perte de dev est moins bonne
+    que la médiane des autres essais au même point d'évaluation, dès que
+    min_trials essais au moins y ont été évalués.
+    """
+    if not math.isfinite(loss):
+        return True
+    if len(others) < min_trials:
+        return False
+    return loss > statistics.median(others)
+
+
+# état des processus du pool (voir _init_worker)
+_worker_state = {}
+
+
+def _init_worker(datasets: dict, reports, settings: dict) -> None:
+    torch.set_num_threads(settings["threads"])
+    _worker_state.update(datasets=datasets, reports=reports, settings=settings)
+
+
+def run_trial(trial: int, config: dict) -> dict:
+    "Entraîne un essai par tranches de eval_every pas, arrêté tôt s'il est distancé."
+    datasets = _worker_state["datasets"][config["context"]]
+    reports = _worker_state["reports"]
+    settings = _worker_state["settings"]
+    eval_samples = settings["eval_samples"] or None
+    Xdev, Ydev = datasets.Xdev[:eval_samples], datasets.Ydev[:eval_samples]
+
+    g = torch.Generator().manual_seed(settings["seed"])
+    nn = BengioFFN(
+        config["e_dims"],
+        config["hidden"],
+        config["context"],
+        datasets.nb_tokens,
+        g,
+        init=config["init"],
+        activation=config["activation"],
+        batchnorm=config["batchnorm"],
+    )
+    optimizer = make_optimizer(config["optimizer"], nn.parameters)
+    schedule = make_schedule(config["schedule"], config["lr"], settings["steps"])
+
+    status, dev_loss = "completed", float("nan")
+    t0 = time.perf_counter()
+    for evaluation in itertools.count():
+        if nn.steps >= settings["steps"]:
+            break
+        nb_steps = min(settings["eval_every"], settings["steps"] - nn.steps)
+        nn.train(
+            datasets,
+            nb_steps,
+            config["batch"],
+            optimizer=optimizer,
+            schedule=schedule,
+            log_every=None,
+        )
+        dev_loss = nn.compute_loss(Xdev, Ydev)
+        if not math.isfinite(dev_loss):
+            status = "diverged"
+            break
+        others = [loss for (_, e, loss) in list(reports) if e == evaluation]
+        reports.append((trial, evaluation, dev_loss))
+        if nn.steps < settings["steps"] and evaluation >= settings["grace"]:
+            if should_stop(dev_loss, others, settings["min_trials"]):
+                status = "stopped"
+                break
+    seconds = time.perf_counter() - t0
+    return {
+        "trial": trial,
+        "status": status,
+        "dev_loss": dev_loss,
+        "steps": nn.steps,
+        "seconds": seconds,
+        "steps_per_sec": nn.steps / seconds if seconds > 0 else 0.0,
+        **config,
+    }
+
+
+def _run_trial(args: tuple[int, dict]) -> dict:
+    return run_trial(*args)
+
+
+def run_sweep(
+    spec: dict,
+    datafile: str,
+    tokenizer_path: str,
+    cache_dir: str,
+    workers: int = 1,
+    seed: int = 42,
+) -> list[dict]:
+    """
+    Exécute les essais de spec sur un pool de workers processus et renvoie leurs
+    résultats, triés par perte de dev croissante.
+
+    Le corpus est tokenisé une seule fois et les fenêtres de chaque taille de
+    contexte sont mises en cache dans cache_dir : les processus du pool les
+    ouvrent en memmap au lieu d'en recevoir une copie.
+    """
+    configs = expand(spec, seed)
+    sentences = Sentences(datafile, tokenizer_path, seed, cache_dir, streaming=True)
+    datasets = {
+        context_size: Datasets(sentences, context_size, cache_dir=cache_dir)
+        for context_size in sorted({config["context"] for config in configs})
+    }
+    settings = {
+        "seed": seed,
+        "steps": spec.get("steps", 10000),
+        "eval_every": spec.get("eval_every", 1000),
+        "eval_samples": spec.get("eval_samples", 20000),
+        "grace": spec.get("grace", 1),
+        "min_trials": spec.get("min_trials", 3),
+        # les threads intra-op sont partagés entre les processus
+        "threads": max(1, torch.get_num_threads() // workers),
+    }
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with context.Manager() as manager:
+        reports = manager.list()
+        with context.Pool(
+            workers, _init_worker, (datasets, reports, settings)
+        ) as pool:
+            for result in pool.imap_unordered(_run_trial, enumerate(configs)):
+                print(
+                    f"trial {result['trial']:4d} {result['status']:9s}"
+                    f" dev_loss={result['dev_loss']:.4f} steps={result['steps']}"
+                )
+                results.append(result)
+    return sorted(
+        results,
+        key=lambda r: r["dev_loss"] if math.isfinite(r["dev_loss"]) else math.inf,
+    )
+
+
+def write_results(results: list[dict], path: str) -> None:
+    "Écrit le tableau des résultats au format CSV."
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, COLUMNS + list(DEFAULTS))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Balayage d'hyperparamètres de BengioFFN en parallèle."
+    )
+    parser.add_argument("spec", help="fichier JSON décrivant le balayage")
+    parser.add_argument("--datafile", default="data/light_civil_sentences.txt")
+    parser.add_argument("--tokenizer", default="models/civil_tokenizer.json")
+    parser.add_argument("--cache", default="models/cache", help="dossier du cache")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", default="sweep_results.csv")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    results = run_sweep(
+        spec, args.datafile, args.tokenizer, args.cache, args.workers, args.seed
+    )
+    write_results(results, args.output)
+    # tableau final : seules les colonnes qui varient entre essais
+    names = [name for name in DEFAULTS if len({r[name] for r in results}) > 1]
+    print(f"{'trial':>5s} {'status':9s} {'dev_loss':>8s} {'steps':>7s}", *names)
+    for r in results:
+        values = [f"{r[n]:.4g}" if isinstance(r[n], float) else r[n] for n in names]
+        print(
+            f"{r['trial']:5d} {r['status']:9s} {r['dev_loss']:8.4f} {r['steps']:7d}",
+            *values,
+        )
+    print(f"Results saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
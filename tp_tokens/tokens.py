@@ -1,16 +1,21 @@
-from typing import Optional
+import argparse
+import os
+from typing import Iterable, Iterator, Optional
 
+import numpy as np
 from tokenizers import Tokenizer, decoders, normalizers, pre_tokenizers
 from tokenizers.models import BPE
 from tokenizers.normalizers import Lowercase, StripAccents
 from tokenizers.trainers import BpeTrainer
 
+from .clean import iter_corpus
+from .datasets import split_bounds
+from .sentences import shuffled_order
 
-def main(
-    vocab_size: int = 30000,
-    filepath: str = "data/civil_sentences.txt",
-    savepath: Optional[str] = "models/civil_tokenizer.json",
-):
+SPLITS = ("train", "dev", "test")
+
+
+def new_tokenizer() -> Tokenizer:
     tokenizer = Tokenizer(BPE(unk_token="[UNK]"))
 
     tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)  # type: ignore
@@ -18,17 +23,125 @@ def main(
     # 3. Le décodeur qui fera l'inverse (recoller les morceaux proprement)
     tokenizer.decoder = decoders.ByteLevel()  # type: ignore
     tokenizer.normalizer = normalizers.Sequence([Lowercase(), StripAccents()])  # type: ignore
+    return tokenizer
+
+
+def split_of_sentences(nb_sentences: int, seed: int = 42) -> np.ndarray:
+    """
+    Split (indice dans SPLITS) de chaque phrase, dans l'ordre du fichier : même
+    mélange que Sentences et mêmes proportions 80/10/10 que Datasets.
+    """
+    n1, n2 = split_bounds(nb_sentences)
+    order = np.array(shuffled_order(nb_sentences, seed), dtype=np.int64)
+    split = np.empty(nb_sentences, dtype=np.int8)
+    split[order[:n1]] = 0
+    split[order[n1:n2]] = 1
+    split[order[n2:]] = 2
+    return split
+
+
+def split_path(filepath: str, split: str) -> str:
+    "data/civil_sentences.txt -> data/civil_sentences.train.txt"
+    root, ext = os.path.splitext(filepath)
+    return f"{root}.{split}{ext}"
+
+
+def _read_lines(filepath: str) -> Iterator[str]:
+    # mêmes lignes que read().splitlines(), utilisé par Sentences
+    with open(filepath, "r", encoding="utf-8") as f:
+        for line in f:
+            yield from line.splitlines() or [""]
+
+
+def _write_sentences(sentences: Iterable[str], filepath: str) -> int:
+    """
+    Écrit une phrase par ligne et renvoie le nombre de lignes. Une phrase qui
+    contient un séparateur de lignes (ex: \\u2028) compte pour plusieurs lignes,
+    comme à la relecture par Sentences.
+    """
+    nb_lines = 0
+    with open(filepath, "w", encoding="utf-8") as f:
+        for sentence in sentences:
+            for line in sentence.splitlines() or [""]:
+                f.write(line + "\n")
+                nb_lines += 1
+    return nb_lines
+
 
+def _train_split(filepath: str, nb_sentences: int, seed: int) -> Iterator[str]:
+    """
+    Parcourt filepath une fois : écrit chaque phrase dans le fichier de son split
+    et renvoie celles du train.
+    """
+    split = split_of_sentences(nb_sentences, seed)
+    files = [open(split_path(filepath, name), "w", encoding="utf-8") for name in SPLITS]
+    try:
+        for i, line in enumerate(_read_lines(filepath)):
+            files[split[i]].write(line + "\n")
+            if split[i] == 0:
+                yield line
+    finally:
+        for f in files:
+            f.close()
+
+
+def main(
+    vocab_size: int = 30000,
+    filepath: str = "data/civil_sentences.txt",
+    savepath: Optional[str] = "models/civil_tokenizer.json",
+    corpus: Optional[str] = None,
+    seed: int = 42,
+    workers: Optional[int] = None,
+):
+    """
+    Entraîne le tokenizer BPE sur le split train des phrases de filepath, avec le
+    même mélange (seed) et les mêmes proportions que Sentences/Datasets : les
+    phrases de validation et de test ne sont jamais vues. Les trois splits sont
+    écrits à côté de filepath (voir split_path) pendant l'entraînement.
+
+    Si corpus est fourni (dossier ou archive codes.zip), filepath est d'abord
+    produit en nettoyant le corpus à la volée (voir clean.iter_corpus).
+    """
+    if corpus is not None:
+        sentences = (s for name, batch in iter_corpus(corpus, workers) for s in batch)
+        nb_sentences = _write_sentences(sentences, filepath)
+        print(f"{nb_sentences} sentences saved to {filepath}")
+    else:
+        nb_sentences = sum(1 for _ in _read_lines(filepath))
+
+    tokenizer = new_tokenizer()
     trainer = BpeTrainer(
         vocab_size=vocab_size, special_tokens=["[PAD]", "[UNK]", "[EOS]"]
     )
-
-    # TODO: make train test split files
-    files = [filepath]
-    tokenizer.train(files, trainer)
+    tokenizer.train_from_iterator(
+        _train_split(filepath, nb_sentences, seed),
+        trainer,
+        length=split_bounds(nb_sentences)[0],
+    )
+    print(f"Splits saved to {', '.join(split_path(filepath, s) for s in SPLITS)}")
     if savepath is not None:
         tokenizer.save(savepath)
         print(f"Tokenizer saved to {savepath}")
+    return tokenizer
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        description="Entraîne le tokenizer BPE sur le split train du corpus."
+    )
+    parser.add_argument("--vocab-size", type=int, default=30000)
+    parser.add_argument("--datafile", default="data/civil_sentences.txt")
+    parser.add_argument("--output", default="models/civil_tokenizer.json")
+    parser.add_argument(
+        "--corpus", default=None, help="dossier ou archive zip à nettoyer à la volée"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    main(
+        args.vocab_size, args.datafile, args.output, args.corpus, args.seed, args.workers
+    )
+    return 0
 
 
 if __name__ == "__main__":
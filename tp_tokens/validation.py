@@ -0,0 +1,124 @@
+import queue
+import threading
+
+import torch
+
+from .evaluation import evaluate
+
+
+class PeriodicValidation:
+    """
+    Validation périodique de BengioFFN.train sur le split dev, en arrière-plan.
+
+    Tous les every pas, les poids et les statistiques BatchNorm courantes sont
+    copiés (le coût, côté boucle d'entraînement, est celui d'une copie mémoire)
+    puis évalués par un thread dédié pendant que l'entraînement continue. Les
+    copies en attente sont évaluées dans l'ordre : every doit rester grand devant
+    la durée d'une évaluation.
+
+    Les poids de la meilleure perte de dev sont conservés en mémoire. Avec
+    patience, l'entraînement s'arrête quand patience évaluations consécutives
+    n'ont pas amélioré la meilleure perte d'au moins min_delta (l'arrêt a lieu
+    au pas qui suit la fin de l'évaluation, pas au pas évalué). En fin
+    d'entraînement, si restore_best, les meilleurs poids sont recopiés dans le
+    réseau (restored vaut alors True) ; curve contient les couples (pas, perte
+    de dev).
+    """
+
+    def __init__(
+        self,
+        datasets,
+        every: int = 1000,
+        patience: int | None = None,
+        min_delta: float = 0.0,
+        batch_size: int = 1024,
+        restore_best: bool = True,
+    ) -> None:
+        self.datasets = datasets
+        self.every = every
+        self.patience = patience
+        self.min_delta = min_delta
+        self.batch_size = batch_size
+        self.restore_best = restore_best
+        self.thread = None
+        self.restored = False
+
+    def start(self, nn) -> None:
+        self.curve: list[tuple[int, float]] = []
+        self.best_loss = float("inf")
+        self.best_step = None
+        self.best_state = None
+        self.nb_bad = 0  # évaluations sans amélioration depuis la meilleure
+        self.stopped = threading.Event()
+        self.error = None
+        self.last_step = None  # dernier pas soumis
+        self.restored = False
+        self.snapshots: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while (state := self.snapshots.get()) is not None:
+            try:
+                self._evaluate(state)
+            except BaseException as e:  # transmis au thread principal
+                self.error = e
+                self.stopped.set()
+                return
+
+    def _evaluate(self, state: dict) -> None:
+        nn = self.model_class.from_state_dict(state)
+        loss = evaluate(nn, self.datasets, ("dev",), self.batch_size)["dev"]["loss"]
+        step = state["config"]["steps"]
+        self.curve.append((step, loss))
+        if loss < self.best_loss - self.min_delta:
+            self.best_loss, self.best_step, self.best_state = loss, step, state
+            self.nb_bad = 0
+        else:
+            if loss < self.best_loss:
+                self.best_loss, self.best_step, self.best_state = loss, step, state
+            self.nb_bad += 1
+            if self.patience is not None and self.nb_bad >= self.patience:
+                self.stopped.set()
+
+    @torch.no_grad()
+    def _submit(self, nn) -> None:
+        state = nn.state_dict()
+        for name in nn.state_names:
+            state[name] = state[name].clone()
+        self.model_class = type(nn)
+        self.last_step = nn.steps
+        self.snapshots.put(state)
+
+    def step(self, nn) -> bool:
+        "Fin d'un pas d'entraînement ; renvoie True si l'entraînement doit s'arrêter."
+        if nn.steps % self.every == 0:
+            self._submit(nn)
+        if self.error is not None:
+            raise self.error
+        return self.stopped.is_set()
+
+    @torch.no_grad()
+    def close(self, nn) -> bool:
+        """
+        Évalue les poids finaux s'ils ne l'ont pas été, attend les évaluations en
+        cours et restaure les meilleurs poids. Renvoie True si les poids du réseau
+        ont été remplacés.
+        """
+        if not self.stopped.is_set() and self.last_step != nn.steps:
+            self._submit(nn)
+        self.snapshots.put(None)
+        self.thread.join()
+        self.thread = None
+        if self.error is not None:
+            raise self.error
+        if not self.restore_best or self.best_state is None:
+            return False
+        if self.best_step == nn.steps:
+            return False
+        # copie en place : l'optimiseur garde ses références aux paramètres
+        for name in nn.state_names:
+            getattr(nn, name).copy_(self.best_state[name])
+        nn.tables = None
+        self.restored = True
+        return True
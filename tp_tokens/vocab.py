@@ -0,0 +1,100 @@
+import hashlib
+from itertools import chain
+
+import numpy as np
+import torch
+
+from .store import TokenStore, numpy_dtype, smallest_int_dtype
+
+SPECIAL_TOKENS = ("[PAD]", "[UNK]", "[EOS]")
+
+
+class Vocabulary:
+    """
+    Vocabulaire compact : sous-ensemble des ids du tokenizer, renumérotés de 0 à
+    nb_tokens - 1 dans l'ordre des ids du tokenizer.
+
+    id_map[i] est l'id tokenizer du token compact i ; encode fait la conversion
+    inverse, les ids hors du vocabulaire étant envoyés sur [UNK]. Le réseau est
+    dimensionné (C, W2, b2) et entraîné dans l'espace compact ; les ids générés
+    sont retraduits par decode avant tokenizer.decode.
+    """
+
+    def __init__(self, id_map: torch.Tensor, nb_tokenizer_tokens: int, unk_id: int):
+        self.id_map = id_map.long()
+        self.nb_tokens = self.id_map.numel()
+        self.nb_tokenizer_tokens = nb_tokenizer_tokens
+        self.unk_id = unk_id
+        compact = torch.arange(self.nb_tokens)
+        unk = compact[self.id_map == unk_id]
+        if unk.numel() != 1:
+            raise ValueError("The vocabulary must contain [UNK].")
+        self.to_compact = torch.full((nb_tokenizer_tokens,), int(unk))
+        self.to_compact[self.id_map] = compact
+
+    @classmethod
+    def from_sentences(
+        cls, sentences, min_count: int = 1, nb_sentences: int | None = None
+    ) -> "Vocabulary":
+        """
+        Tokens vus au moins min_count fois dans les nb_sentences premières phrases
+        de sentences.token_ids_sentences (toutes par défaut ; le split train avec
+        split_bounds(...)[0]), plus les tokens spéciaux.
+        """
+        token_ids = sentences.token_ids_sentences[:nb_sentences]
+        if isinstance(token_ids, TokenStore):
+            ids = token_ids.flat_ids().astype(np.int64)
+        else:
+            ids = np.fromiter(chain.from_iterable(token_ids), dtype=np.int64)
+        counts = np.bincount(ids, minlength=sentences.nb_tokens)
+        keep = counts >= max(min_count, 1)
+        for token in SPECIAL_TOKENS:
+            keep[sentences.token_to_id(token)] = True
+        return cls(
+            torch.from_numpy(np.flatnonzero(keep)),
+            sentences.nb_tokens,
+            sentences.token_to_id("[UNK]"),
+        )
+
+    @classmethod
+    def from_state_dict(cls, state: dict) -> "Vocabulary":
+        return cls(state["id_map"], state["nb_tokenizer_tokens"], state["unk_id"])
+
+    def state_dict(self) -> dict:
+        "Pour les métadonnées d'un checkpoint (tenseurs et types simples)."
+        return {
+            "id_map": self.id_map.clone(),
+            "nb_tokenizer_tokens": self.nb_tokenizer_tokens,
+            "unk_id": self.unk_id,
+        }
+
+    def __len__(self) -> int:
+        return self.nb_tokens
+
+    def key(self) -> str:
+        "Empreinte de id_map, pour nommer les fichiers de cache."
+        return hashlib.sha256(self.id_map.numpy().tobytes()).hexdigest()[:16]
+
+    def compact_id(self, token_id: int) -> int:
+        return int(self.to_compact[token_id])
+
+    def encode(self, ids: torch.Tensor) -> torch.Tensor:
+        "Ids tokenizer -> ids compacts (int64)."
+        return self.to_compact[ids.long()]
+
+    def decode(self, ids: list[int]) -> list[int]:
+        "Ids compacts -> ids tokenizer."
+        return self.id_map[torch.as_tensor(ids, dtype=torch.long)].tolist()
+
+    def encode_sentences(self, sentences: list[list[int]] | TokenStore) -> TokenStore:
+        "Phrases en ids compacts, stockées dans le plus petit type entier possible."
+        if not isinstance(sentences, TokenStore):
+            sentences = TokenStore.from_lists(sentences, torch.int64)
+        ids = self.to_compact.numpy()[sentences.flat_ids().astype(np.int64)]
+        return TokenStore(
+            ids.astype(numpy_dtype(smallest_int_dtype(self.nb_tokens))),
+            sentences.offsets - sentences.offsets[0],
+        )
+
+    def __repr__(self) -> str:
+        return f"<Vocabulary nb_tokens={self.nb_tokens}/{self.nb_tokenizer_tokens}>"